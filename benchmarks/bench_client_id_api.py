@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Test de charge et de non-régression de l'API client-id (client_id_api.py)
+
+L'API est lancée (uvicorn, processus séparé) sur une base PostgreSQL jetable
+(erpbtp_bench_api_<pid>) créée sur le serveur de database_config (variables
+DB_*), migrée puis supprimée. Chaque mélange de requêtes est exécuté pendant une durée donnée
+avec un nombre fixe de requêtes simultanées :
+
+    hit     95 % de noms existants (cache et recherche), 5 % de nouveaux clients
+    create  uniquement des nouveaux clients (upsert avec insertion)
+    race    rafales de requêtes simultanées pour un même nouveau nom
+            (vérifie qu'un seul client est créé et que tous reçoivent son id)
+
+Pour chaque mélange : requêtes/s, percentiles et histogramme des latences,
+connexions à la base (pg_stat_activity échantillonné) et état du pool de l'API.
+Les résultats sont enregistrés en JSON ; --compare signale les régressions
+par rapport à un fichier de référence (code de sortie 1).
+
+Usage :
+    DB_HOST=127.0.0.1 DB_USER=postgres DB_PASSWORD=... \\
+        python benchmarks/bench_client_id_api.py [--mix hit,create,race] [-d 10] [-c 32] \\
+            [--output resultats.json] [--compare reference.json] [--threshold 0.15]
+
+Sans serveur partagé, un PostgreSQL local jetable suffit :
+    docker run --rm -d --name erpbtp-bench -p 5432:5432 -e POSTGRES_PASSWORD=bench postgres:15-alpine
+    DB_HOST=127.0.0.1 DB_PORT=5432 DB_USER=postgres DB_PASSWORD=bench python benchmarks/bench_client_id_api.py
+    docker stop erpbtp-bench
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+import psycopg  # noqa: E402
+from database_config import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER  # noqa: E402
+from latency import histogram, print_histogram, summarize  # noqa: E402
+
+MIXES = ['hit', 'create', 'race']
+
+# Serveur PostgreSQL de database_config ; l'API reçoit DB_NAME de la base jetable
+ADMIN_DSN = {'host': DB_HOST, 'port': DB_PORT, 'user': DB_USER, 'password': DB_PASSWORD, 'dbname': DB_NAME}
+
+
+def admin_connection(dbname=None):
+    return psycopg.connect(**{**ADMIN_DSN, 'dbname': dbname or ADMIN_DSN['dbname']},
+                           connect_timeout=5, autocommit=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ConnectionSampler:
+    """Connexions ouvertes sur la base jetable (pg_stat_activity), échantillonnées en continu"""
+
+    def __init__(self, dbname, interval=0.1):
+        self.dbname = dbname
+        self.interval = interval
+        self.samples = []
+
+    async def run(self, stop):
+        async with await psycopg.AsyncConnection.connect(**{**ADMIN_DSN, 'dbname': self.dbname},
+                                                         autocommit=True) as conn:
+            while not stop.is_set():
+                cur = await conn.execute(
+                    "SELECT count(*), count(*) FILTER (WHERE state = 'active') FROM pg_stat_activity "
+                    "WHERE datname = %s AND pid <> pg_backend_pid()",
+                    (self.dbname,),
+                )
+                self.samples.append(await cur.fetchone())
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def summary(self):
+        if not self.samples:
+            return {}
+        totals = [total for total, _ in self.samples]
+        actives = [active for _, active in self.samples]
+        return {
+            'max': max(totals),
+            'avg': round(sum(totals) / len(totals), 2),
+            'active_max': max(actives),
+            'active_avg': round(sum(actives) / len(actives), 2),
+        }
+
+
+class MixRunner:
+    def __init__(self, http, dbname, concurrency, duration, names):
+        self.http = http
+        self.dbname = dbname
+        self.concurrency = concurrency
+        self.duration = duration
+        self.names = names
+        self._sequence = 0
+
+    def new_name(self, mix):
+        self._sequence += 1
+        return f"bench {mix} {os.getpid()} {self._sequence}"
+
+    async def call(self, nom, latencies, statuses):
+        start = time.perf_counter()
+        try:
+            response = await self.http.post('/client-id/', json={'nom': nom})
+            status = response.status_code
+            body = response.json() if status == 200 else None
+        except httpx.HTTPError:
+            status, body = 'erreur', None
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+        return body
+
+    async def run(self, mix):
+        await self.http.delete('/client-id/cache')
+        latencies, statuses = [], {}
+        race = {'bursts': 0, 'duplicate_ids': 0, 'created_count_errors': 0}
+        deadline = time.perf_counter() + self.duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                if mix == 'hit':
+                    nom = random.choice(self.names) if random.random() < 0.95 else self.new_name(mix)
+                    await self.call(nom, latencies, statuses)
+                elif mix == 'create':
+                    await self.call(self.new_name(mix), latencies, statuses)
+
+        async def race_bursts():
+            while time.perf_counter() < deadline:
+                nom = self.new_name(mix)
+                bodies = await asyncio.gather(*(self.call(nom, latencies, statuses)
+                                                for _ in range(self.concurrency)))
+                bodies = [body for body in bodies if body]
+                race['bursts'] += 1
+                if len({body['id'] for body in bodies}) > 1:
+                    race['duplicate_ids'] += 1
+                if sum(body['created'] for body in bodies) != 1:
+                    race['created_count_errors'] += 1
+
+        sampler = ConnectionSampler(self.dbname)
+        stop = asyncio.Event()
+        sampling = asyncio.create_task(sampler.run(stop))
+        start = time.perf_counter()
+        if mix == 'race':
+            await race_bursts()
+        else:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampling
+
+        health = (await self.http.get('/health')).json()
+        result = {
+            'requests': len(latencies),
+            'errors': sum(count for status, count in statuses.items() if status != 200),
+            'statuses': {str(status): count for status, count in statuses.items()},
+            'rps': round(len(latencies) / elapsed, 1),
+            'latency_ms': summarize(latencies),
+            'histogram_ms': histogram(latencies),
+            'db_connections': sampler.summary(),
+            'pool': health['pool'],
+            'cache': health['cache'],
+        }
+        if mix == 'race':
+            result['race'] = race
+        return result
+
+
+def print_result(mix, result):
+    latency = result['latency_ms']
+    print(f"\n=== {mix} : {result['rps']} req/s, {result['requests']} requêtes, {result['errors']} erreur(s)")
+    print(f"  latence ms : p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    connections = result['db_connections']
+    print(f"  connexions base : max {connections.get('max')} (actives max {connections.get('active_max')}), "
+          f"pool API : taille {result['pool']['size']}, attente moyenne {result['pool']['wait_ms_avg']} ms")
+    if 'race' in result:
+        print(f"  courses : {result['race']}")
+    print_histogram(result['histogram_ms'])
+
+
+def compare(results, reference, threshold):
+    """
+    Régressions (débit en baisse ou p95 en hausse de plus de threshold) par rapport
+    à la référence, et courses incorrectes (id différents, nombre de créations != 1)
+    """
+    regressions = []
+    for mix, current in results['mixes'].items():
+        race = current.get('race', {})
+        if race.get('duplicate_ids'):
+            regressions.append(f"{mix} : {race['duplicate_ids']} course(s) avec des id différents")
+        if race.get('created_count_errors'):
+            regressions.append(f"{mix} : {race['created_count_errors']} course(s) sans exactement une création")
+        previous = reference.get('mixes', {}).get(mix)
+        if not previous:
+            continue
+        if current['rps'] < previous['rps'] * (1 - threshold):
+            regressions.append(f"{mix} : débit {previous['rps']} -> {current['rps']} req/s")
+        if current['latency_ms']['p95'] > previous['latency_ms']['p95'] * (1 + threshold):
+            regressions.append(f"{mix} : p95 {previous['latency_ms']['p95']} -> {current['latency_ms']['p95']} ms")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{mix} : erreurs {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+async def wait_for_api(http, process, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"L'API s'est arrêtée (code {process.returncode})")
+        try:
+            if (await http.get('/health')).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("L'API n'a pas démarré")
+
+
+async def run_mixes(args, dbname, process):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=30) as http:
+        await wait_for_api(http, process)
+        # Clients existants pour le mélange hit
+        names = [f"bench existant {os.getpid()} {i}" for i in range(args.names)]
+        response = await http.post('/client-ids/', json=[{'nom': nom} for nom in names])
+        response.raise_for_status()
+
+        runner = MixRunner(http, dbname, args.concurrency, args.duration, names)
+        mixes = {}
+        for mix in args.mix:
+            mixes[mix] = await runner.run(mix)
+            print_result(mix, mixes[mix])
+        return mixes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', default=','.join(MIXES), help="mélanges à exécuter (hit,create,race)")
+    parser.add_argument('-d', '--duration', type=float, default=10, help="durée de chaque mélange (s)")
+    parser.add_argument('-c', '--concurrency', type=int, default=32, help="requêtes simultanées")
+    parser.add_argument('--names', type=int, default=500, help="clients existants pour le mélange hit")
+    parser.add_argument('--pool-max-size', type=int, default=10, help="DB_POOL_MAX_SIZE de l'API")
+    parser.add_argument('--no-cache', action='store_true', help="désactive le cache de l'API")
+    parser.add_argument('--port', type=int, default=8766, help="port d'écoute de l'API pendant le benchmark")
+    parser.add_argument('--output', help="fichier JSON des résultats")
+    parser.add_argument('--compare', help="fichier JSON de référence")
+    parser.add_argument('--threshold', type=float, default=0.15, help="écart toléré par rapport à la référence")
+    args = parser.parse_args()
+    args.mix = [mix.strip() for mix in args.mix.split(',') if mix.strip()]
+    unknown = set(args.mix) - set(MIXES)
+    if unknown:
+        parser.error(f"mélange inconnu : {', '.join(sorted(unknown))}")
+
+    dbname = f"erpbtp_bench_api_{os.getpid()}"
+    with admin_connection() as conn:
+        conn.execute(f'CREATE DATABASE "{dbname}"')
+    process = None
+    try:
+        # Schéma de la base jetable (mêmes migrations que le site)
+        env = {**os.environ, 'DB_NAME': dbname}
+        subprocess.run([sys.executable, 'migrations.py', 'upgrade'], cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        env.update({
+            'DB_POOL_MAX_SIZE': str(args.pool_max_size),
+            'CLIENT_CACHE_MAX_SIZE': '0' if args.no_cache else env.get('CLIENT_CACHE_MAX_SIZE', '1000'),
+        })
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'client_id_api:app', '--host', '127.0.0.1',
+             '--port', str(args.port), '--log-level', 'warning'],
+            cwd=ROOT, env=env,
+        )
+        mixes = asyncio.run(run_mixes(args, dbname, process))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        with admin_connection() as conn:
+            conn.execute(f'DROP DATABASE IF EXISTS "{dbname}" WITH (FORCE)')
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'duration': args.duration,
+            'concurrency': args.concurrency,
+            'names': args.names,
+            'pool_max_size': args.pool_max_size,
+            'cache': not args.no_cache,
+        },
+        'mixes': mixes,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Résultats enregistrés dans {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} régression(s) (seuil {args.threshold:.0%}) :")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print(f"\n✅ Pas de régression par rapport à {args.compare} (seuil {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
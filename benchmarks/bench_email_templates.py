@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark du rendu des emails de bienvenue (envois en masse)
+
+Mesure le coût par message :
+- rendu seul (modèle analysé une fois, substitution des champs)
+- rendu en lot (render_batch)
+- rendu + message sérialisé dans le squelette MIME (ce que fait l'expéditeur)
+- référence : modèle ré-analysé et MIME reconstruit à chaque message
+
+Usage : python benchmarks/bench_email_templates.py [-n 5000]
+"""
+import argparse
+import os
+import sys
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from string import Template
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_templates import WELCOME, build_message, welcome_fields  # noqa: E402
+
+
+def rows(count):
+    return [welcome_fields(f'client{i}', f'Pw{i}$&x', f'http://176.131.66.167:{8080 + i % 1000}', 'essai')
+            for i in range(count)]
+
+
+def bench(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed * 1e6 / count:8.1f} µs/message   ({elapsed:.3f} s pour {count})")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--count', type=int, default=5000, help="nombre de messages")
+    args = parser.parse_args()
+    data = rows(args.count)
+    text_source = WELCOME._text.template
+    html_source = WELCOME._html.template
+
+    def render_only():
+        for fields in data:
+            WELCOME.render(**fields)
+
+    def render_batch():
+        WELCOME.render_batch(data)
+
+    def render_mime():
+        for fields in data:
+            subject, text, html_body = WELCOME.render(**fields)
+            build_message(subject, 'client@example.com', 'noreply@erpbtp.fr', text, html_body)
+
+    def reference():
+        for fields in data:
+            msg = MIMEMultipart('alternative')
+            msg['Subject'] = WELCOME.subject
+            msg['From'] = 'noreply@erpbtp.fr'
+            msg['To'] = 'client@example.com'
+            msg.attach(MIMEText(Template(text_source).substitute(fields), 'plain'))
+            msg.attach(MIMEText(Template(html_source).substitute(fields), 'html'))
+            msg.as_bytes()
+
+    print(f"Rendu de {args.count} emails de bienvenue\n")
+    bench("rendu seul", args.count, render_only)
+    bench("rendu en lot (render_batch)", args.count, render_batch)
+    optimized = bench("rendu + squelette MIME sérialisé", args.count, render_mime)
+    baseline = bench("référence (ré-analyse + MIME complet)", args.count, reference)
+    print(f"\nGain rendu + MIME : x{baseline / optimized:.2f}")
+
+
+if __name__ == '__main__':
+    main()
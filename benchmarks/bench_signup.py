@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Benchmark de bout en bout des inscriptions (essai gratuit)
+
+Lance le site commercial dans le processus, avec des remplaçants locaux :
+- faux Portainer (fake_portainer) pour la création des stacks
+- faux serveur SMTP (fake_smtp) pour l'email de bienvenue
+- base PostgreSQL jetable (erpbtp_bench_<pid>) créée sur le serveur de
+  database_config (variables DB_*), migrée au démarrage du site puis supprimée
+
+puis exécute N inscriptions avec une concurrence donnée. Chaque inscription
+suit le même chemin qu'un visiteur :
+
+    page_demo        GET /demo
+    inscription      client + abonnement + job (mêmes requêtes que le formulaire)
+    file_attente     soumission -> début du provisionnement
+    port_attribue    soumission -> port réservé
+    stack_creee      soumission -> stack créée sur Portainer
+    provisionnement  soumission -> fin du job (email mis en file compris)
+    email            soumission -> email reçu par le serveur SMTP
+    felicitations    GET /felicitations
+    total            de bout en bout
+
+et affiche p50/p95/p99 par phase ainsi que le débit.
+
+Usage :
+    DB_HOST=127.0.0.1 DB_USER=postgres DB_PASSWORD=... \\
+        python benchmarks/bench_signup.py [-n 50] [-c 10] [--workers 2] [--portainer-latency 0.05]
+
+Sans serveur partagé, un PostgreSQL local jetable suffit :
+    docker run --rm -d --name erpbtp-bench -p 5432:5432 -e POSTGRES_PASSWORD=bench postgres:15-alpine
+    DB_HOST=127.0.0.1 DB_PORT=5432 DB_USER=postgres DB_PASSWORD=bench python benchmarks/bench_signup.py
+    docker stop erpbtp-bench
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import psycopg  # noqa: E402
+from fake_portainer import FakePortainer  # noqa: E402
+from fake_smtp import FakeSMTP  # noqa: E402
+from latency import percentile  # noqa: E402
+
+PHASES = ['page_demo', 'inscription', 'file_attente', 'port_attribue', 'stack_creee',
+          'provisionnement', 'email', 'felicitations', 'total']
+
+
+
+def admin_connection():
+    """
+    Connexion au serveur de database_config, sur la base de maintenance postgres
+    (comme createdb) : DB_NAME désigne déjà la base jetable, que le site importe
+    avec database_config
+    """
+    import database_config
+    return psycopg.connect(host=database_config.DB_HOST, port=database_config.DB_PORT,
+                           user=database_config.DB_USER, password=database_config.DB_PASSWORD,
+                           dbname='postgres', connect_timeout=database_config.DB_CONNECT_TIMEOUT,
+                           autocommit=True)
+
+
+class SignupBench:
+    def __init__(self, site, smtp, count, concurrency, base_url):
+        self.site = site
+        self.count = count
+        self.concurrency = concurrency
+        self.base_url = base_url
+        self.samples = {phase: [] for phase in PHASES}
+        self.errors = []
+        self.elapsed = 0.0
+        self._mail_waiters = {}
+        self._loop = None
+        smtp.on_message = self._on_mail
+
+    def _on_mail(self, entry):
+        # Thread du serveur SMTP -> boucle du benchmark
+        for recipient in entry['to']:
+            waiter = self._mail_waiters.get(recipient)
+            if waiter is not None:
+                self._loop.call_soon_threadsafe(
+                    lambda w=waiter, at=entry['received_at']: w.done() or w.set_result(at))
+
+    async def register(self, index, plan):
+        """Mêmes écritures que enregistrer_inscription (nouveau client)"""
+        from datetime import datetime, timedelta
+        from decimal import Decimal
+        from models import Abonnement, Client, ProvisioningJob
+        site = self.site
+        async with site.async_session_scope() as db:
+            client = Client(nom='Bench', prenom=f'bench{index}', email=self.email(index),
+                            entreprise='Bench BTP', telephone='0600000000')
+            db.add(client)
+            await db.flush()
+            abonnement = Abonnement(client_id=client.id, plan=plan, prix_mensuel=Decimal('0.00'),
+                                    date_debut=datetime.utcnow(), statut='actif', periode_essai=True,
+                                    date_fin_essai=datetime.utcnow() + timedelta(days=30))
+            db.add(abonnement)
+            await db.flush()
+            job = ProvisioningJob(client_id=client.id, abonnement_id=abonnement.id, plan=plan, statut='en_attente')
+            db.add(job)
+            await db.commit()
+            return job.id, client.id
+
+    def email(self, index):
+        return f'bench{index}.{os.getpid()}@example.com'
+
+    async def signup(self, http, index):
+        from provisioning_events import PORT_ASSIGNED, STACK_CREATED, STARTED
+        queue = self.site.provisioning_queue
+        timings = {}
+        start = time.perf_counter()
+
+        response = await http.get('/demo', params={'plan': 'essai'})
+        response.raise_for_status()
+        timings['page_demo'] = time.perf_counter() - start
+
+        mark = time.perf_counter()
+        job_id, client_id = await self.register(index, 'essai')
+        timings['inscription'] = time.perf_counter() - mark
+
+        done = self._loop.create_future()
+        mail = self._mail_waiters[self.email(index)] = self._loop.create_future()
+        phases = {STARTED: 'file_attente', PORT_ASSIGNED: 'port_attribue', STACK_CREATED: 'stack_creee'}
+
+        def on_progress(event):
+            if event.kind in phases:
+                timings[phases[event.kind]] = time.perf_counter() - submitted
+
+        queue.subscribe(job_id, on_progress=on_progress, on_done=lambda result: done.set_result(result))
+        submitted = time.perf_counter()
+        queue.submit(job_id, {'client_id': client_id, 'prenom': f'bench{index}',
+                              'email': self.email(index), 'plan': 'essai'})
+        result = await done
+        timings['provisionnement'] = time.perf_counter() - submitted
+        if not result.get('success'):
+            raise RuntimeError(result.get('message'))
+
+        received_at = await asyncio.wait_for(mail, timeout=60)
+        timings['email'] = received_at - submitted
+
+        mark = time.perf_counter()
+        params = urllib.parse.urlencode({'client_name': result['client_name'], 'pwd': result['password'],
+                                         'plan': result['plan'], 'port': result['port']})
+        response = await http.get(f'/felicitations?{params}')
+        response.raise_for_status()
+        timings['felicitations'] = time.perf_counter() - mark
+        timings['total'] = time.perf_counter() - start
+        return timings
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        # Le schéma de la base jetable est appliqué par l'initialisation du site
+        while not self.site.db_status['ready']:
+            if self.site.db_status['error']:
+                raise RuntimeError(self.site.db_status['error'])
+            await asyncio.sleep(0.05)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=120) as http:
+            async def one(index):
+                async with semaphore:
+                    try:
+                        for phase, seconds in (await self.signup(http, index)).items():
+                            self.samples[phase].append(seconds * 1000)
+                    except Exception as e:
+                        self.errors.append(f"inscription {index} : {e}")
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(index) for index in range(self.count)))
+            self.elapsed = time.perf_counter() - start
+
+    def report(self):
+        print(f"\n{self.count} inscriptions, concurrence {self.concurrency} : "
+              f"{self.elapsed:.2f} s, {len(self.samples['total']) / self.elapsed:.2f} inscriptions/s")
+        if self.errors:
+            print(f"❌ {len(self.errors)} erreur(s), ex. : {self.errors[0]}")
+        print(f"\n{'phase':<16} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for phase in PHASES:
+            values = sorted(self.samples[phase])
+            if values:
+                print(f"{phase:<16} {percentile(values, 50):9.1f} {percentile(values, 95):9.1f} "
+                      f"{percentile(values, 99):9.1f} {values[-1]:9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--count', type=int, default=50, help="nombre d'inscriptions")
+    parser.add_argument('-c', '--concurrency', type=int, default=10, help="inscriptions simultanées")
+    parser.add_argument('--workers', type=int, default=2, help="workers de provisionnement (PROVISIONING_MAX_WORKERS)")
+    parser.add_argument('--portainer-latency', type=float, default=0.0, help="latence du faux Portainer (s)")
+    parser.add_argument('--smtp-latency', type=float, default=0.0, help="latence du faux SMTP par message (s)")
+    parser.add_argument('--port', type=int, default=8765, help="port d'écoute du site pendant le benchmark")
+    parser.add_argument('--keep-db', action='store_true', help="conserver la base jetable")
+    args = parser.parse_args()
+
+    bench_db = f"erpbtp_bench_{os.getpid()}"
+    # Lu à l'import de database_config (connexion d'administration comprise)
+    os.environ['DB_NAME'] = bench_db
+    with admin_connection() as conn:
+        conn.execute(f'CREATE DATABASE "{bench_db}"')
+    print(f"🗄️ Base jetable {bench_db}")
+
+    portainer = FakePortainer(latency=args.portainer_latency).start()
+    smtp = FakeSMTP(username='bench@erpbtp.test', password='secret', latency=args.smtp_latency).start()
+    try:
+        # Configuration lue à l'import des modules du site
+        os.environ.update({
+            'PORTAINER_BACKEND': 'api',
+            'PORTAINER_URL': portainer.url,
+            'PORTAINER_USER': portainer.username,
+            'PORTAINER_PASSWORD': portainer.password,
+            'SMTP_SERVER': smtp.host,
+            'SMTP_PORT': str(smtp.port),
+            'SMTP_USER': smtp.username,
+            'SMTP_PASSWORD': smtp.password,
+            'SMTP_STARTTLS': 'false',
+            'PROVISIONING_MAX_WORKERS': str(args.workers),
+            'PROVISIONING_MAX_PENDING': str(max(args.count, 50)),
+            'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING'),
+        })
+        import site_commercial
+        from database_config import engine
+        from nicegui import app, ui
+
+        bench = SignupBench(site_commercial, smtp, args.count, args.concurrency, f"http://127.0.0.1:{args.port}")
+
+        async def run_and_stop():
+            try:
+                await bench.run()
+            except Exception as e:
+                bench.errors.append(str(e))
+            finally:
+                app.shutdown()
+
+        app.on_startup(lambda: asyncio.create_task(run_and_stop()))
+        ui.run(host='127.0.0.1', port=args.port, reload=False, show=False, show_welcome_message=False)
+        engine.dispose()
+        bench.report()
+        print(f"\nPortainer : {portainer.request_count} requêtes, {portainer.auth_count} authentification(s) ; "
+              f"SMTP : {len(smtp.messages)} emails, {smtp.connection_count} connexion(s)")
+    finally:
+        portainer.stop()
+        smtp.stop()
+        if not args.keep_db:
+            with admin_connection() as conn:
+                conn.execute(f'DROP DATABASE IF EXISTS "{bench_db}" WITH (FORCE)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Statistiques de latence partagées par les benchmarks
+"""
+import math
+
+# Bornes supérieures des tranches de l'histogramme (ms)
+HISTOGRAM_BOUNDS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, math.inf]
+
+
+def percentile(sorted_values, p):
+    """Percentile (rang le plus proche) d'une liste triée"""
+    if not sorted_values:
+        return float('nan')
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p * len(sorted_values) / 100) - 1))
+    return sorted_values[rank]
+
+
+def summarize(values):
+    """p50/p95/p99/max/moyenne (ms) d'une liste de latences"""
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        'p50': round(percentile(values, 50), 3),
+        'p95': round(percentile(values, 95), 3),
+        'p99': round(percentile(values, 99), 3),
+        'max': round(values[-1], 3),
+        'mean': round(sum(values) / len(values), 3),
+    }
+
+
+def histogram(values, bounds=HISTOGRAM_BOUNDS):
+    """Nombre de valeurs par tranche : {'<=0.5': n, '<=1': n, ..., '>5000': n}"""
+    counts = {}
+    previous = None
+    for bound in bounds:
+        label = f"<={bound:g}" if bound != math.inf else f">{previous:g}"
+        counts[label] = 0
+        previous = bound
+    labels = list(counts)
+    for value in values:
+        for label, bound in zip(labels, bounds):
+            if value <= bound:
+                counts[label] += 1
+                break
+    return counts
+
+
+def print_histogram(counts, width=40):
+    total = sum(counts.values()) or 1
+    peak = max(counts.values()) or 1
+    for label, count in counts.items():
+        if count:
+            bar = '#' * max(1, round(count / peak * width))
+            print(f"  {label:>8} ms {count:7d} {count / total:6.1%} {bar}")
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+Tests des statistiques de latence des benchmarks : percentile au rang le plus proche
+"""
+from latency import percentile, summarize
+
+
+def test_percentile_nearest_rank():
+    assert percentile(list(range(1, 11)), 50) == 5
+    assert percentile(list(range(1, 101)), 95) == 95
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile(list(range(1, 101)), 100) == 100
+    assert percentile(list(range(1, 101)), 7) == 7  # 7 / 100 * 100 vaut 7.000000000000001
+    assert percentile([7], 0) == 7
+    assert summarize(range(1, 101))['p50'] == 50
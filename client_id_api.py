@@ -1,9 +1,17 @@
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+from typing import List, Optional
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
 import psycopg
+import logging
 import os
+import time
+from logging_config import setup_logging, stop_logging
+from metrics import DB_QUERY_DURATION, Gauge, instrument_app
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
 # Configuration de la connexion à la base erpbtp_clients
 DB_HOST = os.getenv("DB_HOST", "localhost")
@@ -12,59 +20,376 @@ DB_NAME = os.getenv("DB_NAME", "erpbtp_clients")
 DB_USER = os.getenv("DB_USER", "erp_user")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "motdepasse")
 
+# Configuration du pool de connexions (bornes et délai d'attente max en secondes)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+
+# Nombre maximum de clients par appel de l'endpoint batch
+CLIENT_BATCH_MAX = int(os.getenv("CLIENT_BATCH_MAX", "10000"))
+
+# Cache nom -> id en mémoire (0 désactive le cache ; TTL en secondes)
+CLIENT_CACHE_MAX_SIZE = int(os.getenv("CLIENT_CACHE_MAX_SIZE", "1000"))
+CLIENT_CACHE_TTL = float(os.getenv("CLIENT_CACHE_TTL", "300"))
+
+# Pool de connexions asynchrone partagé pendant toute la durée de vie de l'application.
+# Les requêtes sont multiplexées sur la boucle d'événements au lieu d'occuper
+# le threadpool de FastAPI. open=False : il est ouvert au démarrage et fermé
+# à l'arrêt (voir lifespan).
+pool = AsyncConnectionPool(
+    kwargs={
+        "host": DB_HOST,
+        "port": DB_PORT,
+        "dbname": DB_NAME,
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+    },
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    check=AsyncConnectionPool.check_connection,  # Vérifie la connexion à chaque emprunt
+    name="client_id_api",
+    open=False,
+)
+
+
+# Colonne clé unique servant de cible ON CONFLICT, créée par les migrations
+# (révision 0002) : l'API vérifie seulement sa présence, sans DDL
+SCHEMA_CHECK_SQL = """
+SELECT 1 FROM information_schema.columns
+WHERE table_schema = current_schema() AND table_name = 'clients' AND column_name = 'cle_client'
+"""
+
+# Recherche ou création du client en une seule instruction.
+# - existant : dernier client portant exactement ce nom (comportement historique)
+# - nouveau  : insertion uniquement si rien n'a été trouvé ; en cas de course,
+#   la requête perdante attend la validation de la gagnante sur l'index unique
+#   de cle_client puis met à jour la ligne existante au lieu d'en créer une
+#   seconde. xmax = 0 distingue une ligne réellement insérée d'une ligne
+#   récupérée via ON CONFLICT.
+UPSERT_CLIENT_SQL = """
+WITH existant AS (
+    SELECT id FROM clients WHERE nom = %(nom)s ORDER BY id DESC LIMIT 1
+), nouveau AS (
+    INSERT INTO clients (nom, entreprise, email, cle_client, date_creation)
+    SELECT %(nom)s, %(entreprise)s, %(email)s, %(cle)s, NOW()
+    WHERE NOT EXISTS (SELECT 1 FROM existant)
+    ON CONFLICT (cle_client) DO UPDATE SET cle_client = EXCLUDED.cle_client
+    RETURNING id, (xmax = 0) AS created
+)
+SELECT id, created FROM nouveau
+UNION ALL
+SELECT id, FALSE FROM existant
+LIMIT 1
+"""
+
+# Batch : dernier id pour chacun des noms demandés, en une requête ensembliste
+SELECT_EXISTING_BATCH_SQL = """
+SELECT DISTINCT ON (nom) nom, id
+FROM clients
+WHERE nom = ANY(%s)
+ORDER BY nom, id DESC
+"""
+
+# Batch : insertion multi-lignes des clients manquants (mêmes règles que l'upsert unitaire)
+INSERT_MISSING_BATCH_SQL = """
+INSERT INTO clients (nom, entreprise, email, cle_client, date_creation)
+SELECT nom, entreprise, email, cle, NOW()
+FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[]) AS t(nom, entreprise, email, cle)
+ON CONFLICT (cle_client) DO UPDATE SET cle_client = EXCLUDED.cle_client
+RETURNING cle_client, id, (xmax = 0) AS created
+"""
+
+
+def client_key(nom):
+    """Clé normalisée d'un nom de client (identique pour 'Jean Dupont' et ' jean dupont')"""
+    return nom.strip().lower().replace(' ', '.')
+
+
+class ClientIdCache:
+    """
+    Cache LRU borné avec durée de vie, nom du client -> id.
+
+    Utilisé uniquement depuis la boucle d'événements : pas de verrou nécessaire.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # nom -> (id, expiration)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, nom):
+        entry = self._entries.get(nom)
+        if entry is None:
+            self.misses += 1
+            return None
+        client_id, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[nom]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(nom)
+        self.hits += 1
+        return client_id
+
+    def set(self, nom, client_id):
+        if self.max_size <= 0:
+            return
+        self._entries[nom] = (client_id, time.monotonic() + self.ttl)
+        self._entries.move_to_end(nom)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, nom=None):
+        """Supprime une entrée, ou tout le cache si nom est None. Retourne le nombre d'entrées retirées."""
+        if nom is None:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+        return 1 if self._entries.pop(nom, None) is not None else 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+client_cache = ClientIdCache(CLIENT_CACHE_MAX_SIZE, CLIENT_CACHE_TTL)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Ouvre le pool au démarrage de l'API et le ferme à l'arrêt"""
+    setup_logging()
+    await pool.open()
+    try:
+        async with pool.connection() as conn:
+            cursor = await conn.execute(SCHEMA_CHECK_SQL)
+            if await cursor.fetchone() is None:
+                logger.warning("⚠️ Colonne clients.cle_client absente : appliquer les migrations "
+                               "(python migrations.py upgrade)")
+    except psycopg.Error as e:
+        logger.warning("⚠️ Impossible de vérifier le schéma clients : %s", e)
+    try:
+        yield
+    finally:
+        await pool.close()
+        stop_logging()
+
+
+app = FastAPI(lifespan=lifespan)
+instrument_app(app)
+
+
 class ClientRequest(BaseModel):
     nom: str
     entreprise: str = None  # Optionnel pour la création
     email: str = None  # Optionnel pour la création
 
+
+def pool_metrics():
+    """
+    Retourne l'état du pool de connexions.
+
+    Les compteurs cumulés (requests_*) proviennent de psycopg_pool ;
+    la saturation est la part des connexions max actuellement empruntées.
+    """
+    stats = pool.get_stats()
+    size = stats.get("pool_size", 0)
+    available = stats.get("pool_available", 0)
+    in_use = size - available
+    requests_num = stats.get("requests_num", 0)
+    wait_ms = stats.get("requests_wait_ms", 0)
+    return {
+        "min_size": pool.min_size,
+        "max_size": pool.max_size,
+        "size": size,
+        "available": available,
+        "in_use": in_use,
+        "waiting": stats.get("requests_waiting", 0),
+        "saturation": round(in_use / pool.max_size, 3) if pool.max_size else 0.0,
+        "requests": requests_num,
+        "requests_queued": stats.get("requests_queued", 0),
+        "requests_errors": stats.get("requests_errors", 0),
+        "wait_ms_total": wait_ms,
+        "wait_ms_avg": round(wait_ms / requests_num, 3) if requests_num else 0.0,
+        "connections_lost": stats.get("connections_lost", 0),
+    }
+
+
+Gauge(
+    "client_id_pool_connections", "Connexions du pool psycopg par état",
+    lambda: {(state,): pool_metrics()[state] for state in ("size", "in_use", "available", "waiting")},
+    ["state"],
+)
+Gauge(
+    "client_id_cache_lookups", "Consultations cumulées du cache nom -> id",
+    lambda: {("hit",): client_cache.hits, ("miss",): client_cache.misses},
+    ["result"],
+)
+
+
 @app.get("/health")
-def health_check():
-    return {"status": "ok", "db_host": DB_HOST, "db_name": DB_NAME}
+async def health_check():
+    metrics = pool_metrics()
+    # Saturé : toutes les connexions sont empruntées et des requêtes attendent
+    saturated = metrics["in_use"] >= metrics["max_size"] and metrics["waiting"] > 0
+    return {
+        "status": "saturated" if saturated else "ok",
+        "db_host": DB_HOST,
+        "db_name": DB_NAME,
+        "pool": metrics,
+        "cache": client_cache.stats(),
+    }
+
+
+@app.delete("/client-id/cache")
+async def invalidate_client_cache(nom: Optional[str] = None):
+    """Invalide l'entrée du cache pour un nom, ou tout le cache si aucun nom n'est fourni"""
+    return {"invalidated": client_cache.invalidate(nom)}
+
 
 @app.post("/client-id/")
-def get_client_id(data: ClientRequest):
+async def get_client_id(data: ClientRequest):
     """
     Récupère l'ID d'un client par son nom.
     Crée le client automatiquement s'il n'existe pas.
     """
+    cached_id = client_cache.get(data.nom)
+    if cached_id is not None:
+        return {"id": cached_id, "created": False}
+
+    cle = client_key(data.nom)
+    # Générer un email par défaut si non fourni (dérivé de la clé unique)
+    email = data.email if data.email else f"{cle}@temp.local"
+    entreprise = data.entreprise if data.entreprise else data.nom
+
     try:
-        conn = psycopg.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        cur = conn.cursor()
-        
-        # Chercher par nom du client uniquement
-        cur.execute("SELECT id FROM clients WHERE nom = %s ORDER BY id DESC LIMIT 1", (data.nom,))
-        row = cur.fetchone()
-        
-        # Si pas trouvé, créer le client
-        if not row:
-            # Générer un email par défaut si non fourni
-            email = data.email if data.email else f"{data.nom.lower().replace(' ', '.')}@temp.local"
-            entreprise = data.entreprise if data.entreprise else data.nom
-            
-            cur.execute(
-                "INSERT INTO clients (nom, entreprise, email, date_creation) VALUES (%s, %s, %s, NOW()) RETURNING id",
-                (data.nom, entreprise, email)
-            )
-            conn.commit()
-            row = cur.fetchone()
-            created = True
-        else:
-            created = False
-        
-        cur.close()
-        conn.close()
-        
+        async with pool.connection() as conn:
+            with DB_QUERY_DURATION.time("client_id_api"):
+                cur = await conn.execute(
+                    UPSERT_CLIENT_SQL,
+                    {"nom": data.nom, "entreprise": entreprise, "email": email, "cle": cle},
+                )
+                row = await cur.fetchone()
+            # La sortie du bloc valide la transaction et rend la connexion au pool
+
         if row:
-            return {"id": row[0], "created": created}
+            client_cache.set(data.nom, row[0])
+            return {"id": row[0], "created": row[1]}
         else:
             raise HTTPException(status_code=500, detail="Erreur lors de la création du client")
-            
+
+    except HTTPException:
+        raise
+    except psycopg.errors.UniqueViolation as e:
+        raise HTTPException(status_code=409, detail=f"Client en conflit (email déjà utilisé ?): {str(e)}")
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Pool de connexions saturé: {str(e)}")
+    except psycopg.Error as e:
+        raise HTTPException(status_code=500, detail=f"Erreur DB: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
+
+@app.post("/client-ids/")
+async def get_client_ids(data: List[ClientRequest]):
+    """
+    Version batch de /client-id/ : résout (ou crée) une liste de clients.
+
+    Une requête ensembliste récupère les noms existants, puis une seule
+    insertion multi-lignes crée les manquants. Les résultats sont renvoyés
+    dans l'ordre de la liste reçue ; un nom répété n'est créé qu'une fois
+    (created=true uniquement pour sa première occurrence).
+    """
+    if len(data) > CLIENT_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Trop de clients dans la requête ({len(data)} > {CLIENT_BATCH_MAX})"
+        )
+    if not data:
+        return []
+
+    ids_par_nom = {}
+    noms = []
+    for nom in dict.fromkeys(item.nom for item in data):
+        cached_id = client_cache.get(nom)
+        if cached_id is not None:
+            ids_par_nom[nom] = cached_id
+        else:
+            noms.append(nom)
+
+    try:
+        async with pool.connection() as conn:
+            if noms:
+                with DB_QUERY_DURATION.time("client_id_api"):
+                    cur = await conn.execute(SELECT_EXISTING_BATCH_SQL, (noms,))
+                    existants = await cur.fetchall()
+                for nom, client_id in existants:
+                    ids_par_nom[nom] = client_id
+                    client_cache.set(nom, client_id)
+
+            # Clients à créer, dédoublonnés par clé normalisée
+            a_creer = {}
+            for item in data:
+                if item.nom in ids_par_nom:
+                    continue
+                cle = client_key(item.nom)
+                if cle not in a_creer:
+                    a_creer[cle] = (
+                        item.nom,
+                        item.entreprise if item.entreprise else item.nom,
+                        item.email if item.email else f"{cle}@temp.local",
+                    )
+
+            crees = {}
+            if a_creer:
+                lignes = list(a_creer.values())
+                with DB_QUERY_DURATION.time("client_id_api"):
+                    cur = await conn.execute(
+                        INSERT_MISSING_BATCH_SQL,
+                        (
+                            [ligne[0] for ligne in lignes],
+                            [ligne[1] for ligne in lignes],
+                            [ligne[2] for ligne in lignes],
+                            list(a_creer.keys()),
+                        ),
+                    )
+                    rows = await cur.fetchall()
+                crees = {cle: (client_id, created) for cle, client_id, created in rows}
+            # La sortie du bloc valide la transaction et rend la connexion au pool
+
+        resultats = []
+        deja_signales = set()
+        for item in data:
+            if item.nom in ids_par_nom:
+                resultats.append({"id": ids_par_nom[item.nom], "created": False})
+                continue
+            cle = client_key(item.nom)
+            client_id, created = crees[cle]
+            client_cache.set(item.nom, client_id)
+            resultats.append({"id": client_id, "created": created and cle not in deja_signales})
+            deja_signales.add(cle)
+        return resultats
+
+    except psycopg.errors.UniqueViolation as e:
+        raise HTTPException(status_code=409, detail=f"Client en conflit (email déjà utilisé ?): {str(e)}")
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Pool de connexions saturé: {str(e)}")
     except psycopg.Error as e:
         raise HTTPException(status_code=500, detail=f"Erreur DB: {str(e)}")
     except Exception as e:
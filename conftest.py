@@ -0,0 +1,16 @@
+import importlib
+import logging
+
+import pytest
+
+from logging_config import stop_logging
+
+
+@pytest.fixture
+def site():
+    """Module du site, importé pendant le test (son import installe la configuration des logs)"""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield importlib.import_module('site_commercial')
+    stop_logging()
+    root.handlers, root.level = handlers, level
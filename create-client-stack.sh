@@ -12,6 +12,7 @@ ENVIRONMENT_ID="2"
 BASE_PORT=8080
 INITIAL_PASSWORD=""
 CLIENT_ID=""
+APP_PORT=""
 
 # Fonction d'aide
 usage() {
@@ -30,12 +31,13 @@ usage() {
     echo "  -P PORTAINER_PASSWORD  Mot de passe Portainer"
     echo "  -e ENVIRONMENT_ID      ID environnement (défaut: 2)"
     echo "  -b BASE_PORT           Port de base (défaut: 8080)"
+    echo "  -a APP_PORT            Port application déjà réservé (évite la recherche)"
     echo "  -h                     Afficher cette aide"
     exit 1
 }
 
 # Parser les arguments
-while getopts "c:d:p:s:i:u:U:P:e:b:h" opt; do
+while getopts "c:d:p:s:i:u:U:P:e:b:a:h" opt; do
     case $opt in
         c) CLIENT_NAME="$OPTARG" ;;
         d) CLIENT_ID="$OPTARG" ;;
@@ -47,6 +49,7 @@ while getopts "c:d:p:s:i:u:U:P:e:b:h" opt; do
         P) PORTAINER_PASSWORD="$OPTARG" ;;
         e) ENVIRONMENT_ID="$OPTARG" ;;
         b) BASE_PORT="$OPTARG" ;;
+        a) APP_PORT="$OPTARG" ;;
         h) usage ;;
         *) usage ;;
     esac
@@ -58,6 +61,38 @@ if [ -z "$CLIENT_NAME" ] || [ -z "$POSTGRES_PASSWORD" ] || [ -z "$SECRET_KEY" ];
     usage
 fi
 
+# Traces : si le site transmet TRACEPARENT et TRACE_FILE, chaque étape du script
+# est ajoutée au fichier de traces comme span enfant du span appelant (voir tracing.py)
+TRACE_ID=""
+PARENT_SPAN_ID=""
+if [[ "$TRACEPARENT" =~ ^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$ ]] && [ -n "$TRACE_FILE" ]; then
+    TRACE_ID="${BASH_REMATCH[1]}"
+    PARENT_SPAN_ID="${BASH_REMATCH[2]}"
+fi
+SPAN_NAME=""
+SPAN_START=""
+
+# Termine l'étape en cours et l'écrit dans le fichier de traces
+span_end() {
+    if [ -n "$TRACE_ID" ] && [ -n "$SPAN_NAME" ]; then
+        local span_id
+        span_id=$(printf '%04x%04x%04x%04x' $RANDOM $RANDOM $RANDOM $RANDOM)
+        printf '{"traceId":"%s","spanId":"%s","parentSpanId":"%s","name":"%s","startTimeUnixNano":%s,"endTimeUnixNano":%s,"service":"create-client-stack.sh","attributes":{},"status":"%s"}\n' \
+            "$TRACE_ID" "$span_id" "$PARENT_SPAN_ID" "$SPAN_NAME" "$SPAN_START" "$(date +%s%N)" "${1:-ok}" >> "$TRACE_FILE"
+    fi
+    SPAN_NAME=""
+}
+
+# Commence une étape (termine la précédente)
+span_start() {
+    span_end
+    SPAN_NAME="$1"
+    SPAN_START=$(date +%s%N)
+}
+
+# Une sortie en erreur termine l'étape en cours avec le statut error
+trap '[ $? -eq 0 ] && span_end || span_end error' EXIT
+
 echo "========================================"
 echo "Creation d'une stack client Portainer"
 echo "========================================"
@@ -86,6 +121,7 @@ if [ -n "$CLIENT_ID" ]; then
     echo "[0/4] Utilisation de l'ID client fourni: $CLIENT_ID"
 else
     echo "[0/4] Recuperation/creation de l'ID du client via l'API..."
+    span_start "api_client.client_id"
     # Utiliser le nom du service Docker au lieu de localhost
     API_HOST=${API_HOST:-api_client}
     API_RESPONSE=$(curl -s -X POST http://${API_HOST}:8000/client-id/ \
@@ -110,6 +146,7 @@ fi
 
 # 1. Authentification à Portainer
 echo "[1/4] Authentification a Portainer..."
+span_start "portainer.auth"
 AUTH_RESPONSE=$(curl -k -s -X POST "$PORTAINER_URL/api/auth" \
     -H "Content-Type: application/json" \
     -d '{"username":"'$PORTAINER_USER'","password":"'$PORTAINER_PASSWORD'"}')
@@ -127,6 +164,7 @@ echo "Authentification reussie"
 
 # 2. Récupérer la liste des stacks existantes
 echo "[2/4] Recuperation des stacks existantes..."
+span_start "portainer.stacks"
 STACKS=$(curl -k -s -X GET "$PORTAINER_URL/api/stacks" \
     -H "Authorization: Bearer $TOKEN" \
     -H "Content-Type: application/json")
@@ -138,44 +176,53 @@ CLIENT_COUNT=$(echo "$STACKS" | grep -o '"Name":"client-'"$CLIENT_NAME"'_[0-9]\+
 CLIENT_NUMBER=$((CLIENT_COUNT + 1))
 
 # Récupérer tous les ports utilisés par les stacks existantes
-echo "Recuperation des ports utilises..."
+# (inutile si le port a été réservé par l'appelant)
 USED_PORTS=""
-for stack_id in $(echo "$STACKS" | sed -n 's/.*"Id":\([0-9]*\).*/\1/p'); do
-    STACK_DETAIL=$(curl -k -s -X GET "$PORTAINER_URL/api/stacks/$stack_id" \
-        -H "Authorization: Bearer $TOKEN" \
-        -H "Content-Type: application/json")
-    
-    PORT=$(echo "$STACK_DETAIL" | sed -n 's/.*"APP_PORT"[^}]*"value":"\([0-9]*\)".*/\1/p' | head -n1)
-    if [ -n "$PORT" ]; then
-        USED_PORTS="$USED_PORTS $PORT"
-    fi
-done
-
-# Récupérer aussi les ports utilisés directement par Docker
-DOCKER_PORTS=$(docker ps --format "{{.Ports}}" | grep -o '0.0.0.0:[0-9]*' | cut -d':' -f2 | sort -u)
-for docker_port in $DOCKER_PORTS; do
-    USED_PORTS="$USED_PORTS $docker_port"
-done
+if [ -n "$APP_PORT" ]; then
+    NEXT_PORT=$APP_PORT
+else
+    echo "Recuperation des ports utilises..."
+    span_start "portainer.ports_des_stacks"
+    for stack_id in $(echo "$STACKS" | sed -n 's/.*"Id":\([0-9]*\).*/\1/p'); do
+        STACK_DETAIL=$(curl -k -s -X GET "$PORTAINER_URL/api/stacks/$stack_id" \
+            -H "Authorization: Bearer $TOKEN" \
+            -H "Content-Type: application/json")
+        
+        PORT=$(echo "$STACK_DETAIL" | sed -n 's/.*"APP_PORT"[^}]*"value":"\([0-9]*\)".*/\1/p' | head -n1)
+        if [ -n "$PORT" ]; then
+            USED_PORTS="$USED_PORTS $PORT"
+        fi
+    done
 
-# Retirer les doublons et trier
-USED_PORTS=$(echo $USED_PORTS | tr ' ' '\n' | sort -u | tr '\n' ' ')
+    # Récupérer aussi les ports utilisés directement par Docker
+    span_start "docker_ps"
+    DOCKER_PORTS=$(docker ps --format "{{.Ports}}" | grep -o '0.0.0.0:[0-9]*' | cut -d':' -f2 | sort -u)
+    for docker_port in $DOCKER_PORTS; do
+        USED_PORTS="$USED_PORTS $docker_port"
+    done
 
-# Trouver le premier port disponible
-NEXT_PORT=$BASE_PORT
-while true; do
-    PORT_IN_USE=false
-    for used_port in $USED_PORTS; do
-        if [ "$NEXT_PORT" = "$used_port" ]; then
-            PORT_IN_USE=true
+    span_end
+
+    # Retirer les doublons et trier
+    USED_PORTS=$(echo $USED_PORTS | tr ' ' '\n' | sort -u | tr '\n' ' ')
+
+    # Trouver le premier port disponible
+    NEXT_PORT=$BASE_PORT
+    while true; do
+        PORT_IN_USE=false
+        for used_port in $USED_PORTS; do
+            if [ "$NEXT_PORT" = "$used_port" ]; then
+                PORT_IN_USE=true
+                break
+            fi
+        done
+        
+        if [ "$PORT_IN_USE" = false ]; then
             break
         fi
+        NEXT_PORT=$((NEXT_PORT + 1))
     done
-    
-    if [ "$PORT_IN_USE" = false ]; then
-        break
-    fi
-    NEXT_PORT=$((NEXT_PORT + 1))
-done
+fi
 
 echo "Nombre de clients existants avec ce nom: $CLIENT_COUNT"
 echo "Ports actuellement utilises:$USED_PORTS"
@@ -193,6 +240,7 @@ fi
 # 4. Créer la nouvelle stack
 STACK_NAME="client_$CLIENT_ID"
 echo "[3/4] Creation de la stack $STACK_NAME..."
+span_start "portainer.creation_stack"
 
 # Échapper les valeurs sensibles pour JSON (utilisation de Python pour un échappement parfait)
 POSTGRES_PASSWORD_ESCAPED=$(python3 -c "import json; print(json.dumps('$POSTGRES_PASSWORD'))")
@@ -319,6 +367,7 @@ if [ -z "$STACK_ID" ]; then
 fi
 
 echo "Stack creee avec succes (ID: $STACK_ID)"
+span_end
 
 # 6. Afficher le résumé
 echo ""
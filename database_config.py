@@ -1,7 +1,13 @@
 import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
 from urllib.parse import quote_plus
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from metrics import Gauge, Histogram, watch_queries
 
 # Configuration de la base de données PostgreSQL
 DB_USER = os.getenv('DB_USER', 'fred')
@@ -10,12 +16,186 @@ DB_NAME = os.getenv('DB_NAME', 'erpbtp_clients')
 DB_HOST = os.getenv('DB_HOST', '192.168.1.14')
 DB_PORT = os.getenv('DB_PORT', '5433')
 
+# Pool de connexions : taille, connexions supplémentaires, attente max (s),
+# vérification avant utilisation, recyclage (s, -1 = jamais)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+# Durée max d'une requête SQL (ms, 0 = illimitée)
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', '0'))
+# Délai max d'établissement d'une connexion (s) : échec rapide si la base est injoignable
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '5'))
+
 # Encoder le mot de passe pour l'URL (le @ doit devenir %40)
 encoded_password = quote_plus(DB_PASSWORD)
 
 # Connexion PostgreSQL - Utilise psycopg (v3)
 DATABASE_URL = f"postgresql+psycopg://{DB_USER}:{encoded_password}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_engine(DATABASE_URL, echo=False)
+
+class PoolStats:
+    """Compteurs du pool : attente pour obtenir une connexion et renouvellement des connexions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_time = 0.0
+        self.checkout_max = 0.0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.connections_invalidated = 0
+
+    def record_checkout(self, elapsed):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_time += elapsed
+            self.checkout_max = max(self.checkout_max, elapsed)
+
+    def count(self, attribute):
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'checkout_avg_ms': round(self.checkout_time / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'checkout_max_ms': round(self.checkout_max * 1000, 3),
+                'connections_opened': self.connections_opened,
+                'connections_closed': self.connections_closed,
+                'connections_invalidated': self.connections_invalidated,
+            }
+
+
+pool_stats = PoolStats()
+async_pool_stats = PoolStats()
+POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', "Attente d'une connexion du pool SQLAlchemy", ['engine'])
+
+
+class _TimedPool:
+    """Mesure le temps d'obtention d'une connexion (attente du pool comprise)"""
+    stats = None
+    label = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.record_checkout(elapsed)
+            POOL_CHECKOUT_WAIT.observe(elapsed, self.label)
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    stats = pool_stats
+    label = 'sync'
+
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    stats = async_pool_stats
+    label = 'async'
+
+
+def engine_options():
+    """Options communes aux moteurs synchrone et asynchrone"""
+    options = {
+        'echo': False,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'connect_args': {'connect_timeout': DB_CONNECT_TIMEOUT},
+    }
+    if DB_STATEMENT_TIMEOUT > 0:
+        options['connect_args']['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+    return options
+
+
+def watch_pool(target, stats):
+    """Compte les ouvertures, fermetures et invalidations de connexions d'un pool"""
+    event.listen(target, 'connect', lambda *args: stats.count('connections_opened'))
+    event.listen(target, 'close', lambda *args: stats.count('connections_closed'))
+    event.listen(target, 'close_detached', lambda *args: stats.count('connections_closed'))
+    event.listen(target, 'invalidate', lambda *args: stats.count('connections_invalidated'))
+
+
+engine = create_engine(DATABASE_URL, poolclass=TimedQueuePool, **engine_options())
+watch_pool(engine, pool_stats)
+watch_queries(engine, 'sync')
 SessionLocal = sessionmaker(bind=engine)
 Base = declarative_base()
+
+# Moteur asynchrone (même pilote psycopg 3, mode async) pour le code exécuté
+# dans la boucle d'événements NiceGUI : aucune requête ne bloque les autres visiteurs
+async_engine = create_async_engine(DATABASE_URL, poolclass=TimedAsyncQueuePool, **engine_options())
+watch_pool(async_engine.sync_engine, async_pool_stats)
+watch_queries(async_engine, 'async')
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+def _engine_pool_stats(target, stats):
+    return {
+        'size': target.pool.size(),
+        'checked_out': target.pool.checkedout(),
+        'overflow': target.pool.overflow(),
+        **stats.snapshot(),
+    }
+
+
+def get_pool_stats():
+    """État des pools synchrone et asynchrone et compteurs cumulés"""
+    return {
+        'sync': _engine_pool_stats(engine, pool_stats),
+        'async': _engine_pool_stats(async_engine.sync_engine, async_pool_stats),
+    }
+
+
+Gauge(
+    'db_pool_connections', "Connexions des pools SQLAlchemy",
+    lambda: {
+        (label, state): stats[state]
+        for label, stats in get_pool_stats().items()
+        for state in ('size', 'checked_out', 'overflow')
+    },
+    ['engine', 'state'],
+)
+
+
+@contextmanager
+def session_scope():
+    """
+    Session le temps d'une requête : commit à la sortie, rollback en cas
+    d'exception, connexion toujours rendue au pool
+
+    Usage :
+        with session_scope() as db:
+            db.add(...)
+    """
+    db = SessionLocal()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+@asynccontextmanager
+async def async_session_scope():
+    """Équivalent asynchrone de session_scope (AsyncSession)"""
+    db = AsyncSessionLocal()
+    try:
+        yield db
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        await db.close()
@@ -0,0 +1,206 @@
+"""
+Modèles des emails envoyés aux clients
+
+Chaque modèle est analysé une seule fois au chargement du module
+(string.Template : pas d'échappement des accolades du CSS), le squelette
+MIME et le sujet encodé sont préparés une fois et seuls les champs propres
+au client sont substitués à chaque envoi.
+"""
+import base64
+import html
+import uuid
+from functools import lru_cache
+from email.header import Header
+from string import Template
+
+# Délimiteur des parties MIME : fixe pour tout le processus (les corps encodés
+# en base64 ne peuvent pas contenir de ligne commençant par --)
+_BOUNDARY = f"=_erpbtp_{uuid.uuid4().hex}"
+
+# Squelette MIME sérialisé une seule fois : seuls le sujet, les adresses et les
+# corps encodés sont insérés à chaque message
+_HEADERS = (
+    'Content-Type: multipart/alternative; boundary="' + _BOUNDARY + '"\r\n'
+    'MIME-Version: 1.0\r\n'
+    'Subject: {subject}\r\n'
+    'From: {from_email}\r\n'
+    'To: {to}\r\n'
+    '\r\n'
+).format
+_PART_HEADERS = {
+    subtype: (
+        f'--{_BOUNDARY}\r\n'
+        f'Content-Type: text/{subtype}; charset="utf-8"\r\n'
+        'MIME-Version: 1.0\r\n'
+        'Content-Transfer-Encoding: base64\r\n'
+        '\r\n'
+    ).encode('ascii')
+    for subtype in ('plain', 'html')
+}
+_CLOSING = f'--{_BOUNDARY}--\r\n'.encode('ascii')
+
+
+class EmailTemplate:
+    """
+    Modèle d'email texte + HTML
+
+    Args:
+        subject: sujet (statique)
+        text: corps texte, champs sous la forme $nom
+        html_body: corps HTML, champs sous la forme $nom (valeurs échappées)
+    """
+
+    def __init__(self, subject, text, html_body):
+        self.subject = subject
+        self._text = Template(text)
+        self._html = Template(html_body)
+        # Préencoder le sujet (en cache pour tous les envois)
+        encoded_subject(subject)
+
+    def render(self, **fields):
+        """
+        Substitue les champs du client
+
+        Returns:
+            tuple: (sujet, corps texte, corps HTML)
+        """
+        escaped = {key: html.escape(str(value)) for key, value in fields.items()}
+        return self.subject, self._text.substitute(fields), self._html.substitute(escaped)
+
+    def render_batch(self, rows):
+        """Rend le modèle pour une liste de dicts de champs (envois en masse)"""
+        subject, text, html_body, escape = self.subject, self._text.substitute, self._html.substitute, html.escape
+        return [
+            (subject, text(fields), html_body({key: escape(str(value)) for key, value in fields.items()}))
+            for fields in rows
+        ]
+
+
+@lru_cache(maxsize=128)
+def encoded_subject(subject):
+    """Sujet encodé pour l'en-tête MIME (calculé une fois par sujet)"""
+    return Header(subject, 'utf-8').encode(linesep='\r\n')
+
+
+def _encode_body(body):
+    return base64.encodebytes(body.encode('utf-8')).replace(b'\n', b'\r\n')
+
+
+def build_message(subject, to, from_email, text_body, html_body=None):
+    """
+    Message multipart/alternative (texte puis HTML) sérialisé, prêt pour SMTP
+
+    Returns:
+        bytes: message complet (en-têtes et corps)
+    """
+    if any('\r' in value or '\n' in value for value in (to, from_email)):
+        raise ValueError("Adresse email invalide")
+    chunks = [_HEADERS(subject=encoded_subject(subject), from_email=from_email, to=to).encode('utf-8')]
+    if text_body:
+        chunks += [_PART_HEADERS['plain'], _encode_body(text_body)]
+    if html_body:
+        chunks += [_PART_HEADERS['html'], _encode_body(html_body)]
+    chunks.append(_CLOSING)
+    return b''.join(chunks)
+
+
+WELCOME = EmailTemplate(
+    subject='🎉 Bienvenue sur ERP BTP - Vos identifiants de connexion',
+    text="""
+Bienvenue sur ERP BTP !
+
+Votre instance est maintenant opérationnelle.
+
+Vos identifiants de connexion :
+- Nom d'utilisateur : $client_name
+- Mot de passe temporaire : $password
+- URL de connexion : $url
+- Formule : $plan - 30 jours gratuits
+
+Important :
+- Veuillez patienter 1-2 minutes avant de vous connecter
+- Changez votre mot de passe lors de votre première connexion
+- Conservez cet email en lieu sûr
+
+Accédez à votre ERP : $url
+
+Notre équipe support est disponible 24/7 pour vous accompagner.
+
+ERP BTP - Solution de Gestion pour le BTP
+""",
+    html_body="""
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+        .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }
+        .content { background: #f8f9fa; padding: 30px; border-radius: 0 0 10px 10px; }
+        .credentials { background: white; padding: 20px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #667eea; }
+        .credential-row { margin: 10px 0; padding: 10px; background: #f8f9fa; border-radius: 4px; }
+        .label { font-weight: bold; color: #667eea; }
+        .value { font-family: 'Courier New', monospace; color: #333; font-size: 16px; }
+        .button { display: inline-block; padding: 15px 30px; background: #667eea; color: white; text-decoration: none; border-radius: 8px; margin: 20px 0; font-weight: bold; }
+        .warning { background: #fff3cd; padding: 15px; border-left: 4px solid #ffc107; margin: 20px 0; border-radius: 4px; }
+        .footer { text-align: center; margin-top: 30px; color: #666; font-size: 12px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🎉 Bienvenue sur ERP BTP !</h1>
+            <p>Votre instance est prête</p>
+        </div>
+        <div class="content">
+            <p>Bonjour,</p>
+            <p>Félicitations ! Votre espace ERP BTP est maintenant opérationnel.</p>
+
+            <div class="credentials">
+                <h3>Vos identifiants de connexion :</h3>
+                <div class="credential-row">
+                    <span class="label">Nom d'utilisateur :</span><br>
+                    <span class="value">$client_name</span>
+                </div>
+                <div class="credential-row">
+                    <span class="label">Mot de passe temporaire :</span><br>
+                    <span class="value">$password</span>
+                </div>
+                <div class="credential-row">
+                    <span class="label">URL de connexion :</span><br>
+                    <span class="value">$url</span>
+                </div>
+                <div class="credential-row">
+                    <span class="label">Formule :</span><br>
+                    <span class="value">$plan - 30 jours gratuits</span>
+                </div>
+            </div>
+
+            <div class="warning">
+                <strong>⚠️ Important :</strong><br>
+                • Veuillez patienter 1-2 minutes après réception de cet email avant de vous connecter<br>
+                • Changez votre mot de passe lors de votre première connexion<br>
+                • Conservez cet email en lieu sûr
+            </div>
+
+            <center>
+                <a href="$url" class="button">Accéder à mon ERP BTP</a>
+            </center>
+
+            <p style="margin-top: 30px;">Si vous avez des questions, notre équipe support est disponible 24/7 pour vous accompagner.</p>
+
+            <div class="footer">
+                <p>ERP BTP - Solution de Gestion pour le BTP</p>
+                <p>Cet email a été envoyé automatiquement, merci de ne pas y répondre.</p>
+            </div>
+        </div>
+    </div>
+</body>
+</html>
+""",
+)
+
+
+def welcome_fields(client_name, password, url, plan):
+    """Champs du modèle WELCOME"""
+    return {'client_name': client_name, 'password': password, 'url': url, 'plan': plan.upper()}
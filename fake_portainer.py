@@ -0,0 +1,166 @@
+"""
+Faux serveur Portainer pour les tests et benchmarks locaux
+
+Implémente le sous-ensemble de l'API utilisé par portainer_client :
+authentification, liste/détail/création de stacks et liste des conteneurs
+(filtrée par label). Chaque stack créée a un conteneur, sain après
+startup_delay secondes. Démarre dans un thread sur un port libre de 127.0.0.1.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakePortainer:
+    """
+    Args:
+        username, password: identifiants acceptés par /api/auth
+        latency: délai artificiel (secondes) ajouté à chaque réponse
+        startup_delay: durée (secondes) du démarrage des conteneurs d'une stack créée
+    """
+
+    def __init__(self, username='admin', password='secret', latency=0.0, startup_delay=0.0):
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.startup_delay = startup_delay
+        self.stacks = []
+        self.containers = []
+        self.tokens = set()
+        self.auth_count = 0
+        self.request_count = 0
+        self.connection_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def add_stack(self, name, app_port=None):
+        with self._lock:
+            stack_id = len(self.stacks) + 1
+            env = [{'name': 'APP_PORT', 'value': str(app_port)}] if app_port else []
+            self.stacks.append({'Id': stack_id, 'Name': name, 'Env': env})
+            return stack_id
+
+    def add_container(self, public_port, project=None, ready_at=0.0):
+        self.containers.append({
+            'Labels': {'com.docker.compose.project': project} if project else {},
+            'State': 'running',
+            'Ports': [{'PrivatePort': 8080, 'PublicPort': public_port}] if public_port else [],
+            'ready_at': ready_at,
+        })
+
+    def container_view(self, container):
+        status = 'Up (healthy)' if time.monotonic() >= container['ready_at'] else 'Up (health: starting)'
+        return {**{key: value for key, value in container.items() if key != 'ready_at'}, 'Status': status}
+
+    def expire_tokens(self):
+        self.tokens.clear()
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connection_count += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b'{}')
+
+            def _authorized(self):
+                token = (self.headers.get('Authorization') or '').replace('Bearer ', '')
+                return token in fake.tokens
+
+            def do_POST(self):
+                with fake._lock:
+                    fake.request_count += 1
+                path = urlparse(self.path).path
+                payload = self._body()
+                if path == '/api/auth':
+                    with fake._lock:
+                        fake.auth_count += 1
+                    if payload.get('username') == fake.username and payload.get('password') == fake.password:
+                        token = uuid.uuid4().hex
+                        fake.tokens.add(token)
+                        return self._send(200, {'jwt': token})
+                    return self._send(422, {'message': 'Invalid credentials'})
+                if not self._authorized():
+                    return self._send(401, {'message': 'Unauthorized'})
+                if path == '/api/stacks':
+                    if any(stack['Name'] == payload.get('name') for stack in fake.stacks):
+                        return self._send(409, {'message': 'A stack with this name already exists'})
+                    with fake._lock:
+                        stack = {'Id': len(fake.stacks) + 1, 'Name': payload['name'], 'Env': payload.get('env', [])}
+                        fake.stacks.append(stack)
+                        port = {v['name']: v['value'] for v in stack['Env']}.get('APP_PORT')
+                        fake.add_container(int(port) if port else None, stack['Name'],
+                                           time.monotonic() + fake.startup_delay)
+                    return self._send(200, stack)
+                return self._send(404, {'message': 'Not found'})
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.request_count += 1
+                url = urlparse(self.path)
+                path = url.path
+                if not self._authorized():
+                    return self._send(401, {'message': 'Unauthorized'})
+                if path == '/api/stacks':
+                    return self._send(200, fake.stacks)
+                if path.startswith('/api/stacks/'):
+                    stack_id = int(path.rsplit('/', 1)[-1])
+                    for stack in fake.stacks:
+                        if stack['Id'] == stack_id:
+                            return self._send(200, stack)
+                    return self._send(404, {'message': 'Stack not found'})
+                if path.endswith('/docker/containers/json'):
+                    filters = json.loads(parse_qs(url.query).get('filters', ['{}'])[0])
+                    labels = dict(label.split('=', 1) for label in filters.get('label', []))
+                    containers = [
+                        fake.container_view(container) for container in list(fake.containers)
+                        if all(container['Labels'].get(key) == value for key, value in labels.items())
+                    ]
+                    return self._send(200, containers)
+                return self._send(404, {'message': 'Not found'})
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,158 @@
+"""
+Faux serveur SMTP pour les tests et benchmarks locaux
+
+Implémente le sous-ensemble du protocole utilisé par smtplib : EHLO/HELO,
+AUTH PLAIN, MAIL FROM, RCPT TO, DATA, RSET, NOOP et QUIT (sans STARTTLS).
+Démarre dans un thread sur un port libre de 127.0.0.1.
+"""
+import base64
+import email
+import socketserver
+import threading
+import time
+
+
+class FakeSMTP:
+    """
+    Args:
+        username, password: identifiants acceptés par AUTH PLAIN (None = pas d'authentification)
+        latency: délai artificiel (secondes) ajouté à chaque message
+        max_messages_per_connection: ferme la connexion après N messages (comme certains serveurs)
+
+    on_message, s'il est défini, est appelé (depuis le thread du serveur) avec
+    chaque message accepté.
+    """
+
+    def __init__(self, username=None, password=None, latency=0.0, max_messages_per_connection=None):
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.max_messages_per_connection = max_messages_per_connection
+        self.messages = []
+        self.on_message = None
+        self.connection_count = 0
+        self.auth_count = 0
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def fail_next(self, count=1):
+        """Les count prochains messages sont refusés avec une erreur temporaire (451)"""
+        with self._lock:
+            self._failures += count
+
+    def _take_failure(self):
+        with self._lock:
+            if self._failures:
+                self._failures -= 1
+                return True
+            return False
+
+    def start(self):
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(f"{line}\r\n".encode())
+                self.wfile.flush()
+
+            def handle(self):
+                with fake._lock:
+                    fake.connection_count += 1
+                self.reply("220 fake-smtp ESMTP")
+                sent = 0
+                sender, recipients = None, []
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode(errors='replace').rstrip('\r\n')
+                    verb = command.split(' ', 1)[0].upper()
+                    if verb == 'EHLO':
+                        extensions = ["250-fake-smtp", "250-8BITMIME"]
+                        if fake.password is not None:
+                            extensions.append("250-AUTH PLAIN")
+                        extensions.append("250 SMTPUTF8")
+                        for extension in extensions:
+                            self.reply(extension)
+                    elif verb == 'HELO':
+                        self.reply("250 fake-smtp")
+                    elif verb == 'AUTH':
+                        parts = command.split(' ')
+                        credentials = base64.b64decode(parts[2]).split(b'\0') if len(parts) > 2 else []
+                        if credentials[1:] == [fake.username.encode(), fake.password.encode()]:
+                            with fake._lock:
+                                fake.auth_count += 1
+                            self.reply("235 Authentication successful")
+                        else:
+                            self.reply("535 Authentication failed")
+                    elif verb == 'MAIL':
+                        sender, recipients = command[10:].strip('<> '), []
+                        self.reply("250 OK")
+                    elif verb == 'RCPT':
+                        recipients.append(command[8:].strip('<> '))
+                        self.reply("250 OK")
+                    elif verb == 'DATA':
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        lines = []
+                        while True:
+                            data = self.rfile.readline()
+                            if not data or data in (b'.\r\n', b'.\n'):
+                                break
+                            lines.append(data[1:] if data.startswith(b'..') else data)
+                        if fake.latency:
+                            time.sleep(fake.latency)
+                        if fake._take_failure():
+                            self.reply("451 Temporary failure")
+                        else:
+                            message = email.message_from_bytes(b''.join(lines))
+                            entry = {'from': sender, 'to': recipients, 'message': message,
+                                     'received_at': time.perf_counter()}
+                            with fake._lock:
+                                fake.messages.append(entry)
+                            if fake.on_message:
+                                fake.on_message(entry)
+                            self.reply("250 OK queued")
+                            sent += 1
+                        if fake.max_messages_per_connection and sent >= fake.max_messages_per_connection:
+                            return
+                    elif verb == 'RSET':
+                        sender, recipients = None, []
+                        self.reply("250 OK")
+                    elif verb == 'NOOP':
+                        self.reply("250 OK")
+                    elif verb == 'QUIT':
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
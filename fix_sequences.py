@@ -2,51 +2,109 @@
 """
 Script pour corriger les séquences PostgreSQL des tables
 Résout le problème de clé primaire en double après restauration de données
+
+Les séquences sont découvertes dans le catalogue (colonnes serial et identity
+de toutes les tables), puis réparées dans une seule transaction :
+- 1 requête pour lister les séquences et leur prochaine valeur
+- 1 requête pour les maxima de toutes les colonnes
+- 1 requête setval pour les seules séquences en retard
+Le nombre d'allers-retours ne dépend pas du nombre de tables.
 """
 
-from database_config import SessionLocal
+import logging
 from sqlalchemy import text
+from database_config import engine
+
+logger = logging.getLogger(__name__)
+
+# Séquences possédées par une colonne (serial : deptype 'a', identity : 'i')
+OWNED_SEQUENCES_SQL = text("""
+SELECT
+    s.oid::regclass::text AS sequence_name,
+    t.oid::regclass::text AS table_name,
+    format('%I', a.attname) AS column_name,
+    CASE WHEN ps.last_value IS NULL THEN ps.start_value
+         ELSE ps.last_value + ps.increment_by END AS next_value
+FROM pg_depend d
+JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+JOIN pg_namespace n ON n.oid = s.relnamespace
+JOIN pg_sequences ps ON ps.schemaname = n.nspname AND ps.sequencename = s.relname
+JOIN pg_class t ON t.oid = d.refobjid AND t.relkind IN ('r', 'p')
+JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = d.refobjsubid
+WHERE d.classid = 'pg_class'::regclass
+  AND d.refclassid = 'pg_class'::regclass
+  AND d.deptype IN ('a', 'i')
+  AND ps.increment_by > 0
+  AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+ORDER BY 2
+""")
+
+SETVAL_SQL = text("""
+SELECT fix.sequence_name, setval(fix.sequence_name::regclass, fix.max_id, true)
+FROM unnest(CAST(:sequences AS text[]), CAST(:max_ids AS bigint[])) AS fix(sequence_name, max_id)
+""")
+
+
+def repair_sequences(conn):
+    """
+    Recale les séquences en retard sur le MAX de leur colonne
 
-def fix_sequences():
+    Args:
+        conn: connexion SQLAlchemy dans une transaction
+
+    Returns:
+        list: dicts table, sequence, ancienne et nouvelle prochaine valeur
+            (uniquement les séquences modifiées)
+    """
+    sequences = conn.execute(OWNED_SEQUENCES_SQL).mappings().all()
+    if not sequences:
+        return []
+
+    # Maxima de toutes les colonnes en une requête (lecture de l'index de clé primaire)
+    maxima_sql = " UNION ALL ".join(
+        f"SELECT {i} AS position, MAX({row['column_name']})::bigint AS max_id FROM {row['table_name']}"
+        for i, row in enumerate(sequences)
+    )
+    maxima = dict(conn.execute(text(maxima_sql)).fetchall())
+
+    changes = [
+        {
+            'table': row['table_name'],
+            'sequence': row['sequence_name'],
+            'old_next': row['next_value'],
+            'new_next': maxima[i] + 1,
+        }
+        for i, row in enumerate(sequences)
+        if maxima[i] is not None and row['next_value'] <= maxima[i]
+    ]
+    if changes:
+        conn.execute(SETVAL_SQL, {
+            'sequences': [change['sequence'] for change in changes],
+            'max_ids': [change['new_next'] - 1 for change in changes],
+        })
+    return changes
+
+
+def fix_sequences(verbose=True):
     """Réinitialise les séquences PostgreSQL pour qu'elles correspondent aux données existantes"""
-    db = SessionLocal()
-    
     try:
-        print("🔧 Correction des séquences PostgreSQL...")
-        
-        # Liste des tables à corriger
-        tables = ['clients', 'abonnements', 'demo_requests']
-        
-        for table in tables:
-            try:
-                # Obtenir le maximum ID actuel
-                result = db.execute(text(f"SELECT MAX(id) FROM {table}"))
-                max_id = result.scalar()
-                
-                if max_id is not None:
-                    # Réinitialiser la séquence à max_id + 1
-                    sequence_name = f"{table}_id_seq"
-                    new_value = max_id + 1
-                    
-                    db.execute(text(f"SELECT setval('{sequence_name}', {new_value}, false)"))
-                    db.commit()
-                    
-                    print(f"✅ Table '{table}': séquence réinitialisée à {new_value}")
-                else:
-                    print(f"ℹ️  Table '{table}': vide, pas de correction nécessaire")
-                    
-            except Exception as e:
-                print(f"⚠️  Erreur sur la table '{table}': {e}")
-                db.rollback()
-        
-        print("\n✅ Correction des séquences terminée!")
-        print("Vous pouvez maintenant créer de nouveaux abonnements sans erreur.")
-        
-    except Exception as e:
-        print(f"❌ Erreur globale : {e}")
-        db.rollback()
-    finally:
-        db.close()
+        if verbose:
+            logger.info("🔧 Correction des séquences PostgreSQL...")
+        with engine.begin() as conn:
+            changes = repair_sequences(conn)
+        for change in changes:
+            logger.info("✅ Table '%s' : séquence %s %s -> %s",
+                        change['table'], change['sequence'], change['old_next'], change['new_next'])
+        if verbose:
+            if not changes:
+                logger.info("ℹ️ Toutes les séquences sont déjà correctes")
+            logger.info("✅ Correction des séquences terminée")
+        return changes
+    except Exception:
+        logger.exception("❌ Erreur lors de la correction des séquences")
+        return None
+
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     fix_sequences()
@@ -1,15 +1,46 @@
 """
 Script d'initialisation de la base de données
 Créé automatiquement les tables nécessaires
+
+Le schéma est géré par les révisions de migrations.py : au démarrage, une seule
+requête (révisions appliquées) suffit quand la base est à jour, sinon les
+révisions en attente sont appliquées puis les séquences vérifiées.
 """
-from database_config import Base, engine
-from models import Client, Abonnement, DemoRequest
+from contextlib import nullcontext
+from migrations import HEAD, migrate, pending_revisions
+from fix_sequences import fix_sequences
+
+
+def ensure_schema(timer=None, force=False):
+    """
+    Applique les migrations en attente
+
+    Args:
+        timer: StartupTimer optionnel recevant la durée de chaque phase
+        force: vérifier les séquences même si aucune migration n'est en attente
+
+    Returns:
+        bool: True si le schéma a été mis à jour, False s'il était déjà à jour
+    """
+    phase = timer.phase if timer else (lambda name: nullcontext())
+    with phase('schema_check'):
+        pending = pending_revisions()
+        if not pending and not force:
+            return False
+    if pending:
+        with phase('migrations'):
+            migrate(verbose=False)
+    with phase('sequences'):
+        fix_sequences(verbose=False)
+    return bool(pending)
+
 
 if __name__ == "__main__":
     print("🔧 Création des tables dans la base de données...")
     try:
-        Base.metadata.create_all(engine)
+        ensure_schema(force=True)
         print("✅ Tables créées avec succès!")
+        print(f"   Révision du schéma : {HEAD}")
         print("\nTables créées:")
         print("  - clients")
         print("  - abonnements")
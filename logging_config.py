@@ -0,0 +1,146 @@
+"""
+Configuration des logs
+
+- niveau global (LOG_LEVEL) et niveaux par module (LOG_LEVELS=provisioning=DEBUG,mail_queue=WARNING)
+- les appels de log ne font qu'empiler l'enregistrement (QueueHandler) :
+  l'écriture sur la sortie standard est faite par un thread (QueueListener),
+  jamais sur la boucle d'événements
+- les champs secrets (mots de passe, clés, jetons) sont masqués avant d'être
+  mis en file, qu'ils soient passés en extra ou écrits dans le message
+- format texte (défaut) ou JSON (LOG_FORMAT=json), une ligne par enregistrement
+
+Les logs DEBUG désactivés ne coûtent qu'un test de niveau : passer les valeurs
+en extra plutôt que de construire une f-string.
+
+    logger = logging.getLogger(__name__)
+    logger.debug("Identifiants générés", extra={'client_name': name, 'password': pwd})
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+
+# Bibliothèques bavardes en INFO (une ligne par requête HTTP, par événement du pool...),
+# remplaçables par LOG_LEVELS ; les pools SQLAlchemy journalisent sous database_config.*
+DEFAULT_LEVELS = 'sqlalchemy=WARNING,httpx=WARNING,httpcore=WARNING,database_config=WARNING'
+
+# Champs dont la valeur n'est jamais écrite
+SECRET_FIELDS = {
+    'password', 'pwd', 'initial_password', 'postgres_password', 'secret_key',
+    'token', 'jwt', 'api_key', 'smtp_password',
+}
+REDACTED = '***'
+
+# Secrets écrits dans le message lui-même : password=..., "pwd": "...", mot de passe : ...
+_SECRET_IN_TEXT_RE = re.compile(
+    r'(?i)(\b(?:' + '|'.join(sorted(SECRET_FIELDS, key=len, reverse=True)) + r'|mot de passe)\b'
+    r'["\']?\s*[:=]\s*["\']?)([^\s"\'&,;]+)'
+)
+
+# Attributs standards d'un LogRecord (tout le reste vient de extra)
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def redact_text(text):
+    return _SECRET_IN_TEXT_RE.sub(lambda m: m[1] + REDACTED, text)
+
+
+def parse_levels(spec):
+    """'provisioning=DEBUG,mail_queue=WARNING' -> {'provisioning': 'DEBUG', 'mail_queue': 'WARNING'}"""
+    levels = {}
+    for item in spec.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def record_fields(record):
+    """Champs passés en extra"""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class RedactingFilter(logging.Filter):
+    """Masque les secrets d'un enregistrement (exécuté avant la mise en file)"""
+
+    def filter(self, record):
+        for key in record_fields(record):
+            if key.lower() in SECRET_FIELDS:
+                setattr(record, key, REDACTED)
+        # Le message est figé ici : le thread d'écriture ne voit que la version masquée
+        record.msg = redact_text(record.getMessage())
+        record.args = None
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """horodatage niveau module message clé=valeur..."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_listener = None
+
+
+def setup_logging(level=LOG_LEVEL, levels=LOG_LEVELS, fmt=LOG_FORMAT, stream=None):
+    """
+    Installe le QueueHandler sur le logger racine et démarre le thread d'écriture
+    (sans effet si déjà fait)
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(RedactingFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    for name, module_level in {**parse_levels(DEFAULT_LEVELS), **parse_levels(levels)}.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Écrit les enregistrements restants et arrête le thread d'écriture"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,291 @@
+"""
+Envoi des emails sortants en arrière-plan
+
+Les messages sont enregistrés dans outbound_emails (la mise en file ne fait
+qu'une insertion) puis envoyés par une tâche de fond qui réutilise une seule
+connexion SMTP authentifiée. Les échecs sont retentés avec un délai croissant.
+Le corps d'un message, qui peut contenir le mot de passe initial du client,
+est effacé dès que le message est envoyé ou abandonné.
+"""
+import asyncio
+import logging
+import os
+import smtplib
+import time
+from datetime import datetime, timedelta
+from database_config import SessionLocal
+from models import OutboundEmail
+from email_templates import build_message
+from metrics import Histogram
+from tracing import current_span, span
+
+logger = logging.getLogger(__name__)
+
+SMTP_SEND_DURATION = Histogram('smtp_send_duration_seconds', "Durée d'envoi d'un email (connexion comprise)", ['result'])
+
+# Configuration SMTP - À adapter selon votre serveur SMTP
+SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT') or 587)
+SMTP_USER = os.getenv('SMTP_USER', 'votre-email@gmail.com')
+SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '')
+FROM_EMAIL = os.getenv('FROM_EMAIL') or SMTP_USER
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'
+
+# Nombre max de tentatives, délai de base entre tentatives (doublé à chaque échec)
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', '5'))
+MAIL_RETRY_BASE = float(os.getenv('MAIL_RETRY_BASE', '30'))
+# Intervalle de scrutation de la file et durée d'inactivité avant fermeture de la connexion SMTP
+MAIL_POLL_INTERVAL = float(os.getenv('MAIL_POLL_INTERVAL', '30'))
+SMTP_IDLE_TIMEOUT = float(os.getenv('SMTP_IDLE_TIMEOUT', '60'))
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', '20'))
+
+
+def smtp_configured():
+    """Les emails ne sont envoyés que si un mot de passe SMTP est configuré"""
+    return bool(SMTP_PASSWORD)
+
+
+class SMTPConnection:
+    """
+    Connexion SMTP persistante (appels bloquants, à utiliser depuis un thread)
+
+    La connexion est ouverte au premier envoi, réutilisée pour les suivants,
+    puis rouverte si le serveur l'a fermée entre-temps.
+    """
+
+    def __init__(self, server=SMTP_SERVER, port=SMTP_PORT, user=SMTP_USER, password=SMTP_PASSWORD,
+                 starttls=SMTP_STARTTLS, timeout=30):
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._smtp = None
+        self.last_used = 0.0
+        self.connections_opened = 0
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.password:
+            smtp.login(self.user, self.password)
+        self._smtp = smtp
+        self.connections_opened += 1
+
+    def send(self, from_email, to, msg):
+        """Envoie un message déjà sérialisé (bytes)"""
+        if self._smtp is None:
+            self._connect()
+        try:
+            self._smtp.sendmail(from_email, [to], msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # Connexion fermée par le serveur (inactivité) : une seule reconnexion
+            self._smtp = None
+            self._connect()
+            self._smtp.sendmail(from_email, [to], msg)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._smtp = None
+
+    def close_if_idle(self, idle_timeout):
+        if self._smtp is not None and time.monotonic() - self.last_used > idle_timeout:
+            self.close()
+
+
+def retry_delay(attempts, base=MAIL_RETRY_BASE):
+    """Délai avant la prochaine tentative : base, 2*base, 4*base... (plafonné à 1 h)"""
+    return timedelta(seconds=min(base * (2 ** (attempts - 1)), 3600))
+
+
+class MailSender:
+    """
+    Tâche de fond envoyant les emails en attente
+
+    Args:
+        session_factory: fabrique de sessions SQLAlchemy
+        connection: SMTPConnection réutilisée pour tous les envois
+    """
+
+    def __init__(self, session_factory=SessionLocal, connection=None, from_email=FROM_EMAIL,
+                 max_attempts=MAIL_MAX_ATTEMPTS, retry_base=MAIL_RETRY_BASE,
+                 poll_interval=MAIL_POLL_INTERVAL, idle_timeout=SMTP_IDLE_TIMEOUT):
+        self.session_factory = session_factory
+        self.connection = connection or SMTPConnection()
+        self.from_email = from_email
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.sent = 0
+        self.failed = 0
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self._traces = {}  # email_id -> traceparent du provisionnement qui l'a mis en file
+
+    def enqueue(self, to, subject, text_body, html_body=None, session=None):
+        """
+        Enregistre un email à envoyer et réveille l'expéditeur (insertion uniquement)
+
+        Returns:
+            int: ID de l'OutboundEmail
+        """
+        return self.enqueue_many([(to, subject, text_body, html_body)], session=session)[0]
+
+    def enqueue_many(self, messages, session=None):
+        """
+        Enregistre plusieurs emails en une transaction (envois en masse)
+
+        Args:
+            messages: liste de tuples (destinataire, sujet, corps texte, corps HTML)
+            session: transaction de l'appelant ; les emails sont alors mis en file
+                avec ses autres écritures (l'appelant valide puis appelle wake())
+
+        Returns:
+            list: IDs des OutboundEmail, dans l'ordre des messages
+        """
+        now = datetime.utcnow()
+        db = session or self.session_factory()
+        try:
+            emails = [
+                OutboundEmail(
+                    destinataire=to,
+                    sujet=subject,
+                    corps_texte=text_body,
+                    corps_html=html_body,
+                    statut='en_attente',
+                    tentatives=0,
+                    prochaine_tentative=now,
+                )
+                for to, subject, text_body, html_body in messages
+            ]
+            db.add_all(emails)
+            if session is not None:
+                db.flush()
+            else:
+                db.commit()
+            email_ids = [email.id for email in emails]
+        finally:
+            if session is None:
+                db.close()
+        caller = current_span()
+        if caller is not None:
+            # L'envoi, fait plus tard par la tâche de fond, est rattaché à la trace de l'appelant
+            self._traces.update(dict.fromkeys(email_ids, caller.traceparent))
+        if session is None:
+            self.wake()
+        return email_ids
+
+    async def enqueue_async(self, to, subject, text_body, html_body=None):
+        """Version non bloquante de enqueue pour les coroutines"""
+        return await asyncio.to_thread(self.enqueue, to, subject, text_body, html_body)
+
+    def wake(self):
+        """Réveille la tâche de fond (appelable depuis n'importe quel thread)"""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.connection.close)
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await asyncio.to_thread(self.process_due)
+            except Exception as e:
+                logger.warning("⚠️ Envoi des emails en attente impossible : %s", e)
+                processed = 0
+            if processed:
+                continue
+            await asyncio.to_thread(self.connection.close_if_idle, self.idle_timeout)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def process_due(self, limit=MAIL_BATCH_SIZE):
+        """
+        Envoie un lot d'emails arrivés à échéance (bloquant)
+
+        Returns:
+            int: nombre d'emails traités (envoyés ou reprogrammés)
+        """
+        db = self.session_factory()
+        try:
+            emails = (
+                db.query(OutboundEmail)
+                .filter(OutboundEmail.statut == 'en_attente', OutboundEmail.prochaine_tentative <= datetime.utcnow())
+                .order_by(OutboundEmail.prochaine_tentative)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            for email in emails:
+                start = time.perf_counter()
+                try:
+                    with span('smtp.envoi', traceparent=self._traces.get(email.id),
+                              email_id=email.id, tentative=email.tentatives + 1):
+                        msg = build_message(email.sujet, email.destinataire, self.from_email,
+                                            email.corps_texte, email.corps_html)
+                        self.connection.send(self.from_email, email.destinataire, msg)
+                except Exception as e:
+                    SMTP_SEND_DURATION.observe(time.perf_counter() - start, 'erreur')
+                    email.tentatives += 1
+                    email.derniere_erreur = str(e)
+                    if email.tentatives >= self.max_attempts:
+                        # Abandon : le corps (identifiants du client) n'est pas conservé
+                        email.statut = 'echec'
+                        email.corps_texte = None
+                        email.corps_html = None
+                        self.failed += 1
+                        self._traces.pop(email.id, None)
+                    else:
+                        email.prochaine_tentative = datetime.utcnow() + retry_delay(email.tentatives, self.retry_base)
+                    # La connexion est peut-être dans un état incohérent
+                    self.connection.close()
+                else:
+                    SMTP_SEND_DURATION.observe(time.perf_counter() - start, 'envoye')
+                    email.tentatives += 1
+                    email.statut = 'envoye'
+                    email.date_envoi = datetime.utcnow()
+                    email.corps_texte = None
+                    email.corps_html = None
+                    self.sent += 1
+                    self._traces.pop(email.id, None)
+            db.commit()
+            return len(emails)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'smtp_connections': self.connection.connections_opened,
+        }
+
+
+mail_sender = MailSender()
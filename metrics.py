@@ -0,0 +1,217 @@
+"""
+Métriques d'exécution au format texte Prometheus
+
+Compteurs, histogrammes et jauges partagés par le site commercial et l'API
+client-id, exposés sur /metrics (instrument_app). Le coût par mesure est un
+verrou non contendu et une recherche de tranche par dichotomie ; les jauges
+sont calculées uniquement à la lecture de /metrics.
+
+    REQUESTS = Histogram('http_request_duration_seconds', "Durée des requêtes", ['method', 'route', 'status'])
+    REQUESTS.observe(0.012, 'GET', '/health', '200')
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Tranches (secondes) adaptées aux requêtes HTTP et SQL comme aux étapes de provisionnement
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrique déjà déclarée : {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values.items()]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [comptes par tranche (+Inf compris), somme]
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        lines = []
+        for labels, (counts, total) in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    Jauge calculée à la lecture
+
+    Args:
+        collect: fonction retournant une valeur, ou un dict {tuple de labels: valeur}
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help, collect, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def samples(self):
+        try:
+            values = self.collect()
+        except Exception:
+            return []  # source indisponible (ex. base injoignable) : métrique absente
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values.items()]
+
+
+# Métriques communes aux deux services
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', "Durée des requêtes HTTP par route", ['method', 'route', 'status'])
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', "Durée des requêtes SQL", ['source'])
+
+
+class MetricsMiddleware:
+    """Middleware ASGI mesurant la durée des requêtes HTTP (route = modèle de chemin, pas l'URL)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = ['500']
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = str(message['status'])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                scope['method'],
+                getattr(route, 'path', None) or 'non_routee',
+                status[0],
+            )
+
+
+async def metrics_response():
+    from fastapi import Response
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+def instrument_app(app):
+    """Ajoute la mesure des requêtes et la route /metrics à une application FastAPI"""
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route('/metrics', metrics_response, methods=['GET'], include_in_schema=False)
+
+
+def watch_queries(engine, source):
+    """Mesure la durée des requêtes d'un moteur SQLAlchemy (synchrone ou asynchrone)"""
+    from sqlalchemy import event
+    target = getattr(engine, 'sync_engine', engine)
+
+    # Instant de début porté par le contexte d'exécution de la requête : une
+    # requête en erreur (after_cursor_execute non appelé) ne laisse rien derrière elle
+    @event.listens_for(target, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.metrics_query_start = time.perf_counter()
+
+    @event.listens_for(target, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, 'metrics_query_start', None)
+        if start is not None:
+            DB_QUERY_DURATION.observe(time.perf_counter() - start, source)
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Migrations de schéma versionnées
+
+Les révisions sont appliquées dans l'ordre et enregistrées dans
+schema_migrations. Les opérations sont prévues pour une base en production :
+- ajout de colonne nullable sans défaut (verrou bref, borné par lock_timeout)
+- index créés avec CREATE INDEX CONCURRENTLY (lectures et écritures non bloquées)
+- mises à jour de données par lots, chacun dans sa propre transaction
+
+Une révision peut mêler opérations transactionnelles et non transactionnelles :
+chaque opération est idempotente, une révision interrompue est donc rejouée
+sans risque au lancement suivant.
+
+Usage :
+    python migrations.py status     # révisions appliquées / en attente
+    python migrations.py dry-run    # impact estimé (verrous, lignes) sans rien modifier
+    python migrations.py upgrade    # applique les révisions en attente
+"""
+import math
+import os
+import sys
+import time
+from psycopg import errors as pg_errors
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.schema import CreateIndex
+from database_config import engine as default_engine
+from models import Base
+
+# Attente max d'un verrou par une opération transactionnelle (évite de bloquer
+# les requêtes mises en file derrière un ALTER TABLE en attente)
+MIGRATION_LOCK_TIMEOUT = os.getenv('MIGRATION_LOCK_TIMEOUT', '5s')
+# Nombre de lignes modifiées par transaction lors des mises à jour de données
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '1000'))
+
+MIGRATIONS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    revision VARCHAR(10) PRIMARY KEY,
+    description VARCHAR(255) NOT NULL,
+    date_application TIMESTAMP NOT NULL DEFAULT NOW(),
+    duree_ms INTEGER
+)
+"""
+
+# Une seule instance applique les migrations à la fois (plusieurs réplicas au démarrage)
+MIGRATION_LOCK_SQL = "SELECT pg_advisory_lock(hashtext('schema_migrations'))"
+MIGRATION_UNLOCK_SQL = "SELECT pg_advisory_unlock(hashtext('schema_migrations'))"
+
+
+def _table_exists(conn, name):
+    return conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': name}).scalar()
+
+
+def _estimated_rows(conn, table, where=None):
+    """
+    Estimation du planificateur (pas de parcours de la table)
+
+    Si la condition porte sur une colonne que la révision n'a pas encore ajoutée,
+    toutes les lignes de la table sont comptées.
+    """
+    if not _table_exists(conn, table):
+        return 0
+    if where:
+        try:
+            with conn.begin_nested():
+                return _planned_rows(conn, f"SELECT 1 FROM {table} WHERE {where}")
+        except ProgrammingError as e:
+            if not isinstance(e.orig, pg_errors.UndefinedColumn):
+                raise
+    return _planned_rows(conn, f"SELECT 1 FROM {table}")
+
+
+def _planned_rows(conn, query):
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CreateTables:
+    """Crée les tables des modèles qui n'existent pas encore (avec leurs index)"""
+
+    def __init__(self, *tables):
+        self.tables = tables
+
+    def run(self, engine):
+        with engine.begin() as conn:
+            for name in self.tables:
+                Base.metadata.tables[name].create(conn, checkfirst=True)
+
+    def impact(self, conn):
+        missing = [name for name in self.tables if not _table_exists(conn, name)]
+        return {
+            'operation': f"création des tables {', '.join(self.tables)}",
+            'verrou': 'ACCESS EXCLUSIVE (tables nouvelles uniquement)' if missing else 'aucun (tables existantes)',
+            'bloque': 'rien',
+            'lignes': 0,
+        }
+
+
+class AddColumn:
+    """Ajoute une colonne nullable sans valeur par défaut (modification du catalogue seulement)"""
+
+    def __init__(self, table, column, column_type):
+        self.table = table
+        self.column = column
+        self.column_type = column_type
+
+    def run(self, engine):
+        with engine.begin() as conn:
+            conn.execute(text(f"SET LOCAL lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'"))
+            conn.execute(text(f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS {self.column} {self.column_type}"))
+
+    def impact(self, conn):
+        exists = conn.execute(
+            text("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column
+            """),
+            {'table': self.table, 'column': self.column},
+        ).scalar()
+        return {
+            'operation': f"ajout de la colonne {self.table}.{self.column}",
+            'verrou': 'aucun (colonne existante)' if exists else f'ACCESS EXCLUSIVE bref (lock_timeout {MIGRATION_LOCK_TIMEOUT})',
+            'bloque': 'rien' if exists else 'lectures et écritures pendant quelques ms',
+            'lignes': 0 if exists else _estimated_rows(conn, self.table),
+        }
+
+
+class CreateIndexConcurrently:
+    """Index créé sans bloquer les écritures (hors transaction)"""
+
+    def __init__(self, index):
+        self.index = index
+        self.table = index.table.name
+        ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=postgresql.dialect()))
+        self.sql = ddl.replace('INDEX IF NOT EXISTS', 'INDEX CONCURRENTLY IF NOT EXISTS', 1)
+
+    def run(self, engine):
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            # Un CREATE INDEX CONCURRENTLY interrompu laisse un index invalide : on le recrée
+            invalid = conn.execute(
+                text("""
+                    SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname = :name AND c.relnamespace = current_schema()::regnamespace
+                      AND NOT i.indisvalid
+                """),
+                {'name': self.index.name},
+            ).scalar()
+            if invalid:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {self.index.name}"))
+            conn.execute(text(self.sql))
+
+    def impact(self, conn):
+        exists = _table_exists(conn, self.index.name)
+        return {
+            'operation': f"index {self.index.name} sur {self.table}",
+            'verrou': 'aucun (index existant)' if exists else 'SHARE UPDATE EXCLUSIVE (CONCURRENTLY)',
+            'bloque': 'rien' if exists else 'DDL concurrents uniquement',
+            'lignes': 0 if exists else _estimated_rows(conn, self.table),
+        }
+
+
+class Backfill:
+    """
+    Mise à jour de données par lots (une transaction par lot)
+
+    Args:
+        table: table à mettre à jour
+        assignments: clause SET
+        where: condition des lignes restant à traiter (doit devenir fausse après mise à jour)
+
+    Les lignes verrouillées par une autre transaction sont attendues (pas de
+    SKIP LOCKED) et la boucle ne s'arrête que lorsque plus aucune ligne ne
+    vérifie la condition.
+    """
+
+    def __init__(self, table, assignments, where, batch_size=None):
+        self.table = table
+        self.assignments = assignments
+        self.where = where
+        self.batch_size = batch_size or MIGRATION_BATCH_SIZE
+
+    def run(self, engine):
+        statement = text(f"""
+            UPDATE {self.table} SET {self.assignments}
+            WHERE id IN (
+                SELECT id FROM {self.table} WHERE {self.where}
+                ORDER BY id LIMIT :batch_size
+                FOR UPDATE
+            )
+        """)
+        remaining = text(f"SELECT EXISTS (SELECT 1 FROM {self.table} WHERE {self.where})")
+        total = 0
+        while True:
+            with engine.begin() as conn:
+                updated = conn.execute(statement, {'batch_size': self.batch_size}).rowcount
+                # Lot incomplet : des lignes ont pu changer pendant l'attente de leur verrou
+                done = updated < self.batch_size and not conn.execute(remaining).scalar()
+            total += updated
+            if done:
+                return total
+
+    def impact(self, conn):
+        rows = _estimated_rows(conn, self.table, self.where)
+        return {
+            'operation': f"mise à jour de {self.table} ({self.assignments})",
+            'verrou': f'ROW EXCLUSIVE, verrous de lignes par lots de {self.batch_size}',
+            'bloque': f"écritures sur les lignes du lot en cours (~{math.ceil(rows / self.batch_size)} lots)",
+            'lignes': rows,
+        }
+
+
+# Clé normalisée d'un nom de client, calculée comme client_id_api.client_key
+# (espaces de début et de fin retirés, minuscules, espaces remplacés par des points)
+def client_key_sql(column):
+    return rf"replace(lower(regexp_replace({column}, '^\s+|\s+$', '', 'g')), ' ', '.')"
+
+
+def model_indexes(table, *names):
+    """Opérations CreateIndexConcurrently pour des index déclarés dans les modèles"""
+    indexes = {index.name: index for index in Base.metadata.tables[table].indexes}
+    return [CreateIndexConcurrently(indexes[name]) for name in names]
+
+
+class Revision:
+    def __init__(self, revision, description, operations):
+        self.revision = revision
+        self.description = description
+        self.operations = operations
+
+
+# Révisions ordonnées : ne jamais modifier une révision publiée, en ajouter une nouvelle
+REVISIONS = [
+    Revision('0001', "Tables clients, abonnements et demo_requests", [
+        CreateTables('clients', 'abonnements', 'demo_requests'),
+    ]),
+    Revision('0002', "Clé normalisée des clients (API client-id)", [
+        AddColumn('clients', 'cle_client', 'VARCHAR(100)'),
+        *model_indexes('clients', 'ix_clients_cle_client'),
+    ]),
+    Revision('0003', "Index des requêtes critiques", [
+        *model_indexes('clients', 'ix_clients_nom_id'),
+        *model_indexes('abonnements', 'ix_abonnements_client_id', 'ix_abonnements_client_actif'),
+        *model_indexes('demo_requests', 'ix_demo_requests_date'),
+    ]),
+    # Mise à jour de date_fin_essai retirée : aucune demande ne la prévoyait et elle
+    # réécrivait la fin d'essai d'abonnements existants. Le numéro reste réservé.
+    Revision('0004', "Fin de période d'essai des anciens abonnements (retirée)", []),
+    Revision('0005', "Tables de provisionnement, ports et emails", [
+        CreateTables('provisioning_jobs', 'port_allocations', 'outbound_emails'),
+        *model_indexes('provisioning_jobs', 'ix_provisioning_jobs_en_cours'),
+        *model_indexes('port_allocations', 'ix_port_allocations_libre', 'ix_port_allocations_stack_name'),
+        *model_indexes('outbound_emails', 'ix_outbound_emails_a_envoyer'),
+    ]),
+    Revision('0006', "Étapes des provisionnements (reprise des jobs interrompus)", [
+        AddColumn('provisioning_jobs', 'etape', 'VARCHAR(20)'),
+        AddColumn('provisioning_jobs', 'tentatives', 'INTEGER'),
+        AddColumn('provisioning_jobs', 'client_name', 'VARCHAR(100)'),
+        AddColumn('provisioning_jobs', 'stack_id', 'VARCHAR(20)'),
+        AddColumn('provisioning_jobs', 'identifiants', 'TEXT'),
+        Backfill('provisioning_jobs',
+                 "etape = CASE WHEN statut = 'termine' THEN 'email_sent' ELSE 'client_created' END, tentatives = 1",
+                 "etape IS NULL"),
+    ]),
+    Revision('0007', "Clé normalisée des clients existants (API client-id)", [
+        # Un seul client par clé (le plus récent, celui que l'API retrouve par son nom) ;
+        # les homonymes plus anciens gardent une clé NULL, permise par l'index unique
+        Backfill('clients', f"cle_client = {client_key_sql('nom')}", f"""
+            cle_client IS NULL
+            AND id = (SELECT max(homonyme.id) FROM clients homonyme
+                      WHERE {client_key_sql('homonyme.nom')} = {client_key_sql('clients.nom')})
+            AND NOT EXISTS (SELECT 1 FROM clients existant
+                            WHERE existant.cle_client = {client_key_sql('clients.nom')})
+        """),
+    ]),
+    Revision('0008', "Corps des emails envoyés ou abandonnés effacés (identifiants)", [
+        Backfill('outbound_emails', "corps_texte = NULL, corps_html = NULL",
+                 "statut IN ('envoye', 'echec') AND (corps_texte IS NOT NULL OR corps_html IS NOT NULL)"),
+    ]),
+    Revision('0009', "Bail et nouvelles tentatives des provisionnements, identifiants effacés", [
+        AddColumn('provisioning_jobs', 'owner', 'VARCHAR(100)'),
+        AddColumn('provisioning_jobs', 'lease_until', 'TIMESTAMP'),
+        AddColumn('provisioning_jobs', 'prochaine_tentative', 'TIMESTAMP'),
+        Backfill('provisioning_jobs', "identifiants = NULL",
+                 "identifiants IS NOT NULL AND etape = 'email_sent'"),
+    ]),
+]
+
+HEAD = REVISIONS[-1].revision
+
+
+def applied_revisions(engine=default_engine):
+    """Révisions déjà appliquées (une requête ; ensemble vide si la table n'existe pas)"""
+    try:
+        with engine.connect() as conn:
+            return set(conn.execute(text("SELECT revision FROM schema_migrations")).scalars())
+    except ProgrammingError as e:
+        if isinstance(e.orig, pg_errors.UndefinedTable):
+            return set()
+        raise
+
+
+def pending_revisions(engine=default_engine):
+    applied = applied_revisions(engine)
+    return [revision for revision in REVISIONS if revision.revision not in applied]
+
+
+def migrate(engine=default_engine, verbose=True):
+    """
+    Applique les révisions en attente
+
+    Returns:
+        list: numéros des révisions appliquées
+    """
+    applied = []
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as lock_conn:
+        lock_conn.execute(text(MIGRATION_LOCK_SQL))
+        try:
+            lock_conn.execute(text(MIGRATIONS_TABLE_SQL))
+            # Relu sous le verrou : une autre instance a pu migrer entre-temps
+            for revision in pending_revisions(engine):
+                start = time.perf_counter()
+                if verbose:
+                    print(f"🔧 Migration {revision.revision} : {revision.description}")
+                for operation in revision.operations:
+                    operation.run(engine)
+                duration = int((time.perf_counter() - start) * 1000)
+                lock_conn.execute(
+                    text("""
+                        INSERT INTO schema_migrations (revision, description, duree_ms)
+                        VALUES (:revision, :description, :duree_ms)
+                    """),
+                    {'revision': revision.revision, 'description': revision.description, 'duree_ms': duration},
+                )
+                applied.append(revision.revision)
+                if verbose:
+                    print(f"✅ Migration {revision.revision} appliquée ({duration} ms)")
+        finally:
+            lock_conn.execute(text(MIGRATION_UNLOCK_SQL))
+    return applied
+
+
+def dry_run(engine=default_engine):
+    """
+    Impact estimé des révisions en attente, sans rien modifier
+
+    Returns:
+        list: dicts revision, operation, verrou, bloque, lignes
+    """
+    report = []
+    with engine.connect() as conn:
+        for revision in pending_revisions(engine):
+            for operation in revision.operations:
+                report.append({'revision': revision.revision, **operation.impact(conn)})
+        conn.rollback()
+    return report
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else 'status'
+    if command == 'upgrade':
+        applied = migrate()
+        print(f"✅ Base à jour (révision {HEAD})" if not applied else f"✅ {len(applied)} migration(s) appliquée(s)")
+    elif command == 'dry-run':
+        report = dry_run()
+        if not report:
+            print(f"✅ Aucune migration en attente (révision {HEAD})")
+        for line in report:
+            print(f"[{line['revision']}] {line['operation']}")
+            print(f"       verrou : {line['verrou']}")
+            print(f"       bloque : {line['bloque']}")
+            print(f"       lignes estimées : {line['lignes']}")
+    elif command == 'status':
+        applied = applied_revisions()
+        for revision in REVISIONS:
+            state = '✅' if revision.revision in applied else '⏳'
+            print(f"{state} {revision.revision} {revision.description}")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
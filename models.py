@@ -1,5 +1,5 @@
 from database_config import Base
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Numeric, Index, Text, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -15,6 +15,9 @@ class Client(Base):
     ville = Column(String(100))
     code_postal = Column(String(10))
     date_creation = Column(DateTime, default=datetime.utcnow)
+    # Clé normalisée du nom, renseignée par l'API client-id : sert de cible
+    # ON CONFLICT pour la recherche/création atomique (NULL pour les clients du site)
+    cle_client = Column(String(100), unique=True, index=True)
     
     # Relation vers les abonnements
     abonnements = relationship('Abonnement', back_populates='client')
@@ -34,6 +37,13 @@ class Abonnement(Base):
     # Relation vers le client
     client = relationship('Client', back_populates='abonnements')
 
+    __table_args__ = (
+        # Clé étrangère (chargement des abonnements d'un client)
+        Index('ix_abonnements_client_id', 'client_id'),
+        # Index partiel : abonnement actif d'un client (parcours /demo)
+        Index('ix_abonnements_client_actif', 'client_id', postgresql_where=text("statut = 'actif'")),
+    )
+
 class DemoRequest(Base):
     __tablename__ = 'demo_requests'
     id = Column(Integer, primary_key=True)
@@ -44,3 +54,79 @@ class DemoRequest(Base):
     effectif = Column(String(20), nullable=True)
     plan_choisi = Column(String(50), nullable=True)
     date = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Rapports par période
+        Index('ix_demo_requests_date', 'date'),
+    )
+
+class ProvisioningJob(Base):
+    __tablename__ = 'provisioning_jobs'
+    id = Column(Integer, primary_key=True)
+    client_id = Column(Integer, ForeignKey('clients.id'), nullable=False)
+    abonnement_id = Column(Integer, ForeignKey('abonnements.id'))
+    plan = Column(String(50), nullable=False)
+    statut = Column(String(20), nullable=False, default='en_attente')  # en_attente, en_cours, termine, echec
+    message = Column(Text)  # Dernier message de progression ou d'erreur
+    app_port = Column(String(10))
+    date_creation = Column(DateTime, nullable=False, default=datetime.utcnow)
+    date_debut = Column(DateTime)
+    date_fin = Column(DateTime)
+    # Dernière étape terminée (provisioning.STEPS) : une reprise continue à l'étape suivante
+    etape = Column(String(20), default='client_created')
+    tentatives = Column(Integer, default=0)
+    client_name = Column(String(100))
+    stack_id = Column(String(20))
+    # Identifiants générés (JSON), conservés pour reprendre la création de la stack ;
+    # vidés une fois l'email de bienvenue mis en file ou le job abandonné
+    identifiants = Column(Text)
+    # Worker qui exécute le job et fin de son bail (renouvelé pendant l'exécution) :
+    # un job 'en_cours' dont le bail a expiré est repris par un autre worker
+    owner = Column(String(100))
+    lease_until = Column(DateTime)
+    # Job en échec : date de la prochaine tentative (délai doublé à chaque tentative)
+    prochaine_tentative = Column(DateTime)
+
+    __table_args__ = (
+        # Jobs non terminés (supervision, reprise au démarrage)
+        Index('ix_provisioning_jobs_en_cours', 'statut', postgresql_where=text("statut IN ('en_attente', 'en_cours')")),
+    )
+
+class PortAllocation(Base):
+    __tablename__ = 'port_allocations'
+    # La clé primaire garantit qu'un port n'est attribué qu'une fois
+    port = Column(Integer, primary_key=True, autoincrement=False)
+    statut = Column(String(20), nullable=False, default='reserve')  # reserve, attribue, libre, externe
+    client_id = Column(Integer, ForeignKey('clients.id'))
+    stack_name = Column(String(100))
+    date_maj = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Réutilisation des ports libérés (plus petit port libre)
+        Index('ix_port_allocations_libre', 'port', postgresql_where=text("statut = 'libre'")),
+        Index('ix_port_allocations_stack_name', 'stack_name'),
+    )
+
+class OutboundEmail(Base):
+    __tablename__ = 'outbound_emails'
+    id = Column(Integer, primary_key=True)
+    destinataire = Column(String(100), nullable=False)
+    sujet = Column(String(255), nullable=False)
+    # Corps vidés après l'envoi ou l'abandon (ils peuvent contenir des identifiants)
+    corps_texte = Column(Text)
+    corps_html = Column(Text)
+    statut = Column(String(20), nullable=False, default='en_attente')  # en_attente, envoye, echec
+    tentatives = Column(Integer, nullable=False, default=0)
+    prochaine_tentative = Column(DateTime, nullable=False, default=datetime.utcnow)
+    derniere_erreur = Column(Text)
+    date_creation = Column(DateTime, nullable=False, default=datetime.utcnow)
+    date_envoi = Column(DateTime)
+
+    __table_args__ = (
+        # Messages à envoyer, par échéance
+        Index('ix_outbound_emails_a_envoyer', 'prochaine_tentative', postgresql_where=text("statut = 'en_attente'")),
+    )
+
+# Recherche du dernier client par nom (API client-id) :
+# WHERE nom = ... ORDER BY id DESC et DISTINCT ON (nom) ... ORDER BY nom, id DESC
+Index('ix_clients_nom_id', Client.nom, Client.id.desc())
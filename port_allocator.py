@@ -0,0 +1,234 @@
+"""
+Registre d'attribution des ports applicatifs des stacks clients
+
+Chaque port est une ligne de port_allocations (clé primaire = port) :
+la réservation est atomique et ne dépend pas du nombre de stacks existantes.
+Un port libéré est réutilisé en priorité, sinon le port suivant le plus
+grand port connu est pris (MAX sur la clé primaire, lecture d'index).
+Une tâche de fond réconcilie périodiquement le registre avec Portainer ; le
+premier passage doit réussir avant toute réservation, sans quoi un registre
+vide attribuerait des ports déjà publiés par des stacks existantes.
+"""
+import asyncio
+import logging
+import os
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from database_config import engine
+from portainer_client import PORTAINER_BASE_PORT, get_portainer_client
+
+logger = logging.getLogger(__name__)
+
+# Intervalle de réconciliation avec Portainer (secondes)
+PORT_RECONCILE_INTERVAL = float(os.getenv('PORT_RECONCILE_INTERVAL', '300'))
+# Délai avant un nouvel essai après un échec (secondes, doublé à chaque échec
+# jusqu'à l'intervalle de réconciliation)
+PORT_RECONCILE_RETRY = float(os.getenv('PORT_RECONCILE_RETRY', '5'))
+# Délai après lequel une réservation sans stack est considérée abandonnée (minutes)
+PORT_RESERVATION_TTL = int(os.getenv('PORT_RESERVATION_TTL', '30'))
+# Taille de la plage de ports gérée à partir du port de base
+PORT_RANGE_SIZE = int(os.getenv('PORT_RANGE_SIZE', '1000'))
+
+_EXISTING_SQL = text("""
+SELECT port FROM port_allocations
+WHERE stack_name = :stack_name AND statut IN ('reserve', 'attribue')
+LIMIT 1
+""")
+
+_REUSE_SQL = text("""
+UPDATE port_allocations
+SET statut = 'reserve', client_id = :client_id, stack_name = :stack_name, date_maj = NOW()
+WHERE port = (
+    SELECT port FROM port_allocations
+    WHERE statut = 'libre'
+    ORDER BY port
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING port
+""")
+
+# Sérialise les ajouts en fin de plage (verrou relâché à la fin de la transaction)
+_APPEND_LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtext('port_allocations'))")
+
+_NEXT_PORT_SQL = "SELECT GREATEST(COALESCE(MAX(port) + 1, :base_port), :base_port) AS port FROM port_allocations"
+
+# Port suivant le plus grand port connu, sans dépasser la plage gérée
+_APPEND_SQL = text(f"""
+INSERT INTO port_allocations (port, statut, client_id, stack_name, date_maj)
+SELECT port, 'reserve', :client_id, :stack_name, NOW()
+FROM ({_NEXT_PORT_SQL}) AS suivant
+WHERE port < :base_port + :range_size
+ON CONFLICT (port) DO NOTHING
+RETURNING port
+""")
+
+
+def reserve_port(client_id, stack_name, base_port=PORTAINER_BASE_PORT, attempts=5, range_size=None):
+    """
+    Réserve un port pour une stack (idempotent : une stack garde son port)
+
+    Returns:
+        int: port réservé
+
+    Raises:
+        RuntimeError: plage de ports épuisée, ou réservations concurrentes répétées
+    """
+    range_size = range_size or PORT_RANGE_SIZE
+    params = {'client_id': client_id, 'stack_name': stack_name, 'base_port': base_port, 'range_size': range_size}
+    for _ in range(attempts):
+        try:
+            with engine.begin() as conn:
+                port = conn.execute(_EXISTING_SQL, params).scalar()
+                if port is None:
+                    port = conn.execute(_REUSE_SQL, params).scalar()
+                if port is None:
+                    conn.execute(_APPEND_LOCK_SQL)
+                    port = conn.execute(_APPEND_SQL, params).scalar()
+                    if port is None and conn.execute(text(_NEXT_PORT_SQL), params).scalar() >= base_port + range_size:
+                        raise RuntimeError(
+                            f"Plage de ports épuisée ({base_port}-{base_port + range_size - 1}) pour {stack_name}"
+                        )
+            if port is not None:
+                return port
+        except IntegrityError:
+            pass
+        # Une réservation concurrente a pris le même port : on recommence
+    raise RuntimeError(f"Impossible de réserver un port pour {stack_name}")
+
+
+def confirm_port(port):
+    """Marque le port comme attribué à une stack créée"""
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE port_allocations SET statut = 'attribue', date_maj = NOW() WHERE port = :port"),
+            {'port': port},
+        )
+
+
+def release_port(port, only_reserved=False):
+    """
+    Libère un port (création échouée ou stack supprimée)
+
+    Args:
+        only_reserved: ne libérer que si le port n'a jamais été confirmé
+            (évite de libérer le port d'une stack existante après un échec)
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            text(f"""
+                UPDATE port_allocations
+                SET statut = 'libre', client_id = NULL, stack_name = NULL, date_maj = NOW()
+                WHERE port = :port {"AND statut = 'reserve'" if only_reserved else ""}
+            """),
+            {'port': port},
+        )
+
+
+def database_time():
+    """Heure courante de la base, dans le fuseau de date_maj"""
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT LOCALTIMESTAMP")).scalar()
+
+
+def apply_reconciliation(used_ports, stack_names, base_port=PORTAINER_BASE_PORT, started=None):
+    """
+    Aligne le registre sur l'état réel de Portainer
+
+    Args:
+        used_ports: ports publiés par les stacks et conteneurs
+        stack_names: noms des stacks existantes
+        base_port: début de la plage gérée (les ports hors plage sont ignorés)
+        started: heure de la base avant la lecture de Portainer ; les lignes
+            modifiées depuis (port confirmé pendant la lecture) ne sont pas libérées
+
+    Returns:
+        dict: nombre de ports marqués externes et libérés
+    """
+    in_range = sorted(port for port in used_ports if base_port <= port < base_port + PORT_RANGE_SIZE)
+    with engine.begin() as conn:
+        # Ports occupés hors registre (stacks créées avant le registre, autres conteneurs)
+        externes = conn.execute(
+            text("""
+                INSERT INTO port_allocations (port, statut, date_maj)
+                SELECT port, 'externe', NOW() FROM unnest(CAST(:ports AS integer[])) AS t(port)
+                ON CONFLICT (port) DO UPDATE SET statut = 'externe', date_maj = NOW()
+                WHERE port_allocations.statut = 'libre'
+                RETURNING port
+            """),
+            {'ports': in_range},
+        ).fetchall()
+        # Ports dont la stack a disparu, ou réservés depuis trop longtemps sans stack
+        liberes = conn.execute(
+            text("""
+                UPDATE port_allocations
+                SET statut = 'libre', client_id = NULL, stack_name = NULL, date_maj = NOW()
+                WHERE NOT (port = ANY(CAST(:ports AS integer[])))
+                  AND (stack_name IS NULL OR NOT (stack_name = ANY(CAST(:stacks AS text[]))))
+                  AND date_maj < COALESCE(CAST(:started AS timestamp), LOCALTIMESTAMP)
+                  AND (
+                      statut IN ('attribue', 'externe')
+                      OR (statut = 'reserve' AND date_maj < NOW() - make_interval(mins => :ttl))
+                  )
+                RETURNING port
+            """),
+            {'ports': sorted(used_ports), 'stacks': sorted(stack_names), 'ttl': PORT_RESERVATION_TTL,
+             'started': started},
+        ).fetchall()
+    return {'externes': len(externes), 'liberes': len(liberes)}
+
+
+async def reconcile_ports(client=None):
+    """Interroge Portainer puis réconcilie le registre"""
+    client = client or get_portainer_client()
+    started = await asyncio.to_thread(database_time)
+    stacks = await client.list_stacks()
+    used_ports = await client.used_ports(stacks)
+    stack_names = [stack.get('Name') for stack in stacks if stack.get('Name')]
+    return await asyncio.to_thread(apply_reconciliation, used_ports, stack_names, started=started)
+
+
+class PortReconciler:
+    """
+    Tâche de fond réconciliant le registre avec Portainer à intervalle régulier
+
+    À démarrer une fois les migrations appliquées ; wait_reconciled() rend la
+    main après le premier passage réussi (un échec est retenté après retry
+    secondes, délai doublé à chaque échec).
+    """
+
+    def __init__(self, interval=PORT_RECONCILE_INTERVAL, retry=PORT_RECONCILE_RETRY):
+        self.interval = interval
+        self.retry = retry
+        self.reconciled = None
+        self._task = None
+
+    def start(self):
+        self.reconciled = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    async def wait_reconciled(self):
+        """Attend le premier passage réussi"""
+        await self.reconciled.wait()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        delay = self.retry
+        while True:
+            try:
+                result = await reconcile_ports()
+            except Exception as e:
+                logger.warning("⚠️ Réconciliation des ports impossible (nouvel essai dans %.0f s) : %s", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.interval)
+                continue
+            if result['externes'] or result['liberes']:
+                logger.info("🔄 Registre des ports réconcilié : %s", result)
+            self.reconciled.set()
+            delay = self.retry
+            await asyncio.sleep(self.interval)
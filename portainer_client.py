@@ -0,0 +1,305 @@
+"""
+Client Portainer asynchrone
+
+Remplace les appels curl de create-client-stack.sh : une seule session HTTP
+keep-alive est conservée pour tout le processus et le jeton JWT est mis en
+cache puis renouvelé uniquement lorsqu'il expire (réponse 401).
+"""
+import asyncio
+import json
+import os
+import time
+import httpx
+from provisioning_events import ERROR, HEALTHY, PORT_ASSIGNED, STACK_CREATED, STEP, ProgressEvent
+from tracing import inject_headers, span
+
+# Configuration Portainer (mêmes valeurs par défaut que create-client-stack.sh)
+PORTAINER_URL = os.getenv('PORTAINER_URL', 'https://host.docker.internal:9443')
+PORTAINER_USER = os.getenv('PORTAINER_USER', 'fred')
+# Pas de valeur par défaut : à fournir par l'environnement (.env)
+PORTAINER_PASSWORD = os.getenv('PORTAINER_PASSWORD', '')
+PORTAINER_ENDPOINT_ID = os.getenv('PORTAINER_ENDPOINT_ID', '2')
+PORTAINER_BASE_PORT = int(os.getenv('PORTAINER_BASE_PORT', '8080'))
+PORTAINER_VERIFY_TLS = os.getenv('PORTAINER_VERIFY_TLS', 'false').lower() == 'true'
+PORTAINER_TIMEOUT = float(os.getenv('PORTAINER_TIMEOUT', '30'))
+# Attente max du démarrage des conteneurs d'une nouvelle stack et intervalle de vérification (s)
+STACK_HEALTH_TIMEOUT = float(os.getenv('STACK_HEALTH_TIMEOUT', '600'))
+STACK_HEALTH_INTERVAL = float(os.getenv('STACK_HEALTH_INTERVAL', '5'))
+
+# Dépôt Git déployé pour chaque client
+STACK_REPOSITORY_URL = 'https://github.com/fvictoire59va/ERP-BTP'
+STACK_REPOSITORY_REF = 'refs/heads/main'
+STACK_COMPOSE_FILE = 'docker-compose.portainer.yml'
+
+
+class PortainerError(Exception):
+    """Erreur renvoyée par l'API Portainer"""
+
+
+def compose_escape(value):
+    """Échappe les $ pour Docker Compose ($ devient $$)"""
+    return str(value).replace('$', '$$')
+
+
+class PortainerClient:
+    """
+    Client de l'API REST Portainer
+
+    Args:
+        url: URL de base de Portainer
+        username, password: identifiants Portainer
+        endpoint_id: ID de l'environnement Docker cible
+        verify_tls: vérifier le certificat (Portainer utilise souvent un certificat auto-signé)
+    """
+
+    def __init__(self, url=PORTAINER_URL, username=PORTAINER_USER, password=PORTAINER_PASSWORD,
+                 endpoint_id=PORTAINER_ENDPOINT_ID, verify_tls=PORTAINER_VERIFY_TLS, timeout=PORTAINER_TIMEOUT):
+        self.url = url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.endpoint_id = str(endpoint_id)
+        self._http = httpx.AsyncClient(base_url=self.url, verify=verify_tls, timeout=timeout)
+        self._token = None
+        self._auth_lock = asyncio.Lock()
+
+    async def close(self):
+        await self._http.aclose()
+
+    async def authenticate(self, force=False):
+        """Retourne le JWT en cache, ou s'authentifie si nécessaire"""
+        async with self._auth_lock:
+            if self._token and not force:
+                return self._token
+            if not self.password:
+                raise PortainerError("PORTAINER_PASSWORD n'est pas défini : impossible de s'authentifier à Portainer")
+            with span('portainer.auth') as current:
+                response = await self._http.post('/api/auth', headers=inject_headers(), json={
+                    'username': self.username,
+                    'password': self.password,
+                })
+                current.set(status=response.status_code)
+            token = response.json().get('jwt') if response.status_code == 200 else None
+            if not token:
+                raise PortainerError(f"Impossible de s'authentifier à Portainer : {response.text}")
+            self._token = token
+            return token
+
+    async def request(self, method, path, **kwargs):
+        """Requête authentifiée ; ré-authentifie une fois si le jeton a expiré"""
+        response = await self._send(method, path, await self.authenticate(), **kwargs)
+        if response.status_code == 401:
+            response = await self._send(method, path, await self.authenticate(force=True), **kwargs)
+        if response.status_code >= 400:
+            raise PortainerError(f"{method} {path} : HTTP {response.status_code} - {response.text}")
+        return response.json()
+
+    async def _send(self, method, path, token, **kwargs):
+        with span(f'portainer {method} {path}') as current:
+            response = await self._http.request(
+                method, path, headers=inject_headers({'Authorization': f'Bearer {token}'}), **kwargs)
+            current.set(status=response.status_code)
+        return response
+
+    async def list_stacks(self):
+        return await self.request('GET', '/api/stacks')
+
+    async def get_stack(self, stack_id):
+        return await self.request('GET', f'/api/stacks/{stack_id}')
+
+    async def list_containers(self):
+        """Conteneurs de l'environnement (équivalent de docker ps via Portainer)"""
+        return await self.request('GET', f'/api/endpoints/{self.endpoint_id}/docker/containers/json')
+
+    async def find_stack(self, name):
+        """Stack portant ce nom (avec son env), None si elle n'existe pas"""
+        for stack in await self.list_stacks():
+            if stack.get('Name') == name:
+                if stack.get('Env') is None:
+                    stack = await self.get_stack(stack['Id'])
+                return stack
+        return None
+
+    async def stack_containers(self, name):
+        """Conteneurs d'une stack (projet compose du même nom), arrêtés compris"""
+        return await self.request(
+            'GET',
+            f'/api/endpoints/{self.endpoint_id}/docker/containers/json',
+            params={'all': 1, 'filters': json.dumps({'label': [f'com.docker.compose.project={name}']})},
+        )
+
+    async def create_repository_stack(self, name, env):
+        """Crée une stack compose depuis le dépôt Git des instances clients"""
+        return await self.request(
+            'POST',
+            '/api/stacks',
+            params={'type': 2, 'method': 'repository', 'endpointId': self.endpoint_id},
+            json={
+                'name': name,
+                'repositoryURL': STACK_REPOSITORY_URL,
+                'repositoryReferenceName': STACK_REPOSITORY_REF,
+                'composeFile': STACK_COMPOSE_FILE,
+                'env': [{'name': key, 'value': str(value)} for key, value in env.items()],
+            },
+        )
+
+    async def used_ports(self, stacks=None):
+        """Ports utilisés par les stacks (variable APP_PORT) et les conteneurs publiés"""
+        if stacks is None:
+            stacks = await self.list_stacks()
+        ports = set()
+        for stack in stacks:
+            env = stack.get('Env')
+            if env is None:
+                # Anciennes versions de Portainer : l'env n'est pas inclus dans la liste
+                env = (await self.get_stack(stack['Id'])).get('Env') or []
+            for variable in env:
+                if variable.get('name') == 'APP_PORT' and str(variable.get('value', '')).isdigit():
+                    ports.add(int(variable['value']))
+        for container in await self.list_containers():
+            for published in container.get('Ports') or []:
+                if published.get('PublicPort'):
+                    ports.add(int(published['PublicPort']))
+        return ports
+
+
+def stack_env(stack):
+    return {variable.get('name'): variable.get('value') for variable in stack.get('Env') or []}
+
+
+def containers_healthy(containers):
+    """Tous les conteneurs démarrés, sans healthcheck en cours ou en échec"""
+    return bool(containers) and all(
+        container.get('State') == 'running'
+        and '(health: starting)' not in (container.get('Status') or '')
+        and '(unhealthy)' not in (container.get('Status') or '')
+        for container in containers
+    )
+
+
+def next_free_port(used_ports, base_port=PORTAINER_BASE_PORT):
+    """Premier port libre à partir de base_port"""
+    port = base_port
+    while port in used_ports:
+        port += 1
+    return port
+
+
+_client = None
+
+
+def get_portainer_client():
+    """Client partagé par tous les provisionnements du processus"""
+    global _client
+    if _client is None:
+        _client = PortainerClient()
+    return _client
+
+
+async def close_portainer_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def create_client_stack_api(client_id, client_name, postgres_password, secret_key, initial_password,
+                                  progress_callback=None, client=None, app_port=None):
+    """
+    Crée la stack d'un client via l'API Portainer (équivalent de create-client-stack.sh)
+
+    Si app_port est fourni (port réservé dans le registre), les ports utilisés
+    ne sont pas recherchés. La progression est émise sous forme de ProgressEvent,
+    comme pour la sortie du script.
+
+    Returns:
+        tuple: (success: bool, message: str, port: str | None)
+    """
+    def update_progress(message):
+        if progress_callback:
+            progress_callback(message)
+
+    client = client or get_portainer_client()
+    try:
+        update_progress(ProgressEvent(STEP, "🔐 Authentification à Portainer...", step=1, total=4))
+        await client.authenticate()
+
+        update_progress(ProgressEvent(STEP, "🔍 Récupération des stacks existantes...", step=2, total=4))
+        stacks = await client.list_stacks()
+        stack_name = f"client_{client_id}"
+        if any(stack.get('Name') == stack_name for stack in stacks):
+            message = f"Une stack pour le client ID {client_id} existe deja!"
+            update_progress(ProgressEvent(ERROR, f"❌ {message}"))
+            return False, message, None
+
+        client_count = sum(1 for stack in stacks if stack.get('Name', '').startswith(f"client-{client_name}_"))
+        client_number = client_count + 1
+        if app_port is None:
+            app_port = next_free_port(await client.used_ports(stacks))
+        update_progress(ProgressEvent(PORT_ASSIGNED, f"Port application attribué : {app_port}", port=str(app_port)))
+
+        update_progress(ProgressEvent(STEP, f"🚀 Création de la stack '{stack_name}' sur Portainer...", step=3, total=4))
+        created = await client.create_repository_stack(stack_name, {
+            'POSTGRES_PASSWORD': compose_escape(postgres_password),
+            'SECRET_KEY': compose_escape(secret_key),
+            'INITIAL_USERNAME': compose_escape(client_name),
+            'INITIAL_PASSWORD': compose_escape(initial_password),
+            'CLIENT_ID': client_id,
+            'CLIENT_NAME': compose_escape(client_name),
+            'CLIENT_NUMBER': client_number,
+            'APP_PORT': app_port,
+        })
+        if not created.get('Id'):
+            message = f"Impossible de creer la stack : {created}"
+            update_progress(ProgressEvent(ERROR, f"❌ {message}"))
+            return False, message, None
+
+        update_progress(ProgressEvent(STACK_CREATED, f"✅ Stack créée avec succès pour {client_name}", stack_id=str(created['Id'])))
+        return True, f"Stack {stack_name} creee avec succes (ID: {created['Id']}, port {app_port})", str(app_port)
+
+    except (PortainerError, httpx.HTTPError) as e:
+        update_progress(ProgressEvent(ERROR, f"❌ Erreur Portainer : {str(e)}"))
+        return False, f"Erreur lors de la création de la stack : {str(e)}", None
+
+
+async def find_client_stack(client_id, initial_password, client=None):
+    """
+    Stack créée pour ce client par une tentative précédente du même provisionnement
+
+    Elle n'est reprise que si son mot de passe initial est celui du job : une
+    stack plus ancienne du même client n'est jamais réutilisée.
+
+    Returns:
+        tuple | None: (stack_id, port)
+    """
+    client = client or get_portainer_client()
+    stack = await client.find_stack(f"client_{client_id}")
+    if stack is None:
+        return None
+    env = stack_env(stack)
+    if env.get('INITIAL_PASSWORD') != compose_escape(initial_password):
+        return None
+    return str(stack['Id']), env.get('APP_PORT')
+
+
+async def wait_stack_healthy(stack_name, progress_callback=None, timeout=STACK_HEALTH_TIMEOUT,
+                             interval=STACK_HEALTH_INTERVAL, client=None):
+    """
+    Attend que les conteneurs de la stack soient démarrés (et sains s'ils ont un healthcheck)
+
+    Returns:
+        bool: False si la stack n'est pas prête au bout de timeout secondes
+            (timeout <= 0 : pas d'attente)
+    """
+    if timeout <= 0:
+        return True
+    client = client or get_portainer_client()
+    deadline = time.monotonic() + timeout
+    while True:
+        containers = await client.stack_containers(stack_name)
+        if containers_healthy(containers):
+            if progress_callback:
+                progress_callback(ProgressEvent(HEALTHY, "✅ Instance démarrée", containers=len(containers)))
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(interval)
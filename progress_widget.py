@@ -0,0 +1,100 @@
+"""
+Affichage de la progression d'un provisionnement
+
+Les derniers messages sont affichés dans un nombre fixe de labels créés une
+seule fois et mis à jour sur place. Les rafales de messages sont regroupées :
+l'affichage est rafraîchi au plus PROGRESS_MAX_FPS fois par seconde, et
+seulement si un message est arrivé depuis le rafraîchissement précédent.
+"""
+import os
+import re
+from collections import deque
+from nicegui import ui
+
+# Nombre de messages visibles et rafraîchissements maximum par seconde
+PROGRESS_LINES = int(os.getenv('PROGRESS_LINES', '4'))
+PROGRESS_MAX_FPS = float(os.getenv('PROGRESS_MAX_FPS', '5'))
+
+# Pictogrammes (symboles techniques, divers, dingbats, emojis) et sélecteur de variante
+_ICONS_RE = re.compile('[⌀-⏿☀-➿\U0001F300-\U0001FAFF]️?')
+
+
+def strip_icons(message):
+    """Retire les pictogrammes d'un message en une seule passe"""
+    return _ICONS_RE.sub('', message).strip()
+
+
+class ProgressRing:
+    """
+    Derniers messages reçus ; les messages arrivés entre deux images sont fusionnés
+
+    Args:
+        size: nombre de messages conservés
+    """
+
+    def __init__(self, size=PROGRESS_LINES):
+        self.size = size
+        self.messages = deque(maxlen=size)
+        self.dirty = False
+        self.received = 0
+        self.frames = 0
+
+    def push(self, message):
+        self.messages.append(strip_icons(message))
+        self.received += 1
+        self.dirty = True
+
+    def take(self):
+        """Textes des lignes (du plus ancien au plus récent), None si rien n'a changé"""
+        if not self.dirty:
+            return None
+        self.dirty = False
+        self.frames += 1
+        return list(self.messages) + [''] * (self.size - len(self.messages))
+
+    @property
+    def latest(self):
+        return self.messages[-1] if self.messages else ''
+
+
+class ProgressWidget:
+    """
+    Titre (dernier message) et lignes de progression, à créer dans le conteneur courant
+
+    Args:
+        initial_text: titre affiché avant le premier message
+        size: nombre de lignes visibles
+        max_fps: rafraîchissements maximum par seconde
+    """
+
+    def __init__(self, initial_text, size=PROGRESS_LINES, max_fps=PROGRESS_MAX_FPS):
+        self.ring = ProgressRing(size)
+        self.title = ui.label(initial_text).classes('text-xl font-semibold mb-6 text-center text-gray-800')
+        # Container pour les messages (nombre de lignes fixe, pas de scroll)
+        with ui.card().classes('w-full bg-gradient-to-br from-blue-50 to-indigo-50 shadow-none border-none p-6'):
+            with ui.column().classes('w-full gap-3'):
+                self.lines = [ui.label('').classes('text-base text-gray-700') for _ in range(size)]
+        for label in self.lines:
+            label.set_visibility(False)
+        self._timer = ui.timer(1 / max_fps, self.flush)
+
+    def push(self, message):
+        """Enregistre un message ; il sera affiché à la prochaine image"""
+        self.ring.push(message)
+
+    def flush(self):
+        texts = self.ring.take()
+        if texts is None:
+            return
+        # Seuls les labels dont le texte change sont envoyés au navigateur
+        for label, text in zip(self.lines, texts):
+            if label.text != text:
+                label.set_text(text)
+                label.set_visibility(bool(text))
+        if self.title.text != self.ring.latest:
+            self.title.set_text(self.ring.latest)
+
+    def stop(self):
+        """Affiche les derniers messages et arrête le rafraîchissement"""
+        self.flush()
+        self._timer.cancel()
@@ -0,0 +1,468 @@
+"""
+File d'attente des provisionnements d'instances clients
+
+L'inscription enregistre un ProvisioningJob et rend la main immédiatement ;
+un nombre borné de workers exécute ensuite la création des stacks, ce qui
+évite qu'un pic d'inscriptions lance des dizaines de scripts en parallèle.
+Les pages s'abonnent à la progression d'un job par son identifiant et
+reçoivent des ProgressEvent horodatés depuis la soumission du job.
+
+Un provisionnement est une suite d'étapes (STEPS) ; la dernière étape
+terminée est enregistrée sur le job avec ce qu'il faut pour continuer
+(port, stack, identifiants). Un job interrompu (arrêt du site, timeout)
+reprend à l'étape suivante au redémarrage au lieu de tout recommencer.
+
+Un worker prend un job de façon atomique (claim_job) et le garde par un bail
+renouvelé pendant l'exécution : un job dont le worker a disparu est repris
+à l'expiration du bail, un job en échec est retenté après un délai croissant.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, update
+from database_config import session_scope
+from models import Client, ProvisioningJob
+from metrics import Counter, Histogram
+from provisioning_events import DONE, STARTED, LatencyStats, ProgressEvent, ProgressTracker, as_event
+from tracing import TRACE_SLOW_MS, span
+
+logger = logging.getLogger(__name__)
+
+PROVISIONING_PHASE = Histogram(
+    'provisioning_phase_seconds', "Délai de chaque étape du provisionnement depuis la soumission du job", ['phase'])
+PROVISIONING_JOBS = Counter('provisioning_jobs_total', "Provisionnements terminés", ['result'])
+
+# Nombre de provisionnements exécutés simultanément
+PROVISIONING_MAX_WORKERS = int(os.getenv('PROVISIONING_MAX_WORKERS', '2'))
+# Nombre de jobs pouvant attendre un worker avant de refuser les inscriptions
+PROVISIONING_MAX_PENDING = int(os.getenv('PROVISIONING_MAX_PENDING', '50'))
+# Exécutions max d'un job (première tentative comprise) et ancienneté max (heures)
+# des jobs repris au démarrage
+PROVISIONING_MAX_ATTEMPTS = int(os.getenv('PROVISIONING_MAX_ATTEMPTS', '3'))
+PROVISIONING_RESUME_MAX_AGE = float(os.getenv('PROVISIONING_RESUME_MAX_AGE', '24'))
+# Délai avant une nouvelle tentative d'un job en échec (secondes, doublé à chaque tentative)
+PROVISIONING_RETRY_BASE = float(os.getenv('PROVISIONING_RETRY_BASE', '60'))
+# Durée du bail d'un job en cours (secondes, renouvelé pendant l'exécution) et
+# intervalle de recherche des jobs à reprendre (échecs à retenter, baux expirés)
+PROVISIONING_LEASE = float(os.getenv('PROVISIONING_LEASE', '120'))
+PROVISIONING_RESUME_INTERVAL = float(os.getenv('PROVISIONING_RESUME_INTERVAL', '60'))
+
+# Étapes d'un provisionnement, dans l'ordre. client_created est atteinte à
+# l'inscription (client, abonnement et job validés ensemble).
+STEPS = ('client_created', 'port_reserved', 'stack_created', 'healthy', 'email_sent')
+
+
+class ProvisioningQueueFull(Exception):
+    """Levée quand trop de provisionnements sont déjà en attente"""
+
+
+def retry_delay(attempts, base=PROVISIONING_RETRY_BASE):
+    """Délai avant la prochaine tentative : base, 2*base, 4*base... (plafonné à 1 h)"""
+    return timedelta(seconds=min(base * (2 ** (attempts - 1)), 3600))
+
+
+def update_job(job_id, db=None, owner=None, **fields):
+    """
+    Met à jour l'enregistrement d'un job (appel bloquant, à exécuter hors boucle)
+
+    Args:
+        db: session à utiliser (validée par l'appelant) ; une transaction dédiée sinon
+        owner: ne modifie le job que s'il est encore détenu par ce worker
+    """
+    with span('db.update_job', job_id=job_id, statut=fields.get('statut'), etape=fields.get('etape')):
+        if db is not None:
+            return _update_job(db, job_id, owner, fields)
+        with session_scope() as db:
+            return _update_job(db, job_id, owner, fields)
+
+
+def _update_job(db, job_id, owner, fields):
+    query = db.query(ProvisioningJob).filter(ProvisioningJob.id == job_id)
+    if owner is not None:
+        query = query.filter(ProvisioningJob.owner == owner)
+    return query.update(fields, synchronize_session=False)
+
+
+def step_done(etape, step):
+    """L'étape step est-elle déjà terminée quand la dernière étape terminée est etape ?"""
+    return STEPS.index(etape or STEPS[0]) >= STEPS.index(step)
+
+
+def complete_step(job_id, step, db=None, **fields):
+    """Enregistre la fin d'une étape avec les données nécessaires à la suite"""
+    if step == STEPS[-1]:
+        # Email de bienvenue en file : les identifiants n'ont plus à être conservés
+        fields['identifiants'] = None
+    elif fields.get('identifiants') is not None:
+        fields['identifiants'] = json.dumps(fields['identifiants'])
+    update_job(job_id, db=db, etape=step, **fields)
+
+
+def load_job(job_id):
+    """État enregistré d'un job (étape atteinte, port, stack, identifiants)"""
+    with session_scope() as db:
+        job = db.get(ProvisioningJob, job_id)
+        return {
+            'etape': job.etape or STEPS[0],
+            'tentatives': job.tentatives or 0,
+            'client_name': job.client_name,
+            'app_port': job.app_port,
+            'stack_id': job.stack_id,
+            'identifiants': json.loads(job.identifiants) if job.identifiants else None,
+        }
+
+
+def claimable(now, max_attempts=PROVISIONING_MAX_ATTEMPTS):
+    """
+    Condition des jobs qu'un worker peut prendre : en attente, en cours avec un
+    bail expiré (worker disparu) ou en échec avant la fin et arrivés à l'heure
+    de leur nouvelle tentative, dans la limite des tentatives
+    """
+    return (func.coalesce(ProvisioningJob.tentatives, 0) < max_attempts) & or_(
+        ProvisioningJob.statut == 'en_attente',
+        (ProvisioningJob.statut == 'en_cours')
+        & or_(ProvisioningJob.lease_until.is_(None), ProvisioningJob.lease_until < now),
+        (ProvisioningJob.statut == 'echec')
+        & (func.coalesce(ProvisioningJob.etape, STEPS[0]) != STEPS[-1])
+        & or_(ProvisioningJob.prochaine_tentative.is_(None), ProvisioningJob.prochaine_tentative <= now),
+    )
+
+
+def claim_job(job_id, owner, lease=PROVISIONING_LEASE, max_attempts=PROVISIONING_MAX_ATTEMPTS):
+    """
+    Prend un job pour l'exécuter (une seule requête : deux workers, même dans des
+    processus différents, ne peuvent pas prendre le même job)
+
+    Returns:
+        int | None: numéro de la tentative, None si le job est détenu par un autre
+            worker ou n'est plus à exécuter
+    """
+    now = datetime.utcnow()
+    with span('db.claim_job', job_id=job_id), session_scope() as db:
+        return db.execute(
+            update(ProvisioningJob)
+            .where(ProvisioningJob.id == job_id, claimable(now, max_attempts))
+            .values(statut='en_cours', owner=owner, lease_until=now + timedelta(seconds=lease),
+                    date_debut=now, prochaine_tentative=None,
+                    tentatives=func.coalesce(ProvisioningJob.tentatives, 0) + 1)
+            .returning(ProvisioningJob.tentatives)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+
+
+def renew_lease(job_id, owner, lease=PROVISIONING_LEASE):
+    """Prolonge le bail d'un job en cours ; False si le job n'est plus détenu par ce worker"""
+    return update_job(job_id, owner=owner, lease_until=datetime.utcnow() + timedelta(seconds=lease)) > 0
+
+
+def resumable_jobs(max_attempts=PROVISIONING_MAX_ATTEMPTS, max_age_hours=PROVISIONING_RESUME_MAX_AGE,
+                   waiting_only=False):
+    """
+    Jobs à reprendre : en attente, interrompus (bail expiré) ou en échec avant
+    la fin avec des tentatives restantes et arrivés à l'heure de leur nouvelle
+    tentative
+
+    Args:
+        waiting_only: seulement les jobs 'en_attente' (refusés faute de place dans la file)
+
+    Returns:
+        list: (job_id, params) dans l'ordre d'inscription
+    """
+    if waiting_only:
+        statut = ProvisioningJob.statut == 'en_attente'
+    else:
+        statut = claimable(datetime.utcnow(), max_attempts)
+    with session_scope() as db:
+        rows = (
+            db.query(ProvisioningJob, Client)
+            .join(Client, Client.id == ProvisioningJob.client_id)
+            .filter(
+                ProvisioningJob.date_creation >= datetime.utcnow() - timedelta(hours=max_age_hours),
+                func.coalesce(ProvisioningJob.tentatives, 0) < max_attempts,
+                statut,
+            )
+            .order_by(ProvisioningJob.id)
+            .all()
+        )
+        return [
+            (job.id, {'client_id': client.id, 'prenom': client.prenom or client.nom,
+                      'email': client.email, 'plan': job.plan})
+            for job, client in rows
+        ]
+
+
+class ProvisioningQueue:
+    """
+    Workers asynchrones bornés exécutant les provisionnements
+
+    Args:
+        runner: coroutine runner(job_id, params, progress) retournant un dict
+            contenant au moins 'success' et 'message' (et 'port' en cas de succès) ;
+            progress accepte un ProgressEvent ou un message texte
+        max_workers: nombre de jobs exécutés en parallèle
+        max_pending: taille maximale de la file d'attente
+        max_attempts: exécutions max d'un job (première tentative comprise)
+        retry_base: délai avant la première nouvelle tentative (secondes, doublé ensuite)
+        lease: durée du bail d'un job en cours (secondes)
+        resume_interval: intervalle de recherche des jobs à reprendre (secondes)
+    """
+
+    def __init__(self, runner, max_workers=PROVISIONING_MAX_WORKERS, max_pending=PROVISIONING_MAX_PENDING,
+                 max_attempts=PROVISIONING_MAX_ATTEMPTS, retry_base=PROVISIONING_RETRY_BASE,
+                 lease=PROVISIONING_LEASE, resume_interval=PROVISIONING_RESUME_INTERVAL):
+        self.runner = runner
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.lease = lease
+        self.resume_interval = resume_interval
+        # Identifie ce processus comme détenteur des jobs qu'il exécute
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._queue = None
+        self._open = None
+        self._workers = []
+        self._sweeper = None
+        self._retries = {}  # job_id -> nouvelle tentative programmée (asyncio.TimerHandle)
+        self._listeners = {}  # job_id -> [(on_progress, on_done)]
+        self._running = set()
+        self._submitted = {}  # job_id -> instant de soumission
+        self._overflow = False  # des jobs 'en_attente' en base n'ont pas trouvé de place dans la file
+        self.latency = LatencyStats()
+
+    def start(self, paused=False):
+        """
+        Démarre les workers (à appeler depuis la boucle d'événements)
+
+        Args:
+            paused: les jobs soumis attendent l'appel à open() pour être exécutés
+        """
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._open = asyncio.Event()
+        if not paused:
+            self._open.set()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+        self._sweeper = asyncio.create_task(self._sweep())
+
+    def open(self):
+        """Autorise l'exécution des jobs d'une file démarrée avec paused=True"""
+        self._open.set()
+
+    async def stop(self):
+        """Arrête les workers ; les jobs non traités restent en base 'en_attente'"""
+        for handle in self._retries.values():
+            handle.cancel()
+        self._retries.clear()
+        tasks = self._workers + ([self._sweeper] if self._sweeper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._sweeper = None
+
+    def full(self):
+        """La file est-elle pleine ? (à vérifier avant d'enregistrer une inscription)"""
+        return self._queue is not None and self._queue.full()
+
+    def submit(self, job_id, params):
+        """
+        Place un job dans la file sans attendre son exécution
+
+        Un job refusé (ProvisioningQueueFull) reste 'en_attente' en base : il est
+        soumis par un worker dès qu'une place se libère.
+        """
+        if self._queue is None:
+            raise RuntimeError("La file de provisionnement n'est pas démarrée")
+        try:
+            self._queue.put_nowait((job_id, params))
+            self._submitted[job_id] = time.perf_counter()
+        except asyncio.QueueFull:
+            self._overflow = True
+            raise ProvisioningQueueFull(
+                f"{self.max_pending} provisionnements déjà en attente"
+            )
+
+    async def resume(self):
+        """Remet en file les jobs interrompus ou à retenter (à appeler une fois la base prête)"""
+        jobs = await asyncio.to_thread(resumable_jobs, self.max_attempts)
+        resumed = self._submit_all(jobs)
+        if resumed:
+            logger.info("🔁 %s provisionnement(s) interrompu(s) repris", resumed)
+        return resumed
+
+    async def _sweep(self):
+        """Reprend régulièrement les jobs en échec à retenter et ceux dont le bail a expiré"""
+        await self._open.wait()
+        while True:
+            await asyncio.sleep(self.resume_interval)
+            try:
+                await self.resume()
+            except Exception as e:
+                logger.warning("⚠️ Reprise des provisionnements impossible : %s", e)
+
+    def _schedule_retry(self, job_id, params, attempt):
+        """Programme une nouvelle tentative d'un job en échec (resoumis à l'échéance)"""
+        delay = retry_delay(attempt, self.retry_base)
+        self._retries[job_id] = asyncio.get_running_loop().call_later(
+            delay.total_seconds(), self._retry, job_id, params)
+        logger.info("🔁 Nouvelle tentative du job %s dans %.0f s", job_id, delay.total_seconds())
+        return delay
+
+    def _retry(self, job_id, params):
+        self._retries.pop(job_id, None)
+        # File pleine : le job sera repris par la recherche périodique
+        self._submit_all([(job_id, params)])
+
+    async def _keep_lease(self, job_id):
+        """Renouvelle le bail du job tant qu'il s'exécute"""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                if not await asyncio.to_thread(renew_lease, job_id, self.owner, self.lease):
+                    logger.warning("⚠️ Bail du job %s perdu : il a été repris par un autre worker", job_id)
+                    return
+            except Exception as e:
+                logger.warning("⚠️ Renouvellement du bail du job %s impossible : %s", job_id, e)
+
+    async def _drain(self):
+        """Soumet les jobs restés 'en_attente' en base faute de place dans la file"""
+        self._overflow = False
+        try:
+            jobs = await asyncio.to_thread(resumable_jobs, waiting_only=True)
+        except Exception as e:
+            self._overflow = True
+            logger.warning("⚠️ Lecture des provisionnements en attente impossible : %s", e)
+            return
+        submitted = self._submit_all(jobs)
+        if submitted:
+            logger.info("📥 %s provisionnement(s) en attente soumis", submitted)
+
+    def _submit_all(self, jobs):
+        """Soumet les jobs qui ne sont ni en file ni en cours, jusqu'à remplir la file"""
+        submitted = 0
+        for job_id, params in jobs:
+            if job_id in self._running or job_id in self._submitted or job_id in self._retries:
+                continue
+            try:
+                self.submit(job_id, params)
+                submitted += 1
+            except ProvisioningQueueFull:
+                break  # les suivants seront soumis quand une place se libérera
+        return submitted
+
+    def subscribe(self, job_id, on_progress=None, on_done=None):
+        """
+        Abonne des callbacks à la progression et à la fin d'un job
+
+        on_progress reçoit chaque ProgressEvent, on_done le dict résultat
+        (avec 'timings' : délai en ms de chaque étape depuis la soumission)
+        """
+        self._listeners.setdefault(job_id, []).append((on_progress, on_done))
+
+    def unsubscribe(self, job_id):
+        """Retire les abonnés d'un job (ex. : le visiteur a fermé la page)"""
+        self._listeners.pop(job_id, None)
+
+    def stats(self):
+        return {
+            'workers': len(self._workers),
+            'open': self._open is not None and self._open.is_set(),
+            'running': len(self._running),
+            'pending': self._queue.qsize() if self._queue else 0,
+            'max_pending': self.max_pending,
+            'step_latency_ms': self.latency.snapshot(),
+        }
+
+    def _notify(self, job_id, index, *args):
+        for listener in list(self._listeners.get(job_id, [])):
+            callback = listener[index]
+            if callback is None:
+                continue
+            try:
+                callback(*args)
+            except Exception as e:
+                # Un abonné défaillant (page fermée...) ne doit pas interrompre le job
+                logger.warning("⚠️ Abonné du job %s en erreur : %s", job_id, e)
+
+    async def _worker(self):
+        await self._open.wait()
+        while True:
+            job_id, params = await self._queue.get()
+            try:
+                await self._run(job_id, params)
+            except Exception as e:
+                logger.exception("❌ Job de provisionnement %s en erreur : %s", job_id, e)
+                self._notify(job_id, 1, {'success': False, 'message': f"Erreur : {str(e)}"})
+            finally:
+                self._listeners.pop(job_id, None)
+                self._queue.task_done()
+            if self._overflow and not self._queue.full():
+                await self._drain()
+
+    async def _run(self, job_id, params):
+        self._running.add(job_id)
+        tracker = ProgressTracker(self._submitted.pop(job_id, None))
+        queue_ms = round((time.perf_counter() - tracker.start) * 1000, 1)
+        try:
+            attempt = await asyncio.to_thread(claim_job, job_id, self.owner, self.lease, self.max_attempts)
+            if attempt is None:
+                logger.info("⏭️ Job %s déjà pris par un autre worker ou terminé", job_id)
+                return
+            # Trace du job : les étapes du runner (base, Portainer, script, email) y sont rattachées
+            with span('provisionnement', job_id=job_id, plan=params.get('plan'), attente_file_ms=queue_ms,
+                      tentative=attempt) as trace:
+                def progress(item):
+                    self._notify(job_id, 0, tracker.record(as_event(item)))
+
+                progress(ProgressEvent(STARTED, "🚀 Démarrage de la création de votre instance..."))
+                keep_lease = asyncio.create_task(self._keep_lease(job_id))
+                try:
+                    result = await self.runner(job_id, params, progress)
+                except Exception as e:
+                    result = {'success': False, 'message': f"Erreur : {str(e)}"}
+                finally:
+                    keep_lease.cancel()
+                trace.set(success=bool(result.get('success')))
+                tracker.record(ProgressEvent(DONE, result.get('message') or ''))
+                result['timings'] = tracker.timings()
+                result['trace_id'] = trace.trace_id
+                self.latency.add(result['timings'])
+                for phase, elapsed_ms in result['timings'].items():
+                    PROVISIONING_PHASE.observe(elapsed_ms / 1000, phase)
+                PROVISIONING_JOBS.inc('succes' if result.get('success') else 'echec')
+                logger.info("⏱️ Job %s : %s", job_id, tracker.summary(),
+                            extra={'timings': result['timings'], 'trace_id': trace.trace_id})
+                if trace.duration_ms > TRACE_SLOW_MS:
+                    logger.warning("🐢 Provisionnement lent du job %s (%.0f s) : python tracing.py show %s",
+                                   job_id, trace.duration_ms / 1000, trace.trace_id)
+
+                fields = {'app_port': result['port']} if result.get('port') else {}
+                retry = not result.get('success') and attempt < self.max_attempts
+                if retry:
+                    fields['prochaine_tentative'] = datetime.utcnow() + retry_delay(attempt, self.retry_base)
+                elif not result.get('success'):
+                    # Abandon : les identifiants générés ne sont pas conservés
+                    fields['identifiants'] = None
+                try:
+                    await asyncio.to_thread(
+                        update_job,
+                        job_id,
+                        owner=self.owner,
+                        statut='termine' if result.get('success') else 'echec',
+                        message=result.get('message'),
+                        date_fin=datetime.utcnow(),
+                        lease_until=None,
+                        **fields,
+                    )
+                except Exception as e:
+                    # Le résultat du provisionnement reste valable même si l'enregistrement échoue
+                    logger.warning("⚠️ Impossible d'enregistrer la fin du job %s : %s", job_id, e)
+                if retry:
+                    self._schedule_retry(job_id, params, attempt)
+            self._notify(job_id, 1, result)
+        finally:
+            self._running.discard(job_id)
@@ -0,0 +1,173 @@
+"""
+Événements de progression des provisionnements
+
+La sortie de create-client-stack.sh est lue ligne par ligne pendant
+l'exécution et traduite en événements structurés (étape, port attribué,
+stack créée, erreur) transmis aussitôt aux pages abonnées. Le client
+Portainer natif émet les mêmes événements.
+
+Chaque événement est horodaté : le délai depuis la soumission du job est
+mesuré pour chaque étape.
+"""
+import asyncio
+import re
+import time
+
+# Types d'événements
+STARTED = 'started'              # le job sort de la file d'attente
+STEP = 'step'                    # étape du script ([1/4] ...)
+PORT_ASSIGNED = 'port_assigned'
+STACK_CREATED = 'stack_created'
+HEALTHY = 'healthy'              # conteneurs de la stack démarrés
+ERROR = 'error'
+INFO = 'info'                    # message libre
+DONE = 'done'
+
+
+class ProgressEvent:
+    """
+    Args:
+        kind: type d'événement (STEP, PORT_ASSIGNED...)
+        message: texte affichable
+        **data: détails (step/total, port, stack_id...)
+    """
+
+    def __init__(self, kind, message, **data):
+        self.kind = kind
+        self.message = message
+        self.data = data
+        self.at = time.perf_counter()
+        self.elapsed_ms = None  # renseigné par ProgressTracker
+
+    @property
+    def key(self):
+        """Nom de l'étape dans les mesures de latence"""
+        return f"step_{self.data['step']}" if self.kind == STEP else self.kind
+
+    def to_dict(self):
+        return {'kind': self.kind, 'message': self.message, 'elapsed_ms': self.elapsed_ms, **self.data}
+
+    def __repr__(self):
+        return f"ProgressEvent({self.kind!r}, {self.message!r}, {self.data!r})"
+
+
+def as_event(item):
+    """Les messages texte restent acceptés comme événements INFO"""
+    return item if isinstance(item, ProgressEvent) else ProgressEvent(INFO, item)
+
+
+# Lignes reconnues dans la sortie du script (les autres ne sont pas transmises,
+# notamment le résumé final qui contient le mot de passe initial)
+_SCRIPT_PATTERNS = [
+    (re.compile(r'^\[(\d+)/(\d+)\]\s*(.*)$'),
+     lambda m: ProgressEvent(STEP, m[3], step=int(m[1]), total=int(m[2]))),
+    (re.compile(r'^Port application attribue\s*:\s*(\d+)'),
+     lambda m: ProgressEvent(PORT_ASSIGNED, f"Port application attribué : {m[1]}", port=m[1])),
+    (re.compile(r'^Stack creee avec succes \(ID:\s*(\d+)\)'),
+     lambda m: ProgressEvent(STACK_CREATED, "Stack créée avec succès", stack_id=m[1])),
+    (re.compile(r'^Erreur\s*:?\s*(.*)$'),
+     lambda m: ProgressEvent(ERROR, m[1] or m[0])),
+]
+
+
+def parse_script_line(line):
+    """Événement correspondant à une ligne de create-client-stack.sh (None si non significative)"""
+    line = line.strip()
+    for pattern, build in _SCRIPT_PATTERNS:
+        match = pattern.match(line)
+        if match:
+            return build(match)
+    return None
+
+
+async def stream_script(cmd, emit, timeout=300, env=None):
+    """
+    Exécute une commande et émet les événements au fil de sa sortie
+
+    stderr est fusionné dans stdout pour conserver l'ordre des messages.
+
+    Args:
+        cmd: commande (liste)
+        emit: fonction recevant chaque ProgressEvent
+        timeout: durée maximale (s) ; le processus est tué au-delà
+        env: variables d'environnement du processus (défaut : celles du site)
+
+    Returns:
+        tuple: (code de retour, lignes de sortie)
+
+    Raises:
+        asyncio.TimeoutError: si le processus dépasse timeout
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        env=env,
+    )
+    lines = []
+
+    async def read_output():
+        async for raw in process.stdout:
+            line = raw.decode(errors='replace').rstrip()
+            lines.append(line)
+            event = parse_script_line(line)
+            if event is not None:
+                emit(event)
+        return await process.wait()
+
+    try:
+        returncode = await asyncio.wait_for(read_output(), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    return returncode, lines
+
+
+class ProgressTracker:
+    """
+    Horodatage des événements d'un job
+
+    Args:
+        start: instant de référence (perf_counter), ex. soumission du job
+    """
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.events = []
+
+    def record(self, event):
+        event.elapsed_ms = round((event.at - self.start) * 1000, 1)
+        self.events.append(event)
+        return event
+
+    def timings(self):
+        """Délai (ms) depuis le début pour chaque événement structuré"""
+        return {event.key: event.elapsed_ms for event in self.events if event.kind != INFO}
+
+    def summary(self):
+        return ', '.join(f"{key} {elapsed:.0f} ms" for key, elapsed in self.timings().items())
+
+
+class LatencyStats:
+    """Délais cumulés par étape sur l'ensemble des jobs (exposés par /health)"""
+
+    def __init__(self):
+        self._steps = {}
+
+    def add(self, timings):
+        for key, elapsed in timings.items():
+            step = self._steps.setdefault(key, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            step['count'] += 1
+            step['total_ms'] += elapsed
+            step['max_ms'] = max(step['max_ms'], elapsed)
+
+    def snapshot(self):
+        return {
+            key: {
+                'count': step['count'],
+                'avg_ms': round(step['total_ms'] / step['count'], 1),
+                'max_ms': step['max_ms'],
+            }
+            for key, step in self._steps.items()
+        }
@@ -1,19 +1,45 @@
-from nicegui import ui
-from database_config import SessionLocal
-from models import Client, Abonnement
+from startup import startup_timer
+from logging_config import setup_logging, stop_logging
+from nicegui import ui, app, Client as UIClient
+from database_config import async_session_scope, session_scope, get_pool_stats, async_engine
+from models import Client, Abonnement, ProvisioningJob
+from provisioning import (PROVISIONING_MAX_ATTEMPTS, ProvisioningQueue, ProvisioningQueueFull,
+                          complete_step, load_job, step_done)
+from provisioning_events import ERROR, PORT_ASSIGNED, STACK_CREATED, ProgressEvent, stream_script
+from portainer_client import (STACK_HEALTH_TIMEOUT, create_client_stack_api, close_portainer_client,
+                              find_client_stack, wait_stack_healthy)
+from init_db import ensure_schema
+from port_allocator import reserve_port, confirm_port, release_port, PortReconciler
 from datetime import datetime, timedelta
 from decimal import Decimal
-from sqlalchemy import text
+from sqlalchemy import select
 import subprocess
 import secrets
 import string
 import os
 import asyncio
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import logging
+from mail_queue import mail_sender, smtp_configured
+from email_templates import WELCOME, welcome_fields
+from static_pages import STATIC_PAGES, serve_static_pages
+from progress_widget import ProgressWidget
+from metrics import Gauge, instrument_app
+from tracing import span, subprocess_env
+from site_content import (
+    NAV_LINKS, FOOTER_LINKS, CONTACT_EMAIL, CONTACT_PHONE, HOME_CARDS, HOME_STATS,
+    FEATURES, PLANS, PRICING_NOTE, CONTACT_CARDS,
+)
 
-# Le script sera exécuté localement dans le container
+setup_logging()
+logger = logging.getLogger('site_commercial')
+
+# Création des stacks : 'api' (client Portainer natif) ou 'script' (create-client-stack.sh
+# exécuté localement dans le container)
+PORTAINER_BACKEND = os.getenv('PORTAINER_BACKEND', 'api')
+# Base indisponible au démarrage : délai avant un nouvel essai (secondes, doublé
+# à chaque échec jusqu'au maximum)
+DB_INIT_RETRY = float(os.getenv('DB_INIT_RETRY', '2'))
+DB_INIT_RETRY_MAX = float(os.getenv('DB_INIT_RETRY_MAX', '60'))
 
 def generate_secret_key(length=32):
     """Génère une clé secrète aléatoire de la longueur spécifiée"""
@@ -25,9 +51,12 @@ def generate_password(length=16):
     alphabet = string.ascii_letters + string.digits + "!@#$%^&*"
     return ''.join(secrets.choice(alphabet) for _ in range(length))
 
-def send_welcome_email(email, client_name, password, url, plan):
+def send_welcome_email(email, client_name, password, url, plan, session=None):
     """
-    Envoie un email de bienvenue au client avec ses identifiants
+    Met en file l'email de bienvenue du client avec ses identifiants
+    
+    L'envoi SMTP est fait en arrière-plan par mail_sender (connexion réutilisée,
+    nouvelles tentatives en cas d'échec) : cette fonction ne fait qu'une insertion.
     
     Args:
         email: Email du destinataire
@@ -35,143 +64,76 @@ def send_welcome_email(email, client_name, password, url, plan):
         password: Mot de passe temporaire
         url: URL d'accès à l'instance
         plan: Plan d'abonnement
+        session: transaction de l'appelant (l'email est validé avec elle)
     """
     try:
-        # Configuration SMTP - À adapter selon votre serveur SMTP
-        smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-        smtp_port = int(os.getenv('SMTP_PORT', 587))
-        smtp_user = os.getenv('SMTP_USER', 'votre-email@gmail.com')
-        smtp_password = os.getenv('SMTP_PASSWORD', '')
-        from_email = os.getenv('FROM_EMAIL', smtp_user)
-        
         # Ne pas envoyer si les paramètres SMTP ne sont pas configurés
-        if not smtp_password or smtp_password == '':
-            print("SMTP non configuré - Email non envoyé")
+        if not smtp_configured():
+            logger.warning("SMTP non configuré - Email non envoyé")
             return False
         
-        # Créer le message
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = '🎉 Bienvenue sur ERP BTP - Vos identifiants de connexion'
-        msg['From'] = from_email
-        msg['To'] = email
-        
-        # Contenu HTML de l'email
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-                .content {{ background: #f8f9fa; padding: 30px; border-radius: 0 0 10px 10px; }}
-                .credentials {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #667eea; }}
-                .credential-row {{ margin: 10px 0; padding: 10px; background: #f8f9fa; border-radius: 4px; }}
-                .label {{ font-weight: bold; color: #667eea; }}
-                .value {{ font-family: 'Courier New', monospace; color: #333; font-size: 16px; }}
-                .button {{ display: inline-block; padding: 15px 30px; background: #667eea; color: white; text-decoration: none; border-radius: 8px; margin: 20px 0; font-weight: bold; }}
-                .warning {{ background: #fff3cd; padding: 15px; border-left: 4px solid #ffc107; margin: 20px 0; border-radius: 4px; }}
-                .footer {{ text-align: center; margin-top: 30px; color: #666; font-size: 12px; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🎉 Bienvenue sur ERP BTP !</h1>
-                    <p>Votre instance est prête</p>
-                </div>
-                <div class="content">
-                    <p>Bonjour,</p>
-                    <p>Félicitations ! Votre espace ERP BTP est maintenant opérationnel.</p>
-                    
-                    <div class="credentials">
-                        <h3>Vos identifiants de connexion :</h3>
-                        <div class="credential-row">
-                            <span class="label">Nom d'utilisateur :</span><br>
-                            <span class="value">{client_name}</span>
-                        </div>
-                        <div class="credential-row">
-                            <span class="label">Mot de passe temporaire :</span><br>
-                            <span class="value">{password}</span>
-                        </div>
-                        <div class="credential-row">
-                            <span class="label">URL de connexion :</span><br>
-                            <span class="value">{url}</span>
-                        </div>
-                        <div class="credential-row">
-                            <span class="label">Formule :</span><br>
-                            <span class="value">{plan.upper()} - 30 jours gratuits</span>
-                        </div>
-                    </div>
-                    
-                    <div class="warning">
-                        <strong>⚠️ Important :</strong><br>
-                        • Veuillez patienter 1-2 minutes après réception de cet email avant de vous connecter<br>
-                        • Changez votre mot de passe lors de votre première connexion<br>
-                        • Conservez cet email en lieu sûr
-                    </div>
-                    
-                    <center>
-                        <a href="{url}" class="button">Accéder à mon ERP BTP</a>
-                    </center>
-                    
-                    <p style="margin-top: 30px;">Si vous avez des questions, notre équipe support est disponible 24/7 pour vous accompagner.</p>
-                    
-                    <div class="footer">
-                        <p>ERP BTP - Solution de Gestion pour le BTP</p>
-                        <p>Cet email a été envoyé automatiquement, merci de ne pas y répondre.</p>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        # Créer les versions texte et HTML
-        text_content = f"""
-Bienvenue sur ERP BTP !
-
-Votre instance est maintenant opérationnelle.
-
-Vos identifiants de connexion :
-- Nom d'utilisateur : {client_name}
-- Mot de passe temporaire : {password}
-- URL de connexion : {url}
-- Formule : {plan.upper()} - 30 jours gratuits
-
-Important :
-- Veuillez patienter 1-2 minutes avant de vous connecter
-- Changez votre mot de passe lors de votre première connexion
-- Conservez cet email en lieu sûr
-
-Accédez à votre ERP : {url}
-
-Notre équipe support est disponible 24/7 pour vous accompagner.
-
-ERP BTP - Solution de Gestion pour le BTP
-        """
-        
-        part1 = MIMEText(text_content, 'plain')
-        part2 = MIMEText(html_content, 'html')
-        
-        msg.attach(part1)
-        msg.attach(part2)
+        subject, text_content, html_content = WELCOME.render(
+            **welcome_fields(client_name, password, url, plan)
+        )
         
-        # Envoyer l'email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_user, smtp_password)
-            server.send_message(msg)
+        # Mettre l'email en file d'envoi
+        mail_sender.enqueue(email, subject, text_content, html_content, session=session)
         
-        print(f"Email de bienvenue envoyé à {email}")
+        logger.info("Email de bienvenue programmé", extra={'email': email})
         return True
         
     except Exception as e:
-        print(f"Erreur lors de l'envoi de l'email : {e}")
+        logger.error("Erreur lors de la mise en file de l'email : %s", e)
         return False
 
 
-async def create_client_stack(client_id, client_name, postgres_password, secret_key, initial_password, progress_callback=None):
+async def create_client_stack(client_id, client_name, postgres_password, secret_key, initial_password,
+                              progress_callback=None, app_port=None):
+    """
+    Crée la stack du client sur Portainer
+    
+    La stack est créée avec le client Portainer natif, ou le script
+    create-client-stack.sh exécuté localement dans le container si
+    PORTAINER_BACKEND=script. Le port réservé est confirmé dans le registre
+    en cas de succès ; en cas d'échec la réservation est conservée pour la
+    tentative suivante du job.
+    
+    Args:
+        client_id: ID du client dans la base de données
+        client_name: Nom du client (pour le nom de la stack)
+        postgres_password: Mot de passe PostgreSQL
+        secret_key: Clé secrète de 32 caractères
+        initial_password: Mot de passe initial temporaire
+        progress_callback: Fonction de callback pour les mises à jour de progression
+        app_port: Port réservé dans le registre (None : le backend cherche un port libre)
+    
+    Returns:
+        tuple: (success: bool, message: str, port: str | None)
+    """
+    backend = create_client_stack_api if PORTAINER_BACKEND == 'api' else create_client_stack_script
+    with span('stack.creation', backend=PORTAINER_BACKEND) as current:
+        result = await backend(
+            client_id=client_id,
+            client_name=client_name,
+            postgres_password=postgres_password,
+            secret_key=secret_key,
+            initial_password=initial_password,
+            progress_callback=progress_callback,
+            app_port=app_port
+        )
+        if not result[0]:
+            current.status = 'error'
+    
+    if app_port is not None and result[0]:
+        try:
+            with span('port.confirmation', port=app_port):
+                await asyncio.to_thread(confirm_port, app_port)
+        except Exception as e:
+            logger.warning("⚠️ Mise à jour du registre des ports impossible : %s", e)
+    return result
+
+
+async def create_client_stack_script(client_id, client_name, postgres_password, secret_key, initial_password, progress_callback=None, app_port=None):
     """
     Exécute le script create-client-stack.sh localement dans le container
     
@@ -182,33 +144,29 @@ async def create_client_stack(client_id, client_name, postgres_password, secret_
         secret_key: Clé secrète de 32 caractères
         initial_password: Mot de passe initial temporaire
         progress_callback: Fonction de callback pour les mises à jour de progression
+        app_port: Port déjà réservé (le script ne recherche alors pas de port libre)
     
     Returns:
-        tuple: (success: bool, message: str)
+        tuple: (success: bool, message: str, port: str | None)
     """
     def update_progress(message):
-        """Met à jour le message de progression si un callback est fourni"""
+        """Met à jour la progression si un callback est fourni"""
         if progress_callback:
             progress_callback(message)
     
+    port = None
+    
+    def on_event(event):
+        """Événements lus dans la sortie du script, transmis dès leur émission"""
+        nonlocal port
+        if event.kind == PORT_ASSIGNED:
+            port = event.data['port']
+        update_progress(event)
+    
     try:
-        update_progress("🔍 Préparation de l'environnement...")
-        await asyncio.sleep(0.1)
-        
-        # Exécution locale dans le container Linux
-        update_progress("✅ Exécution dans le container")
-        await asyncio.sleep(0.1)
-        
         script_path = os.path.join(os.path.dirname(__file__), 'create-client-stack.sh')
         bash_exe = '/bin/bash' if os.path.exists('/bin/bash') else '/usr/bin/bash'
         
-        # Debug: vérifier l'existence des fichiers
-        update_progress(f"🔍 DEBUG - Client ID: {client_id}")
-        update_progress(f"🔍 DEBUG - Script path: {script_path}")
-        update_progress(f"🔍 DEBUG - Script exists: {os.path.exists(script_path)}")
-        update_progress(f"🔍 DEBUG - Bash path: {bash_exe}")
-        update_progress(f"🔍 DEBUG - Bash exists: {os.path.exists(bash_exe)}")
-        
         cmd = [
             bash_exe,
             script_path,
@@ -218,80 +176,277 @@ async def create_client_stack(client_id, client_name, postgres_password, secret_
             '-s', secret_key,
             '-i', initial_password
         ]
+        if app_port is not None:
+            cmd += ['-a', str(app_port)]
         
-        update_progress(f"🔍 DEBUG - Command: {' '.join(cmd)}")
         update_progress(f"🚀 Création de la stack '{client_name}' sur Portainer...")
-        await asyncio.sleep(0.1)
-        
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        # Le script rattache ses étapes à ce span (TRACEPARENT)
+        with span('script.create-client-stack') as current:
+            returncode, lines = await stream_script(
+                cmd, on_event, timeout=300, env={**os.environ, **subprocess_env()})
+            current.set(returncode=returncode)
+        output = '\n'.join(lines)
         
-        # Attendre la fin du processus
-        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=300)
-        
-        # Décoder les sorties
-        stdout_text = stdout.decode() if stdout else ""
-        stderr_text = stderr.decode() if stderr else ""
-        
-        update_progress(f"🔍 DEBUG - Return code: {process.returncode}")
-        update_progress(f"🔍 DEBUG - STDOUT: {stdout_text[:500] if stdout_text else 'vide'}")
-        update_progress(f"🔍 DEBUG - STDERR: {stderr_text[:500] if stderr_text else 'vide'}")
-        
-        if process.returncode == 0:
+        if returncode == 0:
+            port = port or (str(app_port) if app_port is not None else '8080')
             update_progress(f"✅ Stack créée avec succès pour {client_name}")
-            
-            # Extraire le port depuis la sortie
-            port = '8080'  # Valeur par défaut
-            print(f"DEBUG - Sortie du script bash (stdout):")
-            print(stdout_text)
-            print(f"DEBUG - Recherche du port dans la sortie...")
-            
-            for line in stdout_text.split('\n'):
-                print(f"DEBUG - Ligne: {line}")
-                # Chercher spécifiquement la ligne avec le port attribué
-                if 'Port application attribue' in line:
-                    print(f"DEBUG - Ligne avec port trouvée: {line}")
-                    # Extraire le nombre après le dernier ':'
-                    parts = line.split(':')
-                    print(f"DEBUG - Parts après split: {parts}")
-                    if len(parts) > 0:
-                        try:
-                            # Le port est le dernier élément, on enlève les espaces
-                            port_str = parts[-1].strip()
-                            print(f"DEBUG - Port string extrait: '{port_str}'")
-                            # Vérifier que c'est bien un nombre
-                            if port_str.isdigit():
-                                port = port_str
-                                print(f"DEBUG - Port validé: {port}")
-                                update_progress(f"Port extrait: {port}")
-                        except Exception as e:
-                            print(f"DEBUG - Erreur extraction: {e}")
-                    break
-            
-            print(f"DEBUG - Port final utilisé: {port}")
-            update_progress(f"Port final: {port}")
-            return True, f"Stack créée avec succès pour {client_name}\n\n{stdout_text}", port
+            return True, f"Stack créée avec succès pour {client_name}\n\n{output}", port
         else:
-            error_msg = stderr_text if stderr_text else stdout_text if stdout_text else "Erreur inconnue"
-            update_progress(f"❌ Erreur lors de la création : {error_msg}")
+            error_msg = output or "Erreur inconnue"
+            update_progress(ProgressEvent(ERROR, f"❌ Erreur lors de la création (code {returncode})"))
             return False, f"Erreur lors de la création de la stack : {error_msg}", None
     
     except asyncio.TimeoutError:
-        update_progress("❌ Timeout dépassé")
-        return False, "Timeout : La création de la stack a pris trop de temps (>5 minutes)"
+        update_progress(ProgressEvent(ERROR, "❌ Timeout dépassé"))
+        return False, "Timeout : La création de la stack a pris trop de temps (>5 minutes)", None
     except FileNotFoundError as e:
-        update_progress(f"❌ Script bash non trouvé: {str(e)}")
-        import traceback
-        update_progress(f"🔍 DEBUG - Traceback: {traceback.format_exc()}")
-        return False, f"Erreur : Le script bash n'a pas été trouvé : {str(e)}"
+        update_progress(ProgressEvent(ERROR, f"❌ Script bash non trouvé: {str(e)}"))
+        return False, f"Erreur : Le script bash n'a pas été trouvé : {str(e)}", None
     except Exception as e:
-        update_progress(f"❌ Erreur : {str(e)}")
-        import traceback
-        update_progress(f"🔍 DEBUG - Traceback: {traceback.format_exc()}")
-        return False, f"Erreur lors de l'exécution du script : {str(e)}"
+        update_progress(ProgressEvent(ERROR, f"❌ Erreur : {str(e)}"))
+        return False, f"Erreur lors de l'exécution du script : {str(e)}", None
+
+def queue_welcome_email(job_id, email, client_name, password, url, plan):
+    """
+    Étape email_sent : l'email est mis en file dans la même transaction que la fin
+    de l'étape (une reprise ne l'envoie jamais deux fois) et les identifiants
+    conservés sur le job sont effacés
+    """
+    with session_scope() as db:
+        email_sent = send_welcome_email(email, client_name, password, url, plan, session=db)
+        complete_step(job_id, 'email_sent', db=db)
+    mail_sender.wake()
+    return email_sent
+
+
+async def provision_client(job_id, params, progress):
+    """
+    Provisionne l'instance d'un client (exécuté par un worker de la file)
+    
+    Les étapes (provisioning.STEPS) sont enregistrées sur le job dès qu'elles
+    sont terminées ; une reprise (redémarrage du site, nouvelle tentative après
+    un timeout) saute celles déjà faites. Chaque étape peut être rejouée :
+    - port_reserved : réservation au nom de la stack (le même port est rendu)
+    - stack_created : une stack créée par une tentative précédente du job est
+      reprise au lieu d'être recréée
+    - healthy : simple attente du démarrage des conteneurs
+    - email_sent : email et fin de l'étape validés ensemble
+    
+    Args:
+        job_id: ID du ProvisioningJob
+        params: dict avec client_id, prenom, email et plan
+        progress: Fonction recevant les messages de progression
+    
+    Returns:
+        dict: success, message et, en cas de succès, port, client_name, password, plan
+    """
+    job = await asyncio.to_thread(load_job, job_id)
+    etape = job['etape']
+    retry = job['tentatives'] > 1
+    client_id = params['client_id']
+    stack_name = f"client_{client_id}"
+    client_name = job['client_name']
+    credentials = job['identifiants'] or {}
+    app_port = job['app_port']
+    stack_id = job['stack_id']
+    if retry:
+        progress(f"🔁 Reprise du provisionnement après l'étape {etape}")
+    
+    # Identifiants et port, enregistrés avant toute création sur Portainer
+    if not step_done(etape, 'port_reserved'):
+        progress('🔐 Génération des identifiants sécurisés...')
+        # Utiliser le prénom pour le nom du client (plus simple et unique)
+        client_name = params['prenom'].lower().replace(' ', '-').replace('\'', '')
+        with span('identifiants'):
+            credentials = {
+                'postgres_password': generate_password(16),
+                'secret_key': generate_secret_key(32),
+                'initial_password': generate_password(12),
+            }
+        logger.debug("Identifiants générés",
+                     extra={'client_name': client_name, 'initial_password': credentials['initial_password']})
+        progress('✅ Identifiants générés')
+        
+        # Réserver le port (atomique, sans parcourir les stacks existantes)
+        try:
+            with span('port.reservation') as current:
+                app_port = await asyncio.to_thread(reserve_port, client_id, stack_name)
+                current.set(port=app_port)
+        except Exception as e:
+            logger.warning("⚠️ Registre des ports indisponible, recherche d'un port libre : %s", e)
+            app_port = None
+        app_port = str(app_port) if app_port is not None else None
+        await asyncio.to_thread(complete_step, job_id, 'port_reserved', client_name=client_name,
+                                identifiants=credentials, app_port=app_port)
+    
+    if not step_done(etape, 'stack_created'):
+        # Une tentative interrompue a pu créer la stack sans l'enregistrer
+        existing = await find_client_stack(client_id, credentials['initial_password']) if retry else None
+        if existing:
+            stack_id, app_port = existing[0], existing[1] or app_port
+            progress(ProgressEvent(STACK_CREATED, "✅ Stack déjà créée, reprise", stack_id=stack_id))
+            if app_port is not None:
+                try:
+                    await asyncio.to_thread(confirm_port, int(app_port))
+                except Exception as e:
+                    logger.warning("⚠️ Mise à jour du registre des ports impossible : %s", e)
+        else:
+            if retry and app_port is not None:
+                # Réservation expirée entre-temps : le registre rend le même port ou un nouveau
+                try:
+                    app_port = str(await asyncio.to_thread(reserve_port, client_id, stack_name))
+                except Exception as e:
+                    logger.warning("⚠️ Registre des ports indisponible, port %s conservé : %s", app_port, e)
+            created = {}
+            
+            def on_progress(item):
+                if isinstance(item, ProgressEvent) and item.kind == STACK_CREATED:
+                    created['stack_id'] = item.data.get('stack_id')
+                progress(item)
+            
+            success, message, port = await create_client_stack(
+                client_id=client_id,
+                client_name=client_name,
+                postgres_password=credentials['postgres_password'],
+                secret_key=credentials['secret_key'],
+                initial_password=credentials['initial_password'],
+                progress_callback=on_progress,
+                app_port=int(app_port) if app_port is not None else None
+            )
+            if not success:
+                if job['tentatives'] >= PROVISIONING_MAX_ATTEMPTS and app_port is not None:
+                    # Dernière tentative : la réservation n'a plus de raison d'être
+                    await asyncio.to_thread(release_port, int(app_port), True)
+                return {'success': False, 'message': message}
+            stack_id, app_port = created.get('stack_id'), port
+        # Seul le mot de passe initial reste utile (email de bienvenue)
+        await asyncio.to_thread(complete_step, job_id, 'stack_created', stack_id=stack_id, app_port=app_port,
+                                identifiants={'initial_password': credentials['initial_password']})
+    
+    if not step_done(etape, 'healthy'):
+        progress('⏳ Démarrage de votre instance...')
+        with span('stack.demarrage'):
+            healthy = await wait_stack_healthy(stack_name, progress)
+        if not healthy:
+            return {'success': False, 'port': app_port,
+                    'message': f"L'instance n'a pas démarré en {STACK_HEALTH_TIMEOUT:.0f} s"}
+        await asyncio.to_thread(complete_step, job_id, 'healthy')
+    
+    progress('Instance déployée avec succès !')
+    
+    saas_url = f"http://176.131.66.167:{app_port}"
+    if not step_done(etape, 'email_sent'):
+        # Envoyer l'email de bienvenue
+        progress('📧 Envoi de l\'email de confirmation...')
+        with span('email.mise_en_file'):
+            email_sent = await asyncio.to_thread(
+                queue_welcome_email,
+                job_id,
+                email=params['email'],
+                client_name=client_name,
+                password=credentials.get('initial_password'),
+                url=saas_url,
+                plan=params['plan']
+            )
+        if email_sent:
+            progress('✅ Email de confirmation programmé')
+    
+    return {
+        'success': True,
+        'message': f"Instance {stack_name} déployée (port {app_port})",
+        'port': app_port,
+        'client_name': client_name,
+        'password': credentials.get('initial_password', ''),
+        'plan': params['plan'],
+    }
+
+# File des provisionnements : workers démarrés/arrêtés avec l'application, jobs
+# exécutés une fois la base prête et le registre des ports réconcilié
+provisioning_queue = ProvisioningQueue(provision_client)
+app.on_startup(lambda: provisioning_queue.start(paused=True))
+app.on_shutdown(provisioning_queue.stop)
+app.on_shutdown(close_portainer_client)
+app.on_shutdown(async_engine.dispose)
+app.on_shutdown(stop_logging)
+
+# Envoi des emails en arrière-plan (connexion SMTP réutilisée entre les messages)
+app.on_startup(mail_sender.start)
+app.on_shutdown(mail_sender.stop)
+
+# Initialisation de la base hors du chemin critique du démarrage
+db_status = {'ready': False, 'schema_updated': None, 'error': None}
+database_init_task = None
+
+async def init_database():
+    """
+    Vérifie l'empreinte du schéma et met la base à jour si nécessaire
+
+    Une base indisponible est réessayée avec un délai croissant jusqu'à ce
+    qu'elle réponde ; la file des provisionnements n'est ouverte qu'ensuite.
+    """
+    startup_timer.mark('server_ready')
+    delay = DB_INIT_RETRY
+    while True:
+        try:
+            db_status['schema_updated'] = await asyncio.to_thread(ensure_schema, startup_timer)
+            break
+        except Exception as e:
+            db_status['error'] = str(e)
+            logger.warning("⚠️ Impossible d'initialiser la base de données (nouvel essai dans %.0f s) : %s - "
+                           "les fonctionnalités nécessitant la BD sont indisponibles", delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, DB_INIT_RETRY_MAX)
+    db_status['ready'] = True
+    db_status['error'] = None
+    logger.info("✅ Base de données prête" + (" (schéma mis à jour)" if db_status['schema_updated'] else ""))
+    # Provisionnements interrompus par un arrêt ou un timeout : reprise à la dernière étape terminée
+    try:
+        await provisioning_queue.resume()
+    except Exception as e:
+        logger.warning("⚠️ Reprise des provisionnements interrompus impossible : %s", e)
+    logger.info("⏱️ Démarrage : %s", startup_timer.summary())
+    # Registre des ports aligné sur Portainer avant la première réservation
+    port_reconciler.start()
+    await port_reconciler.wait_reconciled()
+    provisioning_queue.open()
+    logger.info("✅ Registre des ports réconcilié, provisionnements ouverts")
+
+def start_database_init():
+    global database_init_task
+    database_init_task = asyncio.create_task(init_database())
+
+async def stop_database_init():
+    if database_init_task is not None and not database_init_task.done():
+        database_init_task.cancel()
+        await asyncio.gather(database_init_task, return_exceptions=True)
+
+app.on_startup(start_database_init)
+app.on_shutdown(stop_database_init)
+
+@app.get('/health')
+def health():
+    """État du site : base, démarrage, pool de connexions, file de provisionnement et envoi des emails"""
+    return {
+        'status': 'ok' if db_status['ready'] else 'degraded',
+        'database': db_status,
+        'startup': startup_timer.snapshot(),
+        'db_pool': get_pool_stats(),
+        'provisioning': provisioning_queue.stats(),
+        'mail': mail_sender.stats(),
+    }
+
+# Métriques Prometheus (/metrics) : requêtes HTTP, SQL, pools, provisionnement, emails
+instrument_app(app)
+Gauge('nicegui_clients', "Pages NiceGUI connectées (websocket ouvert)",
+      lambda: sum(1 for client in UIClient.instances.values() if client.has_socket_connection))
+Gauge('provisioning_queue_jobs', "Jobs de provisionnement par état",
+      lambda: {(state,): provisioning_queue.stats()[state] for state in ('pending', 'running')},
+      ['state'])
+
+# Réconciliation périodique du registre des ports avec Portainer (démarrée par
+# init_database une fois les migrations appliquées)
+port_reconciler = PortReconciler()
+app.on_shutdown(port_reconciler.stop)
 
 def create_header():
     """Crée l'en-tête du site"""
@@ -301,10 +456,8 @@ def create_header():
                 ui.label('🏗️ ERP BTP').classes('text-2xl font-bold text-white')
             ui.space()
             with ui.row().classes('gap-6'):
-                ui.link('Accueil', '/').classes('text-white hover:text-blue-200 no-underline')
-                ui.link('Fonctionnalités', '/fonctionnalites').classes('text-white hover:text-blue-200 no-underline')
-                ui.link('Tarifs', '/tarifs').classes('text-white hover:text-blue-200 no-underline')
-                ui.link('Contact', '/contact').classes('text-white hover:text-blue-200 no-underline')
+                for label, target in NAV_LINKS:
+                    ui.link(label, target).classes('text-white hover:text-blue-200 no-underline')
                 ui.button('Essai Gratuit', on_click=lambda: ui.navigate.to('/demo')).classes('bg-green-500 hover:bg-green-600')
 
 def create_footer():
@@ -318,19 +471,17 @@ def create_footer():
                 
                 with ui.column():
                     ui.label('Liens rapides').classes('font-bold mb-2')
-                    ui.link('Fonctionnalités', '/fonctionnalites').classes('text-gray-400 hover:text-white')
-                    ui.link('Tarifs', '/tarifs').classes('text-gray-400 hover:text-white')
-                    ui.link('Contact', '/contact').classes('text-gray-400 hover:text-white')
+                    for label, target in FOOTER_LINKS:
+                        ui.link(label, target).classes('text-gray-400 hover:text-white')
                 
                 with ui.column():
                     ui.label('Contact').classes('font-bold mb-2')
-                    ui.label('📧 contact@erpbtp.fr').classes('text-gray-400')
-                    ui.label('📞 01 23 45 67 89').classes('text-gray-400')
+                    ui.label(f'📧 {CONTACT_EMAIL}').classes('text-gray-400')
+                    ui.label(f'📞 {CONTACT_PHONE}').classes('text-gray-400')
             
             ui.separator().classes('my-4 bg-gray-700')
             ui.label('© 2025 ERP BTP - Tous droits réservés').classes('text-center text-gray-500')
 
-@ui.page('/')
 def home_page():
     """Page d'accueil"""
     create_header()
@@ -351,43 +502,20 @@ def home_page():
             ui.label('Pourquoi choisir ERP BTP ?').classes('text-4xl font-bold text-center text-gray-800 mb-12')
             
             with ui.row().classes('w-full gap-8 flex-wrap justify-center'):
-                # Card 1
-                with ui.card().classes('flex-1 min-w-[300px] max-w-[350px] p-6'):
-                    ui.icon('description', size='3em').classes('text-blue-600 mb-4')
-                    ui.label('Devis Professionnels').classes('text-2xl font-bold mb-2')
-                    ui.label('Créez des devis personnalisés en quelques clics. Templates professionnels inclus.').classes('text-gray-600')
-                
-                # Card 2
-                with ui.card().classes('flex-1 min-w-[300px] max-w-[350px] p-6'):
-                    ui.icon('receipt', size='3em').classes('text-green-600 mb-4')
-                    ui.label('Facturation Simplifiée').classes('text-2xl font-bold mb-2')
-                    ui.label('Générez et envoyez vos factures automatiquement. Suivez les paiements en temps réel.').classes('text-gray-600')
-                
-                # Card 3
-                with ui.card().classes('flex-1 min-w-[300px] max-w-[350px] p-6'):
-                    ui.icon('construction', size='3em').classes('text-orange-600 mb-4')
-                    ui.label('Gestion de Chantiers').classes('text-2xl font-bold mb-2')
-                    ui.label('Suivez tous vos chantiers, plannings et budgets depuis une seule interface.').classes('text-gray-600')
+                for icon, color, title, desc in HOME_CARDS:
+                    with ui.card().classes('flex-1 min-w-[300px] max-w-[350px] p-6'):
+                        ui.icon(icon, size='3em').classes(f'{color} mb-4')
+                        ui.label(title).classes('text-2xl font-bold mb-2')
+                        ui.label(desc).classes('text-gray-600')
     
     # Statistiques
     with ui.column().classes('w-full bg-blue-700 text-white py-16'):
         with ui.column().classes('max-w-7xl mx-auto px-4'):
             with ui.row().classes('w-full justify-around flex-wrap gap-8'):
-                with ui.column().classes('text-center'):
-                    ui.label('500+').classes('text-5xl font-bold mb-2')
-                    ui.label('Entreprises clientes').classes('text-xl')
-                
-                with ui.column().classes('text-center'):
-                    ui.label('10 000+').classes('text-5xl font-bold mb-2')
-                    ui.label('Devis créés par mois').classes('text-xl')
-                
-                with ui.column().classes('text-center'):
-                    ui.label('99.9%').classes('text-5xl font-bold mb-2')
-                    ui.label('Disponibilité').classes('text-xl')
-                
-                with ui.column().classes('text-center'):
-                    ui.label('4.9/5').classes('text-5xl font-bold mb-2')
-                    ui.label('Satisfaction client').classes('text-xl')
+                for value, label in HOME_STATS:
+                    with ui.column().classes('text-center'):
+                        ui.label(value).classes('text-5xl font-bold mb-2')
+                        ui.label(label).classes('text-xl')
     
     # CTA Final
     with ui.column().classes('w-full py-16 bg-gray-50'):
@@ -398,7 +526,6 @@ def home_page():
     
     create_footer()
 
-@ui.page('/fonctionnalites')
 def features_page():
     """Page des fonctionnalités"""
     create_header()
@@ -410,22 +537,7 @@ def features_page():
             
             # Grille de fonctionnalités
             with ui.row().classes('w-full gap-6 flex-wrap'):
-                features = [
-                    {'icon': 'people', 'title': 'Gestion Clients', 'desc': 'Base de données clients complète avec historique et documents'},
-                    {'icon': 'construction', 'title': 'Projets & Chantiers', 'desc': 'Suivi détaillé de tous vos projets et chantiers'},
-                    {'icon': 'description', 'title': 'Devis Personnalisés', 'desc': 'Modèles professionnels et calculs automatiques'},
-                    {'icon': 'receipt', 'title': 'Facturation', 'desc': 'Création et envoi automatique de factures'},
-                    {'icon': 'local_shipping', 'title': 'Fournisseurs', 'desc': 'Gestion de vos fournisseurs et sous-traitants'},
-                    {'icon': 'dashboard', 'title': 'Tableau de Bord', 'desc': 'Vue d\'ensemble en temps réel de votre activité'},
-                    {'icon': 'schedule', 'title': 'Planning', 'desc': 'Planification et suivi des interventions'},
-                    {'icon': 'euro', 'title': 'Comptabilité', 'desc': 'Suivi financier et rapports comptables'},
-                    {'icon': 'cloud', 'title': 'Cloud Sécurisé', 'desc': 'Accès partout, données sauvegardées et sécurisées'},
-                    {'icon': 'phone_iphone', 'title': 'Mobile', 'desc': 'Accessible depuis tous vos appareils'},
-                    {'icon': 'security', 'title': 'Sécurité', 'desc': 'Données cryptées et conformes RGPD'},
-                    {'icon': 'support', 'title': 'Support', 'desc': 'Équipe support disponible et réactive'},
-                ]
-                
-                for feature in features:
+                for feature in FEATURES:
                     with ui.card().classes('flex-1 min-w-[280px] max-w-[350px] p-6'):
                         ui.icon(feature['icon'], size='2.5em').classes('text-blue-600 mb-3')
                         ui.label(feature['title']).classes('text-xl font-bold mb-2')
@@ -433,7 +545,6 @@ def features_page():
     
     create_footer()
 
-@ui.page('/tarifs')
 def pricing_page():
     """Page des tarifs"""
     create_header()
@@ -444,63 +555,26 @@ def pricing_page():
             ui.label('Choisissez le plan adapté à votre entreprise').classes('text-xl text-center text-gray-600 mb-12')
             
             with ui.row().classes('w-full gap-8 justify-center flex-wrap'):
-                # Plan Starter
-                with ui.card().classes('flex-1 min-w-[300px] max-w-[350px] p-8 border-2 border-gray-200'):
-                    ui.label('Starter').classes('text-2xl font-bold mb-4 text-center')
-                    ui.label('29€').classes('text-5xl font-bold text-center text-blue-600 mb-2')
-                    ui.label('par mois').classes('text-center text-gray-600 mb-6')
-                    
-                    with ui.column().classes('gap-3 mb-6'):
-                        ui.label('✓ Jusqu\'à 50 devis/mois').classes('text-gray-700')
-                        ui.label('✓ 5 utilisateurs').classes('text-gray-700')
-                        ui.label('✓ Gestion clients').classes('text-gray-700')
-                        ui.label('✓ Devis & Factures').classes('text-gray-700')
-                        ui.label('✓ Support email').classes('text-gray-700')
-                    
-                    ui.button('Commencer', on_click=lambda: ui.navigate.to('/demo?plan=starter')).classes('w-full bg-blue-600 hover:bg-blue-700')
-                
-                # Plan Pro (Populaire)
-                with ui.card().classes('flex-1 min-w-[300px] max-w-[350px] p-8 border-4 border-blue-600 relative'):
-                    ui.badge('Populaire', color='bg-blue-600').classes('absolute -top-3 left-1/2 -translate-x-1/2')
-                    ui.label('Pro').classes('text-2xl font-bold mb-4 text-center')
-                    ui.label('69€').classes('text-5xl font-bold text-center text-blue-600 mb-2')
-                    ui.label('par mois').classes('text-center text-gray-600 mb-6')
-                    
-                    with ui.column().classes('gap-3 mb-6'):
-                        ui.label('✓ Devis illimités').classes('text-gray-700')
-                        ui.label('✓ 15 utilisateurs').classes('text-gray-700')
-                        ui.label('✓ Toutes les fonctionnalités Starter').classes('text-gray-700')
-                        ui.label('✓ Gestion de chantiers').classes('text-gray-700')
-                        ui.label('✓ Planning & Interventions').classes('text-gray-700')
-                        ui.label('✓ Rapports avancés').classes('text-gray-700')
-                        ui.label('✓ Support prioritaire').classes('text-gray-700')
-                    
-                    ui.button('Commencer', on_click=lambda: ui.navigate.to('/demo?plan=pro')).classes('w-full bg-green-500 hover:bg-green-600')
-                
-                # Plan Enterprise
-                with ui.card().classes('flex-1 min-w-[300px] max-w-[350px] p-8 border-2 border-gray-200'):
-                    ui.label('Enterprise').classes('text-2xl font-bold mb-4 text-center')
-                    ui.label('Sur mesure').classes('text-3xl font-bold text-center text-blue-600 mb-2')
-                    ui.label('contactez-nous').classes('text-center text-gray-600 mb-6')
-                    
-                    with ui.column().classes('gap-3 mb-6'):
-                        ui.label('✓ Tout illimité').classes('text-gray-700')
-                        ui.label('✓ Utilisateurs illimités').classes('text-gray-700')
-                        ui.label('✓ Toutes les fonctionnalités Pro').classes('text-gray-700')
-                        ui.label('✓ API & Intégrations').classes('text-gray-700')
-                        ui.label('✓ Formation personnalisée').classes('text-gray-700')
-                        ui.label('✓ Support dédié 24/7').classes('text-gray-700')
-                        ui.label('✓ SLA garanti').classes('text-gray-700')
-                    
-                    ui.button('Nous contacter', on_click=lambda: ui.navigate.to('/contact')).classes('w-full bg-blue-600 hover:bg-blue-700')
+                for plan in PLANS:
+                    with ui.card().classes(f"flex-1 min-w-[300px] max-w-[350px] p-8 {plan['card_classes']}"):
+                        if plan['popular']:
+                            ui.badge('Populaire', color='bg-blue-600').classes('absolute -top-3 left-1/2 -translate-x-1/2')
+                        ui.label(plan['name']).classes('text-2xl font-bold mb-4 text-center')
+                        ui.label(plan['price']).classes(f"{plan['price_classes']} font-bold text-center text-blue-600 mb-2")
+                        ui.label(plan['period']).classes('text-center text-gray-600 mb-6')
+                        
+                        with ui.column().classes('gap-3 mb-6'):
+                            for item in plan['items']:
+                                ui.label(f'✓ {item}').classes('text-gray-700')
+                        
+                        ui.button(plan['button'], on_click=lambda target=plan['target']: ui.navigate.to(target)).classes(f"w-full {plan['button_classes']}")
             
             # Note
             with ui.column().classes('w-full text-center mt-12'):
-                ui.label('🎉 30 jours d\'essai gratuit - Sans engagement - Sans carte bancaire').classes('text-lg font-bold text-green-600')
+                ui.label(PRICING_NOTE).classes('text-lg font-bold text-green-600')
     
     create_footer()
 
-@ui.page('/contact')
 def contact_page():
     """Page de contact"""
     create_header()
@@ -536,28 +610,22 @@ def contact_page():
                 
                 # Coordonnées
                 with ui.column().classes('flex-1 min-w-[300px] gap-6'):
-                    with ui.card().classes('p-6'):
-                        ui.icon('email', size='2em').classes('text-blue-600 mb-2')
-                        ui.label('Email').classes('font-bold mb-1')
-                        ui.label('contact@erpbtp.fr').classes('text-gray-600')
-                    
-                    with ui.card().classes('p-6'):
-                        ui.icon('phone', size='2em').classes('text-blue-600 mb-2')
-                        ui.label('Téléphone').classes('font-bold mb-1')
-                        ui.label('01 23 45 67 89').classes('text-gray-600')
-                    
-                    with ui.card().classes('p-6'):
-                        ui.icon('schedule', size='2em').classes('text-blue-600 mb-2')
-                        ui.label('Horaires').classes('font-bold mb-1')
-                        ui.label('Lun-Ven : 9h-18h').classes('text-gray-600')
-                    
-                    with ui.card().classes('p-6'):
-                        ui.icon('location_on', size='2em').classes('text-blue-600 mb-2')
-                        ui.label('Adresse').classes('font-bold mb-1')
-                        ui.label('Paris, France').classes('text-gray-600')
+                    for icon, title, value in CONTACT_CARDS:
+                        with ui.card().classes('p-6'):
+                            ui.icon(icon, size='2em').classes('text-blue-600 mb-2')
+                            ui.label(title).classes('font-bold mb-1')
+                            ui.label(value).classes('text-gray-600')
     
     create_footer()
 
+# Pages vitrine : pré-rendues en HTML statique (STATIC_PAGES=true) ou pages NiceGUI
+# (aussi pour une page dont le rendu statique a échoué)
+static_routes = serve_static_pages(app) if STATIC_PAGES else {}
+for route, page_function in {'/': home_page, '/fonctionnalites': features_page,
+                             '/tarifs': pricing_page, '/contact': contact_page}.items():
+    if route not in static_routes:
+        ui.page(route)(page_function)
+
 @ui.page('/demo')
 def demo_page(plan: str = ''):
     """Page de demande de démo"""
@@ -601,18 +669,17 @@ def demo_page(plan: str = ''):
                     if not cgv.value:
                         ui.notify('Veuillez accepter les conditions générales', type='negative')
                         return
+                    # Refuser avant d'enregistrer quoi que ce soit : le visiteur pourra réessayer
+                    if provisioning_queue.full():
+                        ui.notify('Trop de créations en cours, veuillez réessayer dans quelques minutes', type='warning', timeout=8000)
+                        return
                     
                     # Créer une boîte de dialogue modale pour afficher la progression
                     with ui.dialog() as dialog, ui.card().classes('p-8 min-w-[500px]'):
                         ui.label('🚀 Création de votre instance ERP BTP').classes('text-2xl font-bold mb-4 text-center')
                         
-                        # Zone de messages de progression
-                        # Interface plus douce avec animation
-                        progress_label = ui.label('Préparation de votre espace...').classes('text-xl font-semibold mb-6 text-center text-gray-800')
-                        
-                        # Container pour les messages (max 3-4 lignes visibles, pas de scroll)
-                        with ui.card().classes('w-full bg-gradient-to-br from-blue-50 to-indigo-50 shadow-none border-none p-6'):
-                            progress_messages = ui.column().classes('w-full gap-3')
+                        # Zone de messages de progression (lignes mises à jour sur place)
+                        progress = ProgressWidget('Préparation de votre espace...')
                         
                         # Spinner centré et élégant
                         with ui.row().classes('w-full justify-center mt-6'):
@@ -620,60 +687,43 @@ def demo_page(plan: str = ''):
                         
                         dialog.open()
                         
-                        # Stocker les derniers messages (max 4)
-                        recent_messages = []
-                        
-                        def add_progress_message(message):
-                            """Ajoute un message dans le log de progression (sans icônes)"""
-                            # Retirer les icônes du message
-                            clean_message = message
-                            for icon in ['🔍', '✅', '❌', '🔐', '🚀', '🎉', '⚠️', '📝', '👤', '📋', '🔄', '⏳']:
-                                clean_message = clean_message.replace(icon, '').strip()
-                            
-                            # Garder seulement les 4 derniers messages
-                            recent_messages.append(clean_message)
-                            if len(recent_messages) > 4:
-                                recent_messages.pop(0)
-                            
-                            # Mettre à jour l'affichage
-                            progress_messages.clear()
-                            with progress_messages:
-                                for msg in recent_messages:
-                                    ui.label(msg).classes('text-base text-gray-700 animate-fade-in')
-                            
-                            progress_label.set_text(clean_message)
-                        
-                        async def run_creation():
-                            """Exécute la création de l'instance en arrière-plan"""
-                            try:
-                                add_progress_message('📝 Enregistrement de vos informations...')
-                                db = SessionLocal()
-                                
+                        async def enregistrer_inscription():
+                            """
+                            Enregistre le client, son abonnement et le job de provisionnement.
+
+                            Returns:
+                                tuple | None: (job_id, client_id, plan), None si aucune instance n'est à créer
+                            """
+                            progress.push('📝 Enregistrement de vos informations...')
+                            async with async_session_scope() as db:
                                 # Déterminer le plan à enregistrer
                                 plan_enregistre = plan if plan else 'essai'
                                 
                                 # Vérifier si le client existe déjà
-                                client_existant = db.query(Client).filter(Client.email == email.value).first()
+                                client_existant = await db.scalar(
+                                    select(Client).where(Client.email == email.value).limit(1)
+                                )
                                 
                                 if client_existant:
                                     client = client_existant
                                     
                                     # Vérifier s'il a déjà un abonnement actif
-                                    abonnement_actif = db.query(Abonnement).filter(
-                                        Abonnement.client_id == client.id,
-                                        Abonnement.statut == 'actif'
-                                    ).first()
+                                    abonnement_actif = await db.scalar(
+                                        select(Abonnement).where(
+                                            Abonnement.client_id == client.id,
+                                            Abonnement.statut == 'actif'
+                                        ).limit(1)
+                                    )
                                     
                                     # Si c'est une demande d'essai et qu'il a déjà un abonnement actif
                                     if abonnement_actif and plan_enregistre == 'essai':
                                         dialog.close()
                                         ui.notify(f'Vous avez déjà un abonnement actif ({abonnement_actif.plan})', type='warning')
-                                        db.close()
-                                        return
+                                        return None
                                     
                                     # Si c'est une formule payante (starter, pro, enterprise) et qu'il a un abonnement
                                     if abonnement_actif and plan_enregistre != 'essai':
-                                        add_progress_message('🔄 Mise à jour de votre abonnement...')
+                                        progress.push('🔄 Mise à jour de votre abonnement...')
                                         # Mettre à jour l'abonnement existant
                                         prix_plans = {
                                             'starter': Decimal('29.00'),
@@ -686,13 +736,12 @@ def demo_page(plan: str = ''):
                                         abonnement_actif.periode_essai = True
                                         abonnement_actif.date_fin_essai = datetime.utcnow() + timedelta(days=30)
                                         
-                                        db.commit()
+                                        await db.commit()
                                         dialog.close()
                                         ui.notify(f'✅ Abonnement mis à jour vers {plan_enregistre.upper()} - 30 jours d\'essai', type='positive')
-                                        db.close()
-                                        return
+                                        return None
                                 else:
-                                    add_progress_message('👤 Création de votre compte client...')
+                                    progress.push('👤 Création de votre compte client...')
                                     # Créer le client
                                     client = Client(
                                         nom=nom.value,
@@ -702,9 +751,9 @@ def demo_page(plan: str = ''):
                                         telephone=telephone.value
                                     )
                                     db.add(client)
-                                    db.flush()  # Pour obtenir l'ID du client
+                                    await db.flush()  # Pour obtenir l'ID du client
                                 
-                                add_progress_message('✅ Compte client créé')
+                                progress.push('✅ Compte client créé')
                                 
                                 # Définir le prix selon le plan
                                 prix_plans = {
@@ -715,7 +764,7 @@ def demo_page(plan: str = ''):
                                 }
                                 prix = prix_plans.get(plan_enregistre, Decimal('0.00'))
                                 
-                                add_progress_message(f'📋 Création de l\'abonnement {plan_enregistre.upper()}...')
+                                progress.push(f'📋 Création de l\'abonnement {plan_enregistre.upper()}...')
                                 
                                 # Créer l'abonnement avec période d'essai de 30 jours
                                 abonnement = Abonnement(
@@ -728,85 +777,75 @@ def demo_page(plan: str = ''):
                                     date_fin_essai=datetime.utcnow() + timedelta(days=30)
                                 )
                                 db.add(abonnement)
+                                await db.flush()
                                 
-                                db.commit()
-                                add_progress_message('✅ Abonnement créé avec succès')
-                                
-                                # Générer les paramètres pour la stack
-                                add_progress_message('🔐 Génération des identifiants sécurisés...')
-                                # Utiliser le prénom pour le nom du client (plus simple et unique)
-                                client_name = prenom.value.lower().replace(' ', '-').replace('\'', '')
-                                postgres_password = generate_password(16)
-                                secret_key = generate_secret_key(32)
-                                initial_password = generate_password(12)
-                                
-                                # Debug: afficher les identifiants générés
-                                print(f"DEBUG - client_name généré: {client_name}")
-                                print(f"DEBUG - initial_password généré: {initial_password}")
-                                
-                                add_progress_message('✅ Identifiants générés')
-                                
-                                # Exécuter le script de création de stack avec callback de progression
-                                result = await create_client_stack(
+                                # Le job est validé dans la même transaction que l'abonnement
+                                job = ProvisioningJob(
                                     client_id=client.id,
-                                    client_name=client_name,
-                                    postgres_password=postgres_password,
-                                    secret_key=secret_key,
-                                    initial_password=initial_password,
-                                    progress_callback=add_progress_message
+                                    abonnement_id=abonnement.id,
+                                    plan=plan_enregistre,
+                                    statut='en_attente'
                                 )
-                                
-                                success = result[0]
-                                message = result[1] if len(result) > 1 else ''
-                                app_port = result[2] if len(result) > 2 else '8080'
-                                
-                                if success:
-                                    add_progress_message('Instance déployée avec succès !')
-                                    
-                                    # Envoyer l'email de bienvenue
-                                    add_progress_message('📧 Envoi de l\'email de confirmation...')
-                                    saas_url = f"http://176.131.66.167:{app_port}"
-                                    email_sent = send_welcome_email(
-                                        email=email.value,
-                                        client_name=client_name,
-                                        password=initial_password,
-                                        url=saas_url,
-                                        plan=plan_enregistre
-                                    )
-                                    if email_sent:
-                                        add_progress_message('✅ Email de confirmation envoyé')
-                                    
-                                    await asyncio.sleep(1)
+                                db.add(job)
+                                await db.commit()
+                                progress.push('✅ Abonnement créé avec succès')
+                                return job.id, client.id, plan_enregistre
+                        
+                        def on_job_done(result):
+                            """Affiche le résultat du provisionnement (appelé par le worker)"""
+                            with dialog:
+                                if result.get('success'):
+                                    progress.stop()
                                     dialog.close()
                                     
                                     # Passer les informations via l'URL
                                     import urllib.parse
                                     params = urllib.parse.urlencode({
-                                        'client_name': client_name,
-                                        'pwd': initial_password,
-                                        'plan': plan_enregistre,
-                                        'port': app_port
+                                        'client_name': result['client_name'],
+                                        'pwd': result['password'],
+                                        'plan': result['plan'],
+                                        'port': result['port']
                                     })
-                                    print(f"DEBUG - Redirection avec params: {params}")
-                                    print(f"DEBUG - Port passé: {app_port}")
+                                    logger.debug("Redirection vers /felicitations", extra={'port': result['port']})
                                     ui.navigate.to(f'/felicitations?{params}')
                                 else:
-                                    add_progress_message('Problème lors du déploiement')
+                                    progress.push('Problème lors du déploiement')
+                                    progress.stop()
                                     dialog.close()
-                                    ui.notify(f'Abonnement créé mais erreur lors du déploiement : {message}', type='warning', timeout=8000)
-                                
-                                db.close()
-                                
-                            except Exception as e:
-                                add_progress_message(f'❌ Erreur : {str(e)}')
-                                db.rollback()
-                                dialog.close()
-                                ui.notify(f'Erreur lors de l\'enregistrement : {e}', type='negative')
-                            finally:
-                                db.close()
+                                    ui.notify(f'Abonnement créé mais erreur lors du déploiement : {result.get("message")}', type='warning', timeout=8000)
                         
-                        # Lancer la création de manière asynchrone
-                        await run_creation()
+                        try:
+                            inscription = await enregistrer_inscription()
+                            if inscription is None:
+                                return
+                            job_id, client_id, plan_enregistre = inscription
+                            
+                            # Le provisionnement est exécuté par un worker : le handler rend la main
+                            provisioning_queue.subscribe(
+                                job_id,
+                                on_progress=lambda event: progress.push(event.message),
+                                on_done=on_job_done
+                            )
+                            ui.context.client.on_disconnect(lambda: provisioning_queue.unsubscribe(job_id))
+                            provisioning_queue.submit(job_id, {
+                                'client_id': client_id,
+                                'prenom': prenom.value,
+                                'email': email.value,
+                                'plan': plan_enregistre,
+                            })
+                            progress.push('⏳ Création de votre instance en file d\'attente...')
+                        except ProvisioningQueueFull:
+                            # File remplie entre la vérification et l'enregistrement : le job reste
+                            # 'en_attente' et sera soumis dès qu'un provisionnement se termine
+                            provisioning_queue.unsubscribe(job_id)
+                            progress.stop()
+                            dialog.close()
+                            ui.notify('Inscription enregistrée : votre instance sera créée dès que possible, '
+                                      'vos identifiants vous seront envoyés par email', type='info', timeout=10000)
+                        except Exception as e:
+                            progress.push(f'❌ Erreur : {str(e)}')
+                            dialog.close()
+                            ui.notify(f'Erreur lors de l\'enregistrement : {e}', type='negative')
                 
                 ui.button('Démarrer mon essai gratuit', on_click=start_trial).classes('w-full bg-green-500 hover:bg-green-600 text-lg py-4 mt-4')
                 
@@ -819,15 +858,9 @@ def demo_page(plan: str = ''):
 def felicitations_page(client_name: str = 'client', pwd: str = '', plan: str = 'essai', port: str = '8080'):
     """Page de félicitation après création de la stack"""
     
-    # Debug: afficher les valeurs récupérées
-    print(f"DEBUG Félicitation - client_name: {client_name}")
-    print(f"DEBUG Félicitation - password: {pwd}")
-    print(f"DEBUG Félicitation - plan: {plan}")
-    print(f"DEBUG Félicitation - port: {port}")
-    
     # URL du SaaS (à adapter selon votre configuration)
     saas_url = f"http://176.131.66.167:{port}"
-    print(f"DEBUG Félicitation - saas_url: {saas_url}")
+    logger.debug("Page de félicitation", extra={'client_name': client_name, 'plan': plan, 'saas_url': saas_url})
     
     # Fonction JavaScript pour copier avec notification
     ui.add_head_html('''
@@ -924,50 +957,11 @@ def felicitations_page(client_name: str = 'client', pwd: str = '', plan: str = '
     
     create_footer()
 
-def fix_db_sequences():
-    """Corrige les séquences PostgreSQL si nécessaire"""
-    try:
-        from sqlalchemy import text
-        db = SessionLocal()
-        
-        tables = ['clients', 'abonnements', 'demo_requests']
-        
-        for table in tables:
-            try:
-                # Obtenir le maximum ID actuel
-                result = db.execute(text(f"SELECT MAX(id) FROM {table}"))
-                max_id = result.scalar()
-                
-                if max_id is not None:
-                    # Réinitialiser la séquence à max_id + 1
-                    sequence_name = f"{table}_id_seq"
-                    new_value = max_id + 1
-                    db.execute(text(f"SELECT setval('{sequence_name}', {new_value}, false)"))
-                    db.commit()
-            except Exception:
-                db.rollback()
-        
-        db.close()
-    except Exception:
-        pass  # Ignorer les erreurs silencieusement
-
 def main():
     """Lance le site commercial"""
-    # Initialiser les tables de la base de données si elles n'existent pas
-    try:
-        from database_config import Base, engine
-        print("🔧 Vérification/création des tables de la base de données...")
-        Base.metadata.create_all(engine)
-        print("✅ Base de données prête")
-        
-        # Corriger les séquences PostgreSQL
-        print("🔧 Vérification des séquences...")
-        fix_db_sequences()
-        print("✅ Séquences vérifiées")
-    except Exception as e:
-        print(f"⚠️ Avertissement : Impossible d'initialiser la base de données : {e}")
-        print("   L'application continuera mais les fonctionnalités nécessitant la BD seront indisponibles")
-    
+    startup_timer.mark('imports')
+    # La base de données est initialisée en arrière-plan (init_database) :
+    # le serveur écoute immédiatement, même si la base est lente ou injoignable
     ui.run(
         host='0.0.0.0',
         port=8000,
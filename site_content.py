@@ -0,0 +1,106 @@
+"""
+Contenu des pages vitrine du site commercial
+
+Partagé par les pages NiceGUI (site_commercial) et le rendu statique
+(static_pages) pour que les deux versions restent identiques.
+"""
+
+# Liens de l'en-tête (libellé, cible)
+NAV_LINKS = [
+    ('Accueil', '/'),
+    ('Fonctionnalités', '/fonctionnalites'),
+    ('Tarifs', '/tarifs'),
+    ('Contact', '/contact'),
+]
+
+# Liens rapides du pied de page
+FOOTER_LINKS = NAV_LINKS[1:]
+
+CONTACT_EMAIL = 'contact@erpbtp.fr'
+CONTACT_PHONE = '01 23 45 67 89'
+
+# Page d'accueil : cartes "Pourquoi choisir ERP BTP ?" (icône, couleur, titre, texte)
+HOME_CARDS = [
+    ('description', 'text-blue-600', 'Devis Professionnels',
+     'Créez des devis personnalisés en quelques clics. Templates professionnels inclus.'),
+    ('receipt', 'text-green-600', 'Facturation Simplifiée',
+     'Générez et envoyez vos factures automatiquement. Suivez les paiements en temps réel.'),
+    ('construction', 'text-orange-600', 'Gestion de Chantiers',
+     'Suivez tous vos chantiers, plannings et budgets depuis une seule interface.'),
+]
+
+# Page d'accueil : statistiques (valeur, libellé)
+HOME_STATS = [
+    ('500+', 'Entreprises clientes'),
+    ('10 000+', 'Devis créés par mois'),
+    ('99.9%', 'Disponibilité'),
+    ('4.9/5', 'Satisfaction client'),
+]
+
+# Page des fonctionnalités
+FEATURES = [
+    {'icon': 'people', 'title': 'Gestion Clients', 'desc': 'Base de données clients complète avec historique et documents'},
+    {'icon': 'construction', 'title': 'Projets & Chantiers', 'desc': 'Suivi détaillé de tous vos projets et chantiers'},
+    {'icon': 'description', 'title': 'Devis Personnalisés', 'desc': 'Modèles professionnels et calculs automatiques'},
+    {'icon': 'receipt', 'title': 'Facturation', 'desc': 'Création et envoi automatique de factures'},
+    {'icon': 'local_shipping', 'title': 'Fournisseurs', 'desc': 'Gestion de vos fournisseurs et sous-traitants'},
+    {'icon': 'dashboard', 'title': 'Tableau de Bord', 'desc': 'Vue d\'ensemble en temps réel de votre activité'},
+    {'icon': 'schedule', 'title': 'Planning', 'desc': 'Planification et suivi des interventions'},
+    {'icon': 'euro', 'title': 'Comptabilité', 'desc': 'Suivi financier et rapports comptables'},
+    {'icon': 'cloud', 'title': 'Cloud Sécurisé', 'desc': 'Accès partout, données sauvegardées et sécurisées'},
+    {'icon': 'phone_iphone', 'title': 'Mobile', 'desc': 'Accessible depuis tous vos appareils'},
+    {'icon': 'security', 'title': 'Sécurité', 'desc': 'Données cryptées et conformes RGPD'},
+    {'icon': 'support', 'title': 'Support', 'desc': 'Équipe support disponible et réactive'},
+]
+
+# Page des tarifs
+PLANS = [
+    {
+        'name': 'Starter',
+        'price': '29€',
+        'price_classes': 'text-5xl',
+        'period': 'par mois',
+        'card_classes': 'border-2 border-gray-200',
+        'items': ['Jusqu\'à 50 devis/mois', '5 utilisateurs', 'Gestion clients', 'Devis & Factures', 'Support email'],
+        'button': 'Commencer',
+        'target': '/demo?plan=starter',
+        'button_classes': 'bg-blue-600 hover:bg-blue-700',
+        'popular': False,
+    },
+    {
+        'name': 'Pro',
+        'price': '69€',
+        'price_classes': 'text-5xl',
+        'period': 'par mois',
+        'card_classes': 'border-4 border-blue-600 relative',
+        'items': ['Devis illimités', '15 utilisateurs', 'Toutes les fonctionnalités Starter', 'Gestion de chantiers',
+                  'Planning & Interventions', 'Rapports avancés', 'Support prioritaire'],
+        'button': 'Commencer',
+        'target': '/demo?plan=pro',
+        'button_classes': 'bg-green-500 hover:bg-green-600',
+        'popular': True,
+    },
+    {
+        'name': 'Enterprise',
+        'price': 'Sur mesure',
+        'price_classes': 'text-3xl',
+        'period': 'contactez-nous',
+        'card_classes': 'border-2 border-gray-200',
+        'items': ['Tout illimité', 'Utilisateurs illimités', 'Toutes les fonctionnalités Pro', 'API & Intégrations',
+                  'Formation personnalisée', 'Support dédié 24/7', 'SLA garanti'],
+        'button': 'Nous contacter',
+        'target': '/contact',
+        'button_classes': 'bg-blue-600 hover:bg-blue-700',
+        'popular': False,
+    },
+]
+
+PRICING_NOTE = '🎉 30 jours d\'essai gratuit - Sans engagement - Sans carte bancaire'
+
+# Page de contact : coordonnées (icône, titre, valeur)
+CONTACT_CARDS = [
+    ('email', 'Email', CONTACT_EMAIL),
+    ('phone', 'Téléphone', CONTACT_PHONE),
+    ('schedule', 'Horaires', 'Lun-Ven : 9h-18h'),
+    ('location_on', 'Adresse', 'Paris, France'),
+]
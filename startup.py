@@ -0,0 +1,48 @@
+"""
+Mesure des phases de démarrage
+
+Chaque phase (imports, démarrage du serveur, initialisation de la base...)
+est chronométrée et le détail est affiché puis exposé par /health.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Instant de référence : premier import de ce module
+PROCESS_START = time.perf_counter()
+
+
+class StartupTimer:
+    """Durées des phases de démarrage, dans l'ordre où elles se terminent"""
+
+    def __init__(self, origin=PROCESS_START):
+        self.origin = origin
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, start, end=None):
+        end = time.perf_counter() if end is None else end
+        with self._lock:
+            self.phases[name] = round((end - start) * 1000, 1)
+
+    def mark(self, name):
+        """Phase allant du début du processus jusqu'à maintenant"""
+        self.record(name, self.origin)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.phases)
+
+    def summary(self):
+        return ', '.join(f"{name} {duration:.0f} ms" for name, duration in self.snapshot().items())
+
+
+startup_timer = StartupTimer()
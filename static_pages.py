@@ -0,0 +1,301 @@
+"""
+Rendu statique des pages vitrine (/, /fonctionnalites, /tarifs, /contact)
+
+Ces pages n'ont aucun état : elles sont rendues une fois en HTML à partir de
+site_content puis servies directement par FastAPI avec ETag et Cache-Control,
+sans arbre d'éléments NiceGUI ni websocket par visiteur. Seule /demo reste
+une page NiceGUI.
+
+Activé par STATIC_PAGES=true. Les fichiers peuvent aussi être générés au build :
+    python static_pages.py dist/
+"""
+import hashlib
+import logging
+import os
+import sys
+from html import escape
+from fastapi import Request, Response
+from nicegui import __version__ as NICEGUI_VERSION
+from site_content import (
+    NAV_LINKS, FOOTER_LINKS, CONTACT_EMAIL, CONTACT_PHONE, HOME_CARDS, HOME_STATS,
+    FEATURES, PLANS, PRICING_NOTE, CONTACT_CARDS,
+)
+
+logger = logging.getLogger(__name__)
+
+STATIC_PAGES = os.getenv('STATIC_PAGES', 'false').lower() == 'true'
+# Durée de cache navigateur/proxy des pages statiques (secondes)
+STATIC_PAGES_MAX_AGE = int(os.getenv('STATIC_PAGES_MAX_AGE', '300'))
+
+TITLE = 'ERP BTP - Solution de Gestion pour le BTP'
+
+# Styles proches des composants Quasar utilisés par les pages NiceGUI
+CARD = 'bg-white rounded shadow-md'
+BUTTON = 'inline-block rounded shadow px-4 py-2 text-sm font-medium uppercase text-white text-center no-underline'
+
+
+def _icon(name, size, classes):
+    return f'<i class="material-icons {classes}" style="font-size: {size}">{escape(name)}</i>'
+
+
+def _link_button(label, target, classes):
+    return f'<a href="{escape(target)}" class="{BUTTON} {classes}">{escape(label)}</a>'
+
+
+def _layout(content, script=''):
+    static = f'/_nicegui/{NICEGUI_VERSION}/static'
+    nav = ''.join(
+        f'<a href="{target}" class="text-white hover:text-blue-200 no-underline">{escape(label)}</a>'
+        for label, target in NAV_LINKS
+    )
+    footer_links = ''.join(
+        f'<a href="{target}" class="text-gray-400 hover:text-white">{escape(label)}</a>'
+        for label, target in FOOTER_LINKS
+    )
+    return f"""<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{TITLE}</title>
+<link rel="icon" href="data:image/svg+xml,<svg xmlns=%22http://www.w3.org/2000/svg%22 viewBox=%220 0 100 100%22><text y=%22.9em%22 font-size=%2290%22>🏗️</text></svg>">
+<link rel="stylesheet" href="{static}/fonts.css">
+<script src="{static}/tailwindcss.min.js"></script>
+<style>body {{ font-family: Roboto, sans-serif; margin: 0; }}</style>
+</head>
+<body>
+<header class="bg-gradient-to-r from-blue-700 to-blue-900 text-white shadow-lg sticky top-0 z-10">
+  <div class="w-full max-w-7xl mx-auto px-4 py-4 flex items-center">
+    <a href="/" class="no-underline"><span class="text-2xl font-bold text-white">🏗️ ERP BTP</span></a>
+    <div class="flex-grow"></div>
+    <nav class="flex gap-6 items-center">{nav}{_link_button('Essai Gratuit', '/demo', 'bg-green-500 hover:bg-green-600')}</nav>
+  </div>
+</header>
+{content}
+<footer class="bg-gray-800 text-white w-full">
+  <div class="w-full max-w-7xl mx-auto px-4 py-8 flex flex-col">
+    <div class="w-full flex justify-between">
+      <div class="flex flex-col gap-2"><span class="text-xl font-bold mb-2">ERP BTP</span><span class="text-gray-400">Solution de gestion complète pour le BTP</span></div>
+      <div class="flex flex-col gap-2"><span class="font-bold mb-2">Liens rapides</span>{footer_links}</div>
+      <div class="flex flex-col gap-2"><span class="font-bold mb-2">Contact</span><span class="text-gray-400">📧 {CONTACT_EMAIL}</span><span class="text-gray-400">📞 {CONTACT_PHONE}</span></div>
+    </div>
+    <hr class="my-4 border-gray-700">
+    <span class="text-center text-gray-500">© 2025 ERP BTP - Tous droits réservés</span>
+  </div>
+</footer>
+{script}
+</body>
+</html>
+"""
+
+
+def render_home():
+    cards = ''.join(f"""
+        <div class="{CARD} flex-1 min-w-[300px] max-w-[350px] p-6 flex flex-col gap-2">
+          {_icon(icon, '3em', f'{color} mb-4')}
+          <span class="text-2xl font-bold mb-2">{escape(title)}</span>
+          <span class="text-gray-600">{escape(desc)}</span>
+        </div>""" for icon, color, title, desc in HOME_CARDS)
+    stats = ''.join(f"""
+        <div class="text-center flex flex-col">
+          <span class="text-5xl font-bold mb-2">{escape(value)}</span>
+          <span class="text-xl">{escape(label)}</span>
+        </div>""" for value, label in HOME_STATS)
+    return _layout(f"""
+<section class="w-full bg-gradient-to-br from-blue-50 to-blue-100 py-20">
+  <div class="max-w-7xl mx-auto px-4 text-center flex flex-col">
+    <span class="text-5xl font-bold text-gray-800 mb-4">La Solution de Gestion Complète</span>
+    <span class="text-5xl font-bold text-blue-700 mb-6">pour les Entreprises du BTP</span>
+    <span class="text-xl text-gray-600 mb-8">Gérez vos devis, factures, chantiers et clients en toute simplicité</span>
+    <div class="flex gap-4 justify-center">{_link_button("Démarrer l'essai gratuit", '/demo?plan=essai', 'bg-green-500 hover:bg-green-600 px-8 py-4 text-lg')}</div>
+  </div>
+</section>
+<section class="w-full py-16">
+  <div class="max-w-7xl mx-auto px-4 flex flex-col">
+    <span class="text-4xl font-bold text-center text-gray-800 mb-12">Pourquoi choisir ERP BTP ?</span>
+    <div class="w-full flex gap-8 flex-wrap justify-center">{cards}
+    </div>
+  </div>
+</section>
+<section class="w-full bg-blue-700 text-white py-16">
+  <div class="max-w-7xl mx-auto px-4">
+    <div class="w-full flex justify-around flex-wrap gap-8">{stats}
+    </div>
+  </div>
+</section>
+<section class="w-full py-16 bg-gray-50">
+  <div class="max-w-7xl mx-auto px-4 text-center flex flex-col items-center">
+    <span class="text-4xl font-bold text-gray-800 mb-6">Prêt à transformer votre gestion ?</span>
+    <span class="text-xl text-gray-600 mb-8">Essayez ERP BTP gratuitement pendant 30 jours</span>
+    {_link_button('Commencer maintenant', '/demo', 'bg-green-500 hover:bg-green-600 px-12 py-4 text-lg')}
+  </div>
+</section>""")
+
+
+def render_features():
+    cards = ''.join(f"""
+        <div class="{CARD} flex-1 min-w-[280px] max-w-[350px] p-6 flex flex-col gap-2">
+          {_icon(feature['icon'], '2.5em', 'text-blue-600 mb-3')}
+          <span class="text-xl font-bold mb-2">{escape(feature['title'])}</span>
+          <span class="text-gray-600">{escape(feature['desc'])}</span>
+        </div>""" for feature in FEATURES)
+    return _layout(f"""
+<section class="w-full py-16">
+  <div class="max-w-7xl mx-auto px-4 flex flex-col">
+    <span class="text-4xl font-bold text-center text-gray-800 mb-4">Fonctionnalités Complètes</span>
+    <span class="text-xl text-center text-gray-600 mb-12">Tout ce dont vous avez besoin pour gérer votre entreprise BTP</span>
+    <div class="w-full flex gap-6 flex-wrap">{cards}
+    </div>
+  </div>
+</section>""")
+
+
+def render_pricing():
+    cards = []
+    for plan in PLANS:
+        badge = ('<span class="absolute -top-3 left-1/2 -translate-x-1/2 bg-blue-600 text-white text-xs '
+                 'rounded px-2 py-1">Populaire</span>') if plan['popular'] else ''
+        items = ''.join(f'<span class="text-gray-700">✓ {escape(item)}</span>' for item in plan['items'])
+        cards.append(f"""
+        <div class="{CARD} flex-1 min-w-[300px] max-w-[350px] p-8 flex flex-col {plan['card_classes']}">
+          {badge}
+          <span class="text-2xl font-bold mb-4 text-center">{escape(plan['name'])}</span>
+          <span class="{plan['price_classes']} font-bold text-center text-blue-600 mb-2">{escape(plan['price'])}</span>
+          <span class="text-center text-gray-600 mb-6">{escape(plan['period'])}</span>
+          <div class="flex flex-col gap-3 mb-6">{items}</div>
+          {_link_button(plan['button'], plan['target'], f"w-full {plan['button_classes']}")}
+        </div>""")
+    return _layout(f"""
+<section class="w-full py-16">
+  <div class="max-w-7xl mx-auto px-4 flex flex-col">
+    <span class="text-4xl font-bold text-center text-gray-800 mb-4">Tarifs Transparents</span>
+    <span class="text-xl text-center text-gray-600 mb-12">Choisissez le plan adapté à votre entreprise</span>
+    <div class="w-full flex gap-8 justify-center flex-wrap">{''.join(cards)}
+    </div>
+    <div class="w-full text-center mt-12"><span class="text-lg font-bold text-green-600">{escape(PRICING_NOTE)}</span></div>
+  </div>
+</section>""")
+
+
+# Même comportement que la page NiceGUI : validation des champs obligatoires
+# puis message de confirmation et remise à zéro du formulaire
+CONTACT_SCRIPT = """<script>
+document.getElementById('contact-form').addEventListener('submit', function (event) {
+  event.preventDefault();
+  var form = event.target, notice = document.getElementById('contact-notice');
+  var valid = ['nom', 'email', 'message'].every(function (name) { return form.elements[name].value.trim(); });
+  notice.className = 'mt-4 rounded p-3 text-white ' + (valid ? 'bg-green-600' : 'bg-red-600');
+  notice.textContent = valid ? 'Message envoyé ! Nous vous répondrons sous 24h'
+                             : 'Veuillez remplir tous les champs obligatoires';
+  if (valid) { form.reset(); }
+});
+</script>"""
+
+
+def render_contact():
+    field = 'w-full border-b border-gray-400 py-2 mb-4 outline-none focus:border-blue-600'
+    cards = ''.join(f"""
+        <div class="{CARD} p-6 flex flex-col">
+          {_icon(icon, '2em', 'text-blue-600 mb-2')}
+          <span class="font-bold mb-1">{escape(title)}</span>
+          <span class="text-gray-600">{escape(value)}</span>
+        </div>""" for icon, title, value in CONTACT_CARDS)
+    return _layout(f"""
+<section class="w-full py-16">
+  <div class="max-w-4xl mx-auto px-4 flex flex-col">
+    <span class="text-4xl font-bold text-center text-gray-800 mb-4">Contactez-nous</span>
+    <span class="text-xl text-center text-gray-600 mb-12">Notre équipe est là pour répondre à vos questions</span>
+    <div class="w-full flex gap-12 flex-wrap">
+      <form id="contact-form" class="{CARD} flex-1 min-w-[400px] p-8 flex flex-col" novalidate>
+        <span class="text-2xl font-bold mb-6">Envoyez-nous un message</span>
+        <input name="nom" placeholder="Nom complet *" class="{field}">
+        <input name="email" type="email" placeholder="Email *" class="{field}">
+        <input name="entreprise" placeholder="Entreprise" class="{field}">
+        <input name="telephone" placeholder="Téléphone" class="{field}">
+        <textarea name="message" placeholder="Message *" rows="4" class="{field}"></textarea>
+        <button type="submit" class="{BUTTON} w-full bg-blue-600 hover:bg-blue-700 mt-4">Envoyer</button>
+        <div id="contact-notice" class="hidden"></div>
+      </form>
+      <div class="flex-1 min-w-[300px] flex flex-col gap-6">{cards}
+      </div>
+    </div>
+  </div>
+</section>""", script=CONTACT_SCRIPT)
+
+
+RENDERERS = {
+    '/': render_home,
+    '/fonctionnalites': render_features,
+    '/tarifs': render_pricing,
+    '/contact': render_contact,
+}
+
+
+class StaticPage:
+    """Page rendue une fois : corps encodé et ETag calculés au démarrage"""
+
+    def __init__(self, html_content):
+        self.body = html_content.encode('utf-8')
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+
+    def response(self, request: Request):
+        headers = {
+            'ETag': self.etag,
+            'Cache-Control': f'public, max-age={STATIC_PAGES_MAX_AGE}',
+        }
+        if self.etag in request.headers.get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type='text/html; charset=utf-8', headers=headers)
+
+
+def render_all():
+    """Rend les pages vitrine : {chemin: StaticPage} (une page en erreur est omise)"""
+    pages = {}
+    for path, render in RENDERERS.items():
+        try:
+            pages[path] = StaticPage(render())
+        except Exception:
+            logger.exception("❌ Rendu statique de la page %s impossible", path)
+    return pages
+
+
+def serve_static_pages(app):
+    """
+    Enregistre les pages pré-rendues comme routes FastAPI de l'application NiceGUI
+
+    Returns:
+        dict: pages servies ; les chemins absents restent à servir par NiceGUI
+    """
+    pages = render_all()
+    for path, page in pages.items():
+        app.add_api_route(path, page.response, methods=['GET', 'HEAD'], include_in_schema=False)
+    logger.info("📄 %s pages vitrine pré-rendues (cache %ss)", len(pages), STATIC_PAGES_MAX_AGE)
+    return pages
+
+
+def write_static_pages(output_dir):
+    """
+    Génère les fichiers HTML (ex. pour un CDN ou un serveur web devant l'application)
+
+    Returns:
+        int: nombre de pages en erreur
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    failures = 0
+    for path, render in RENDERERS.items():
+        name = os.path.join(output_dir, 'index.html' if path == '/' else f"{path.strip('/')}.html")
+        try:
+            content = render()
+            with open(name, 'w', encoding='utf-8') as f:
+                f.write(content)
+        except Exception:
+            logger.exception("❌ Génération de %s impossible (%s)", name, path)
+            failures += 1
+            continue
+        logger.info("✅ %s -> %s", path, name)
+    return failures
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(1 if write_static_pages(sys.argv[1] if len(sys.argv) > 1 else 'dist') else 0)
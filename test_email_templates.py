@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Tests des modèles d'emails
+"""
+from email import message_from_bytes
+from email.header import decode_header, make_header
+from email_templates import WELCOME, build_message, welcome_fields
+
+
+def test_welcome_render_substitutes_and_escapes():
+    subject, text, html_body = WELCOME.render(**welcome_fields('dupont', 'a$b<&>c', 'http://h:8081', 'pro'))
+
+    assert subject.startswith('🎉 Bienvenue')
+    assert "Mot de passe temporaire : a$b<&>c" in text
+    assert "Formule : PRO" in text
+    assert '<span class="value">a$b&lt;&amp;&gt;c</span>' in html_body
+    assert '<a href="http://h:8081"' in html_body
+    assert 'font-family: Arial' in html_body  # CSS intact
+
+
+def test_batch_render_matches_single_render():
+    rows = [welcome_fields(f'client{i}', f'pw{i}', f'http://h:{8080 + i}', 'essai') for i in range(3)]
+
+    assert WELCOME.render_batch(rows) == [WELCOME.render(**fields) for fields in rows]
+
+
+def test_mime_message_round_trip():
+    subject, text, html_body = WELCOME.render(**welcome_fields('dupont', 'secret', 'http://h:8080', 'essai'))
+
+    raw = build_message(subject, 'client@example.com', 'noreply@erpbtp.fr', text, html_body)
+    parsed = message_from_bytes(raw)
+    plain, rich = parsed.get_payload()
+
+    assert str(make_header(decode_header(parsed['Subject']))) == subject
+    assert plain.get_content_type() == 'text/plain'
+    assert plain.get_payload(decode=True).decode('utf-8') == text
+    assert rich.get_payload(decode=True).decode('utf-8') == html_body
+    assert parsed['To'] == 'client@example.com'
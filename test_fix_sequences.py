@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Vérifie la réparation des séquences sur des tables temporaires.
+
+Nécessite une base PostgreSQL accessible (variables DB_* de database_config) ;
+les tests sont ignorés sinon. Tout est fait dans une transaction annulée.
+"""
+import pytest
+from sqlalchemy import text
+from database_config import engine
+from fix_sequences import repair_sequences
+
+
+@pytest.fixture
+def conn():
+    try:
+        connection = engine.connect()
+    except Exception as e:
+        pytest.skip(f"PostgreSQL indisponible : {e}")
+    transaction = connection.begin()
+    connection.execute(text("CREATE TABLE test_seq_serial (id SERIAL PRIMARY KEY)"))
+    connection.execute(text("CREATE TABLE test_seq_identity (id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY)"))
+    yield connection
+    transaction.rollback()
+    connection.close()
+
+
+def _changes_for(changes, table):
+    return [change for change in changes if change['table'] == table]
+
+
+def test_lagging_sequences_are_repaired(conn):
+    # Données insérées avec des ID explicites (comme après une restauration)
+    conn.execute(text("INSERT INTO test_seq_serial (id) VALUES (1), (2), (42)"))
+    conn.execute(text("INSERT INTO test_seq_identity (id) VALUES (7)"))
+
+    changes = repair_sequences(conn)
+
+    assert _changes_for(changes, 'test_seq_serial')[0]['new_next'] == 43
+    assert _changes_for(changes, 'test_seq_identity')[0]['new_next'] == 8
+    assert conn.execute(text("INSERT INTO test_seq_serial DEFAULT VALUES RETURNING id")).scalar() == 43
+    assert conn.execute(text("INSERT INTO test_seq_identity DEFAULT VALUES RETURNING id")).scalar() == 8
+
+
+def test_correct_sequences_are_skipped(conn):
+    conn.execute(text("INSERT INTO test_seq_serial DEFAULT VALUES"))
+
+    changes = repair_sequences(conn)
+
+    assert not _changes_for(changes, 'test_seq_serial')
+    assert not _changes_for(changes, 'test_seq_identity')  # table vide
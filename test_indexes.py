@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Vérifie via EXPLAIN que les requêtes critiques utilisent un index.
+
+Nécessite une base PostgreSQL accessible (variables DB_* de database_config) ;
+les tests sont ignorés sinon. Les migrations sont appliquées dans un schéma
+temporaire, supprimé à la fin, comme dans test_migrations. Les parcours séquentiels sont désactivés le
+temps de la transaction pour que le résultat ne dépende pas du volume de
+données : on vérifie que l'index est utilisable, pas que le planificateur
+le préfère sur une table presque vide.
+"""
+import os
+import pytest
+from sqlalchemy import create_engine, text
+from database_config import engine
+from migrations import migrate
+
+SCHEMA = f"test_indexes_{os.getpid()}"
+
+# Requêtes critiques et index attendu pour chacune
+HOT_QUERIES = {
+    "recherche client par nom (API client-id)": (
+        "SELECT id FROM clients WHERE nom = 'dupont' ORDER BY id DESC LIMIT 1",
+        "ix_clients_nom_id",
+    ),
+    "abonnement actif d'un client (/demo)": (
+        "SELECT id FROM abonnements WHERE client_id = 1 AND statut = 'actif' LIMIT 1",
+        "ix_abonnements_client_actif",
+    ),
+    "demandes de démo par période (rapports)": (
+        "SELECT id FROM demo_requests WHERE date >= NOW() - INTERVAL '30 days'",
+        "ix_demo_requests_date",
+    ),
+}
+
+
+def _index_names(plan):
+    """Retourne les index utilisés par un plan EXPLAIN (FORMAT JSON)"""
+    names = set()
+    if 'Index Name' in plan:
+        names.add(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        names |= _index_names(child)
+    return names
+
+
+@pytest.fixture(scope='module')
+def conn():
+    try:
+        with engine.begin() as admin:
+            admin.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    except Exception as e:
+        pytest.skip(f"Base de données inaccessible : {e}")
+    scratch = create_engine(engine.url, connect_args={'options': f'-c search_path={SCHEMA}'})
+    try:
+        migrate(scratch, verbose=False)
+        connection = scratch.connect()
+        yield connection
+        connection.close()
+    finally:
+        scratch.dispose()
+        with engine.begin() as admin:
+            admin.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+
+@pytest.mark.parametrize('label', list(HOT_QUERIES))
+def test_hot_query_uses_index(conn, label):
+    query, expected_index = HOT_QUERIES[label]
+    with conn.begin() as transaction:
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()[0]['Plan']
+        transaction.rollback()
+    assert expected_index in _index_names(plan), f"{label} : {expected_index} non utilisé"
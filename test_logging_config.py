@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests de la configuration des logs : niveaux par module, écriture par le
+thread de fond et masquage des secrets
+"""
+import io
+import json
+import logging
+import pytest
+from logging_config import redact_text, setup_logging, stop_logging
+
+
+@pytest.fixture
+def output():
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    stream = io.StringIO()
+    setup_logging(level='WARNING', levels='test_logs.verbeux=DEBUG', fmt='json', stream=stream)
+    yield stream
+    stop_logging()
+    root.handlers, level = saved
+    root.setLevel(level)
+    logging.getLogger('test_logs.verbeux').setLevel(logging.NOTSET)
+
+
+def _lines(stream):
+    stop_logging()  # vide la file
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_levels_are_set_per_module(output):
+    logging.getLogger('test_logs.normal').info("ignoré")
+    logging.getLogger('test_logs.normal').warning("conservé")
+    logging.getLogger('test_logs.verbeux').debug("détail %s", 42, extra={'port': 8080})
+
+    lines = _lines(output)
+    assert [line['message'] for line in lines] == ["conservé", "détail 42"]
+    assert lines[1]['port'] == 8080
+    assert lines[1]['logger'] == 'test_logs.verbeux'
+
+
+def test_secrets_are_redacted(output):
+    logger = logging.getLogger('test_logs.verbeux')
+    logger.debug("Identifiants générés", extra={'client_name': 'dupont', 'initial_password': 'Xy7$abc'})
+    logger.warning("Connexion refusée password=%s token: %s", 'hunter2', 'eyJhbGci')
+
+    text = output.getvalue() + json.dumps(_lines(output))
+    assert 'Xy7$abc' not in text and 'hunter2' not in text and 'eyJhbGci' not in text
+    assert 'dupont' in text
+
+
+def test_redact_text():
+    assert redact_text('/felicitations?client_name=a&pwd=s3cret&plan=pro') == \
+        '/felicitations?client_name=a&pwd=***&plan=pro'
+    assert redact_text('Mot de passe : abc123') == 'Mot de passe : ***'
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests de la file d'envoi des emails contre le faux serveur SMTP local
+"""
+import asyncio
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from fake_smtp import FakeSMTP
+from mail_queue import MailSender, SMTPConnection
+from models import OutboundEmail
+
+
+def _sender(fake, **kwargs):
+    """MailSender sur une base SQLite en mémoire et le faux serveur SMTP"""
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    OutboundEmail.__table__.create(engine)
+    connection = SMTPConnection(server=fake.host, port=fake.port, user=fake.username,
+                                password=fake.password, starttls=False)
+    return MailSender(session_factory=sessionmaker(bind=engine), connection=connection,
+                      from_email='noreply@erpbtp.fr', **kwargs)
+
+
+def _emails(sender):
+    db = sender.session_factory()
+    try:
+        return db.query(OutboundEmail).order_by(OutboundEmail.id).all()
+    finally:
+        db.close()
+
+
+def test_connection_is_reused_and_bodies_purged():
+    with FakeSMTP(username='erp', password='secret') as fake:
+        sender = _sender(fake)
+        for i in range(5):
+            sender.enqueue(f'client{i}@example.com', 'Bienvenue', f'mot de passe {i}', '<p>html</p>')
+
+        assert sender.process_due() == 5
+        sender.connection.close()
+
+        assert len(fake.messages) == 5
+        assert fake.connection_count == 1
+        assert fake.auth_count == 1
+        assert fake.messages[0]['to'] == ['client0@example.com']
+        for email in _emails(sender):
+            assert email.statut == 'envoye'
+            assert email.corps_texte is None and email.corps_html is None
+
+
+def test_temporary_failure_is_retried_with_backoff():
+    with FakeSMTP() as fake:
+        sender = _sender(fake, retry_base=60)
+        sender.enqueue('client@example.com', 'Bienvenue', 'texte')
+        fake.fail_next()
+
+        assert sender.process_due() == 1
+        [email] = _emails(sender)
+        assert email.statut == 'en_attente'
+        assert email.tentatives == 1
+        assert email.prochaine_tentative > datetime.utcnow()
+        assert email.corps_texte == 'texte'
+
+        # Pas encore à échéance
+        assert sender.process_due() == 0
+
+        db = sender.session_factory()
+        db.query(OutboundEmail).update({'prochaine_tentative': datetime.utcnow()})
+        db.commit()
+        db.close()
+
+        assert sender.process_due() == 1
+        assert _emails(sender)[0].statut == 'envoye'
+        assert len(fake.messages) == 1
+
+
+def test_gives_up_after_max_attempts():
+    with FakeSMTP() as fake:
+        sender = _sender(fake, max_attempts=2, retry_base=0)
+        sender.enqueue('client@example.com', 'Bienvenue', 'texte')
+        fake.fail_next(5)
+
+        sender.process_due()
+        sender.process_due()
+
+        [email] = _emails(sender)
+        assert email.statut == 'echec'
+        assert email.tentatives == 2
+        assert '451' in email.derniere_erreur
+        assert email.corps_texte is None and email.corps_html is None
+
+
+def test_reconnects_when_server_closes_connection():
+    with FakeSMTP(max_messages_per_connection=2) as fake:
+        sender = _sender(fake)
+        for i in range(3):
+            sender.enqueue(f'client{i}@example.com', 'Bienvenue', 'texte')
+
+        sender.process_due()
+
+        assert len(fake.messages) == 3
+        assert fake.connection_count == 2
+        assert all(email.statut == 'envoye' for email in _emails(sender))
+
+
+def test_background_sender_is_woken_by_enqueue():
+    with FakeSMTP() as fake:
+        sender = _sender(fake, poll_interval=60)
+
+        async def scenario():
+            sender.start()
+            try:
+                await sender.enqueue_async('client@example.com', 'Bienvenue', 'texte')
+                for _ in range(100):
+                    if fake.messages:
+                        break
+                    await asyncio.sleep(0.02)
+            finally:
+                await sender.stop()
+
+        asyncio.run(scenario())
+        assert len(fake.messages) == 1
+        assert sender.stats()['sent'] == 1
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests des métriques Prometheus : format texte, tranches des histogrammes et
+libellé de route des requêtes HTTP
+"""
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from metrics import (CONTENT_TYPE, DB_QUERY_DURATION, HTTP_REQUEST_DURATION, Counter, Gauge, Histogram, Registry,
+                     instrument_app, watch_queries)
+
+
+def test_text_format():
+    registry = Registry()
+    jobs = Counter('jobs_total', "Jobs terminés", ['result'], registry=registry)
+    jobs.inc('succes')
+    jobs.inc('succes', amount=2)
+    Gauge('file', "Jobs en attente", lambda: 4, registry=registry)
+    Gauge('pool', "Connexions", lambda: {('libre',): 1, ('empruntee',): 2}, ['state'], registry=registry)
+    Gauge('indisponible', "Source en erreur", lambda: 1 / 0, registry=registry)
+
+    assert registry.render().splitlines() == [
+        '# HELP jobs_total Jobs terminés',
+        '# TYPE jobs_total counter',
+        'jobs_total{result="succes"} 3',
+        '# HELP file Jobs en attente',
+        '# TYPE file gauge',
+        'file 4',
+        '# HELP pool Connexions',
+        '# TYPE pool gauge',
+        'pool{state="libre"} 1',
+        'pool{state="empruntee"} 2',
+        '# HELP indisponible Source en erreur',
+        '# TYPE indisponible gauge',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    durations = Histogram('duree_seconds', "Durée", ['phase'], buckets=(0.25, 1), registry=registry)
+    for value in (0.125, 0.25, 0.5, 3):
+        durations.observe(value, 'stack')
+
+    assert durations.samples() == [
+        'duree_seconds_bucket{phase="stack",le="0.25"} 2',
+        'duree_seconds_bucket{phase="stack",le="1"} 3',
+        'duree_seconds_bucket{phase="stack",le="+Inf"} 4',
+        'duree_seconds_sum{phase="stack"} 3.875',
+        'duree_seconds_count{phase="stack"} 4',
+    ]
+
+
+def test_duplicate_name_is_rejected():
+    registry = Registry()
+    Counter('jobs_total', "Jobs", registry=registry)
+    try:
+        Counter('jobs_total', "Jobs", registry=registry)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("nom de métrique en double accepté")
+
+
+def test_requests_are_labelled_by_route_template():
+    app = FastAPI()
+    instrument_app(app)
+
+    @app.get('/clients/{client_id}')
+    def get_client(client_id: int):
+        return {'id': client_id}
+
+    client = TestClient(app)
+    for client_id in (1, 2, 3):
+        assert client.get(f'/clients/{client_id}').status_code == 200
+    assert client.get('/inconnue').status_code == 404
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'] == CONTENT_TYPE
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/clients/{client_id}",status="200"} 3' in body
+    assert 'route="/clients/1"' not in body
+    assert ('GET', 'non_routee', '404') in HTTP_REQUEST_DURATION._series
+
+
+def test_failed_query_does_not_skew_the_next_one():
+    engine = create_engine('sqlite://')
+    watch_queries(engine, 'test_erreur')
+    with engine.connect() as conn:
+        try:
+            conn.execute(text('SELECT * FROM table_absente'))
+        except Exception:
+            pass
+        time.sleep(0.2)
+        conn.execute(text('SELECT 1'))
+
+    samples = dict(line.rsplit(' ', 1) for line in DB_QUERY_DURATION.samples() if 'source="test_erreur"' in line)
+    assert samples['db_query_duration_seconds_count{source="test_erreur"}'] == '1'
+    assert float(samples['db_query_duration_seconds_sum{source="test_erreur"}']) < 0.2
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Applique les migrations dans un schéma PostgreSQL temporaire et vérifie que le
+résultat correspond aux modèles (colonnes et index).
+
+Nécessite une base PostgreSQL accessible (variables DB_* de database_config) ;
+les tests sont ignorés sinon. Le schéma temporaire est supprimé à la fin.
+"""
+import os
+import threading
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from client_id_api import client_key
+from database_config import Base, engine
+from migrations import HEAD, REVISIONS, Backfill, dry_run, migrate
+
+SCHEMA = f"test_migrations_{os.getpid()}"
+
+
+@pytest.fixture
+def scratch_engine():
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    except Exception as e:
+        pytest.skip(f"PostgreSQL indisponible : {e}")
+    scratch = create_engine(engine.url, connect_args={'options': f'-c search_path={SCHEMA}'})
+    yield scratch
+    scratch.dispose()
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+
+def test_migrations_match_models(scratch_engine):
+    report = dry_run(scratch_engine)
+    assert {line['revision'] for line in report} == {revision.revision for revision in REVISIONS if revision.operations}
+
+    assert migrate(scratch_engine, verbose=False)[-1] == HEAD
+    assert migrate(scratch_engine, verbose=False) == []
+    assert dry_run(scratch_engine) == []
+
+    inspector = inspect(scratch_engine)
+    for table in Base.metadata.sorted_tables:
+        columns = {column['name'] for column in inspector.get_columns(table.name, schema=SCHEMA)}
+        assert columns == set(table.columns.keys()), table.name
+        indexes = {index['name'] for index in inspector.get_indexes(table.name, schema=SCHEMA)}
+        assert {index.name for index in table.indexes} <= indexes, table.name
+
+
+def test_backfill_waits_for_locked_rows(scratch_engine):
+    migrate(scratch_engine, verbose=False)
+    with scratch_engine.begin() as conn:
+        for i in range(3):
+            conn.execute(text("""
+                INSERT INTO clients (nom, email, entreprise)
+                VALUES (:nom, :email, 'Test SARL')
+            """), {'nom': f'Client {i}', 'email': f'lock{i}@example.com'})
+
+    backfill = Backfill('clients', "cle_client = 'cle.' || id", "cle_client IS NULL", batch_size=2)
+    result = {}
+    with scratch_engine.connect() as locker:
+        locker.execute(text("SELECT id FROM clients ORDER BY id LIMIT 1 FOR UPDATE"))
+        worker = threading.Thread(target=lambda: result.update(total=backfill.run(scratch_engine)))
+        worker.start()
+        worker.join(0.3)
+        assert worker.is_alive()  # attend la ligne verrouillée au lieu de la sauter
+        locker.commit()
+    worker.join(10)
+
+    assert result == {'total': 3}
+    with scratch_engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM clients WHERE cle_client IS NULL")).scalar() == 0
+
+
+def test_dry_run_with_column_added_by_the_revision(scratch_engine):
+    migrate(scratch_engine, verbose=False)
+    with scratch_engine.begin() as conn:
+        client_id = conn.execute(text("""
+            INSERT INTO clients (nom, email, entreprise)
+            VALUES ('Test', 'dryrun@example.com', 'Test SARL') RETURNING id
+        """)).scalar()
+        conn.execute(text("""
+            INSERT INTO provisioning_jobs (client_id, plan, statut, date_creation)
+            VALUES (:client_id, 'essai', 'termine', NOW())
+        """), {'client_id': client_id})
+        conn.execute(text("ALTER TABLE provisioning_jobs DROP COLUMN etape"))
+        conn.execute(text("DELETE FROM schema_migrations WHERE revision = '0006'"))
+
+    report = dry_run(scratch_engine)
+    backfill = next(line for line in report if line['operation'].startswith('mise à jour de provisioning_jobs'))
+    assert backfill['revision'] == '0006'
+    assert backfill['lignes'] >= 1  # toutes les lignes : etape n'existe pas encore
+
+    assert migrate(scratch_engine, verbose=False) == ['0006']
+
+
+def test_backfill_fills_client_keys(scratch_engine):
+    migrate(scratch_engine, verbose=False)
+    with scratch_engine.begin() as conn:
+        for nom, email, cle in [
+            ('Jean Dupont ', 'jd1@example.com', None),
+            ('jean dupont', 'jd2@example.com', None),  # homonyme plus récent : reçoit la clé
+            ('Martin', 'm1@example.com', 'martin'),    # créé par l'API
+            ('MARTIN', 'm2@example.com', None),
+        ]:
+            conn.execute(text("""
+                INSERT INTO clients (nom, email, entreprise, cle_client)
+                VALUES (:nom, :email, 'Test SARL', :cle)
+            """), {'nom': nom, 'email': email, 'cle': cle})
+        conn.execute(text("DELETE FROM schema_migrations WHERE revision = '0007'"))
+
+    assert migrate(scratch_engine, verbose=False) == ['0007']
+    with scratch_engine.connect() as conn:
+        keys = dict(conn.execute(text("SELECT email, cle_client FROM clients")).all())
+    assert keys == {
+        'jd1@example.com': None,
+        'jd2@example.com': client_key('jean dupont'),
+        'm1@example.com': 'martin',
+        'm2@example.com': None,
+    }
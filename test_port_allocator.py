@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests du registre des ports : réservations concurrentes, plage gérée,
+réconciliation avec Portainer (premier passage retenté rapidement, ports
+confirmés pendant la lecture conservés)
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import port_allocator
+from database_config import engine
+from migrations import migrate
+from port_allocator import PortReconciler, apply_reconciliation, confirm_port, database_time, reserve_port
+
+
+def test_first_reconcile_is_retried_quickly(monkeypatch):
+    calls = []
+
+    async def reconcile_ports():
+        calls.append(asyncio.get_running_loop().time())
+        if len(calls) < 3:
+            raise ConnectionError('Portainer indisponible')
+        return {'externes': 2, 'liberes': 0}
+
+    monkeypatch.setattr(port_allocator, 'reconcile_ports', reconcile_ports)
+
+    async def scenario():
+        reconciler = PortReconciler(interval=300, retry=0.01)
+        reconciler.start()
+        await asyncio.wait_for(reconciler.wait_reconciled(), timeout=2)
+        await reconciler.stop()
+
+    asyncio.run(scenario())
+    assert len(calls) == 3
+    assert calls[2] - calls[0] < 1
+
+
+# --- Registre dans PostgreSQL ------------------------------------------------
+# Nécessite une base PostgreSQL accessible (variables DB_* de database_config) ;
+# ignorés sinon. Le registre est créé dans un schéma temporaire, supprimé à la fin.
+
+SCHEMA = f"test_ports_{os.getpid()}"
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    except Exception as e:
+        pytest.skip(f"PostgreSQL indisponible : {e}")
+    scratch = create_engine(engine.url, pool_size=10, connect_args={'options': f'-c search_path={SCHEMA}'})
+    try:
+        migrate(scratch, verbose=False)
+        monkeypatch.setattr(port_allocator, 'engine', scratch)
+        yield scratch
+    finally:
+        scratch.dispose()
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+
+def _rows(registry):
+    with registry.connect() as conn:
+        return {row.port: (row.statut, row.stack_name) for row in conn.execute(
+            text("SELECT port, statut, stack_name FROM port_allocations"))}
+
+
+def test_concurrent_reservations_get_distinct_ports(registry):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        ports = list(pool.map(lambda i: reserve_port(None, f'client_{i}', base_port=9000), range(24)))
+
+    assert sorted(ports) == list(range(9000, 9024))
+
+
+def test_same_stack_keeps_its_port(registry):
+    first = reserve_port(None, 'client_1', base_port=9000)
+    confirm_port(first)
+    second = reserve_port(None, 'client_1', base_port=9000)
+
+    assert second == first
+    assert _rows(registry) == {first: ('attribue', 'client_1')}
+
+
+def test_range_is_not_exceeded(registry):
+    reserve_port(None, 'client_1', base_port=9000, range_size=2)
+    reserve_port(None, 'client_2', base_port=9000, range_size=2)
+    with pytest.raises(RuntimeError, match='Plage de ports épuisée'):
+        reserve_port(None, 'client_3', base_port=9000, range_size=2)
+
+
+def test_port_confirmed_during_reconciliation_is_kept(registry):
+    old = reserve_port(None, 'client_supprime', base_port=9000)
+    confirm_port(old)
+    time.sleep(0.01)
+    started = database_time()  # lecture de Portainer : client_nouveau n'existe pas encore
+    time.sleep(0.01)
+    new = reserve_port(None, 'client_nouveau', base_port=9000)
+    confirm_port(new)
+
+    result = apply_reconciliation([], [], base_port=9000, started=started)
+
+    assert result == {'externes': 0, 'liberes': 1}
+    assert _rows(registry) == {old: ('libre', None), new: ('attribue', 'client_nouveau')}
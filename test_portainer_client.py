@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests du client Portainer asynchrone contre le faux serveur local
+"""
+import asyncio
+from fake_portainer import FakePortainer
+from portainer_client import PortainerClient, create_client_stack_api, find_client_stack, wait_stack_healthy
+
+
+def _run(fake, *calls):
+    """Exécute des créations de stacks avec un client partagé"""
+    async def scenario():
+        client = PortainerClient(url=fake.url, username='admin', password='secret', endpoint_id=2)
+        try:
+            return [await create_client_stack_api(*args, client=client) for args in calls]
+        finally:
+            await client.close()
+    return asyncio.run(scenario())
+
+
+def test_create_stack_uses_first_free_port():
+    with FakePortainer() as fake:
+        fake.add_stack('client_1', app_port=8080)
+        fake.add_stack('client_2', app_port=8082)
+        fake.add_container(8081)
+
+        [(success, message, port)] = _run(fake, (3, 'dupont', 'pg$pass', 'k' * 32, 'init'))
+
+        assert success, message
+        assert port == '8083'
+        created = fake.stacks[-1]
+        env = {variable['name']: variable['value'] for variable in created['Env']}
+        assert created['Name'] == 'client_3'
+        assert env['APP_PORT'] == '8083'
+        assert env['POSTGRES_PASSWORD'] == 'pg$$pass'  # échappement Docker Compose
+        assert env['INITIAL_USERNAME'] == 'dupont'
+
+
+def test_session_and_token_are_reused():
+    with FakePortainer() as fake:
+        results = _run(fake, *[(client_id, f'client{client_id}', 'pg', 'k' * 32, 'init') for client_id in range(1, 6)])
+
+        assert [port for _, _, port in results] == ['8080', '8081', '8082', '8083', '8084']
+        assert fake.auth_count == 1
+        assert fake.connection_count == 1
+
+
+def test_expired_token_is_renewed():
+    with FakePortainer() as fake:
+        async def scenario():
+            client = PortainerClient(url=fake.url, username='admin', password='secret')
+            try:
+                await client.list_stacks()
+                fake.expire_tokens()
+                return await client.list_stacks()
+            finally:
+                await client.close()
+
+        assert asyncio.run(scenario()) == []
+        assert fake.auth_count == 2
+
+
+def test_existing_stack_is_rejected():
+    with FakePortainer() as fake:
+        fake.add_stack('client_7', app_port=8080)
+
+        [(success, message, port)] = _run(fake, (7, 'martin', 'pg', 'k' * 32, 'init'))
+
+        assert not success
+        assert port is None
+        assert len(fake.stacks) == 1
+
+
+def test_bad_credentials():
+    with FakePortainer(password='autre') as fake:
+        [(success, message, port)] = _run(fake, (1, 'durand', 'pg', 'k' * 32, 'init'))
+
+        assert not success
+        assert "authentifier" in message
+
+
+def test_missing_password_is_reported():
+    with FakePortainer() as fake:
+        async def scenario():
+            client = PortainerClient(url=fake.url, username='admin', password='', endpoint_id=2)
+            try:
+                return await create_client_stack_api(1, 'durand', 'pg', 'k' * 32, 'init', client=client)
+            finally:
+                await client.close()
+
+        success, message, port = asyncio.run(scenario())
+        assert not success
+        assert "PORTAINER_PASSWORD" in message
+        assert fake.auth_count == 0
+
+
+def _with_client(fake, call):
+    async def scenario():
+        client = PortainerClient(url=fake.url, username='admin', password='secret', endpoint_id=2)
+        try:
+            return await call(client)
+        finally:
+            await client.close()
+    return asyncio.run(scenario())
+
+
+def test_stack_of_interrupted_attempt_is_found():
+    with FakePortainer() as fake:
+        _with_client(fake, lambda client: create_client_stack_api(
+            5, 'dupont', 'pg', 'k' * 32, 'init$1', client=client, app_port=8090))
+        fake.add_stack('client_6', app_port=8091)  # stack plus ancienne du client 6
+
+        assert _with_client(fake, lambda client: find_client_stack(5, 'init$1', client=client)) == ('1', '8090')
+        assert _with_client(fake, lambda client: find_client_stack(6, 'init$1', client=client)) is None
+        assert _with_client(fake, lambda client: find_client_stack(7, 'init$1', client=client)) is None
+
+
+def test_wait_until_stack_is_healthy():
+    with FakePortainer(startup_delay=0.3) as fake:
+        _run(fake, (5, 'dupont', 'pg', 'k' * 32, 'init'))
+
+        assert not _with_client(fake, lambda client: wait_stack_healthy(
+            'client_5', timeout=0.05, interval=0.01, client=client))
+        assert _with_client(fake, lambda client: wait_stack_healthy(
+            'client_5', timeout=5, interval=0.05, client=client))
+        assert not _with_client(fake, lambda client: wait_stack_healthy(
+            'client_9', timeout=0.05, interval=0.01, client=client))
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Tests de l'affichage de la progression : suppression des pictogrammes et
+regroupement des rafales de messages
+"""
+from progress_widget import ProgressRing, strip_icons
+
+
+def test_icons_are_stripped():
+    assert strip_icons('✅ Compte client créé') == 'Compte client créé'
+    assert strip_icons('⚠️ Registre indisponible') == 'Registre indisponible'
+    assert strip_icons('📧 Envoi de l\'email...') == 'Envoi de l\'email...'
+    assert strip_icons('⏳ Création de votre instance') == 'Création de votre instance'
+    assert strip_icons('Port 8080 attribué à « dupont »') == 'Port 8080 attribué à « dupont »'
+
+
+def test_bursts_are_coalesced_into_one_frame():
+    ring = ProgressRing(size=3)
+    assert ring.take() is None
+
+    for i in range(10):
+        ring.push(f'🔍 Message {i}')
+
+    assert ring.take() == ['Message 7', 'Message 8', 'Message 9']
+    assert ring.take() is None  # rien de nouveau : pas d'envoi
+    assert (ring.received, ring.frames) == (10, 1)
+
+    ring = ProgressRing(size=3)
+    ring.push('Seul message')
+    assert ring.take() == ['Seul message', '', '']
+    assert ring.latest == 'Seul message'
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Tests de la file des provisionnements : un job refusé faute de place reste
+en attente en base et est soumis dès qu'un worker se libère, un job en échec
+est retenté, un job interrompu reprend à sa dernière étape terminée sans
+recréer sa stack ni renvoyer l'email de bienvenue
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import database_config
+import mail_queue
+import portainer_client
+import provisioning
+from database_config import Base
+from fake_portainer import FakePortainer
+from fake_smtp import FakeSMTP
+from mail_queue import MailSender, SMTPConnection
+from models import Client, OutboundEmail, ProvisioningJob
+from portainer_client import PortainerClient
+from provisioning import STEPS, ProvisioningQueue, ProvisioningQueueFull, claim_job, load_job
+
+
+def test_refused_job_is_submitted_when_a_slot_frees(monkeypatch):
+    waiting = {}  # jobs 'en_attente' en base
+    monkeypatch.setattr(provisioning, 'claim_job', lambda job_id, *args: 1)
+    monkeypatch.setattr(provisioning, 'update_job', lambda job_id, **fields: waiting.pop(job_id, None))
+    monkeypatch.setattr(provisioning, 'resumable_jobs', lambda waiting_only=False: sorted(waiting.items()))
+
+    async def scenario():
+        release = asyncio.Event()
+        ran = []
+
+        async def runner(job_id, params, progress):
+            await release.wait()
+            ran.append(job_id)
+            return {'success': True, 'message': 'ok'}
+
+        queue = ProvisioningQueue(runner, max_workers=1, max_pending=1)
+        queue.start()
+        for job_id in (1, 2, 3):
+            waiting[job_id] = {'plan': 'essai'}
+        queue.submit(1, waiting[1])
+        await asyncio.sleep(0)  # le worker prend le job 1
+        queue.submit(2, waiting[2])
+        assert queue.full()
+        try:
+            queue.submit(3, waiting[3])
+        except ProvisioningQueueFull:
+            pass
+        else:
+            raise AssertionError("job accepté dans une file pleine")
+
+        release.set()
+        for _ in range(50):
+            if len(ran) == 3:
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return ran
+
+    assert asyncio.run(scenario()) == [1, 2, 3]
+
+
+def test_failed_job_is_retried_with_backoff(monkeypatch):
+    attempts = {}
+    finished = []
+    monkeypatch.setattr(provisioning, 'claim_job', lambda job_id, *args: attempts.get(job_id, 0) + 1)
+    monkeypatch.setattr(provisioning, 'update_job', lambda job_id, **fields: finished.append(fields))
+
+    async def scenario():
+        async def runner(job_id, params, progress):
+            attempts[job_id] = attempts.get(job_id, 0) + 1
+            return {'success': attempts[job_id] == 2, 'message': 'ok'}
+
+        queue = ProvisioningQueue(runner, max_workers=1, retry_base=0.01)
+        queue.start()
+        queue.submit(1, {'plan': 'essai'})
+        for _ in range(50):
+            if len(finished) == 2:
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert attempts == {1: 2}
+    assert [fields['statut'] for fields in finished] == ['echec', 'termine']
+    assert finished[0]['prochaine_tentative'] > datetime.utcnow() - timedelta(seconds=1)
+    assert 'prochaine_tentative' not in finished[1]
+
+
+# --- Jobs en base ------------------------------------------------------------
+# Base SQLite à la place de PostgreSQL (session_scope de database_config) ; dans
+# un fichier pour que chaque thread ait sa propre connexion et ses transactions
+
+@pytest.fixture
+def jobs_db(monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(database_config, 'SessionLocal', factory)
+    yield factory
+    engine.dispose()
+
+
+def _create_job(factory, **fields):
+    with factory() as db:
+        client = Client(nom='Dupont', prenom='Jean', email='jean@example.com', entreprise='Dupont SARL')
+        db.add(client)
+        db.flush()
+        job = ProvisioningJob(client_id=client.id, plan='essai', **fields)
+        db.add(job)
+        db.commit()
+        return job.id, {'client_id': client.id, 'prenom': 'Jean', 'email': client.email, 'plan': 'essai'}
+
+
+def test_claim_is_exclusive_until_the_lease_expires(jobs_db):
+    job_id, _ = _create_job(jobs_db, statut='en_attente', etape=STEPS[0], tentatives=0)
+
+    assert claim_job(job_id, 'worker-a', lease=60) == 1
+    assert claim_job(job_id, 'worker-b', lease=60) is None
+
+    with jobs_db() as db:
+        db.get(ProvisioningJob, job_id).lease_until = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+    assert claim_job(job_id, 'worker-b', lease=60) == 2
+    with jobs_db() as db:
+        assert db.get(ProvisioningJob, job_id).owner == 'worker-b'
+
+
+@pytest.mark.parametrize('etape', ['port_reserved', 'stack_created', 'healthy'])
+def test_interrupted_job_resumes_from_its_last_step(site, jobs_db, monkeypatch, etape):
+    """Le site s'arrête juste avant d'enregistrer l'étape suivant etape : la reprise
+    continue à partir d'etape sans recréer la stack ni remettre l'email en file"""
+    next_step = STEPS[STEPS.index(etape) + 1]
+    crashes = []
+    complete_step = site.complete_step
+
+    def interrupted(job_id, step, db=None, **fields):
+        if step == next_step and not crashes:
+            crashes.append(step)
+            raise ConnectionError('arrêt du site')
+        return complete_step(job_id, step, db=db, **fields)
+
+    job_id, params = _create_job(jobs_db, statut='en_attente', etape=STEPS[0], tentatives=0)
+    monkeypatch.setattr(site, 'complete_step', interrupted)
+    monkeypatch.setattr(site, 'reserve_port', lambda client_id, stack_name: 9100)
+    monkeypatch.setattr(site, 'confirm_port', lambda port: None)
+    monkeypatch.setattr(site, 'PORTAINER_BACKEND', 'api')
+    monkeypatch.setattr(mail_queue, 'SMTP_PASSWORD', 'secret')
+
+    with FakePortainer() as fake, FakeSMTP(username='erp', password='secret') as smtp:
+        async def scenario():
+            monkeypatch.setattr(portainer_client, '_client', PortainerClient(
+                url=fake.url, username=fake.username, password=fake.password, endpoint_id=2))
+            results = []
+            queue = ProvisioningQueue(site.provision_client, max_workers=1, retry_base=0.01)
+            queue.start()
+
+            def on_done(result):
+                # Étape enregistrée à la fin de la tentative interrompue
+                results.append((result['success'], load_job(job_id)['etape']))
+
+            queue.subscribe(job_id, on_done=on_done)
+            queue.submit(job_id, params)
+            for _ in range(200):
+                with jobs_db() as db:
+                    if db.get(ProvisioningJob, job_id).statut == 'termine':
+                        break
+                await asyncio.sleep(0.02)
+            await queue.stop()
+            await portainer_client.close_portainer_client()
+            return results
+
+        results = asyncio.run(scenario())
+        sender = MailSender(session_factory=jobs_db, connection=SMTPConnection(
+            server=smtp.host, port=smtp.port, user=smtp.username, password=smtp.password, starttls=False))
+        sender.process_due()
+        sender.connection.close()
+
+        assert crashes == [next_step]
+        assert results == [(False, etape)]
+        assert [stack['Name'] for stack in fake.stacks] == [f"client_{params['client_id']}"]
+        assert len(smtp.messages) == 1
+    with jobs_db() as db:
+        assert db.query(OutboundEmail).count() == 1
+        job = db.get(ProvisioningJob, job_id)
+        assert (job.statut, job.etape, job.tentatives) == ('termine', STEPS[-1], 2)
+        assert job.identifiants is None
+        assert job.owner is not None and job.lease_until is None
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests des événements de progression : analyse de la sortie du script,
+lecture au fil de l'eau et événements du client Portainer natif
+"""
+import asyncio
+import time
+from fake_portainer import FakePortainer
+from portainer_client import PortainerClient, create_client_stack_api
+from provisioning_events import (
+    ERROR, PORT_ASSIGNED, STACK_CREATED, STEP, ProgressTracker, parse_script_line, stream_script,
+)
+
+
+def test_script_lines_are_parsed():
+    step = parse_script_line("[1/4] Authentification a Portainer...")
+    assert (step.kind, step.data) == (STEP, {'step': 1, 'total': 4})
+    assert parse_script_line("Port application attribue: 8083").data == {'port': '8083'}
+    assert parse_script_line("Stack creee avec succes (ID: 12)").kind == STACK_CREATED
+    assert parse_script_line("Erreur: Impossible de creer la stack").message == "Impossible de creer la stack"
+    assert parse_script_line("  Mot de passe      : s3cret") is None
+
+
+def test_events_are_emitted_before_the_script_exits():
+    script = (
+        'echo "[1/4] Authentification a Portainer..."; sleep 0.4; '
+        'echo "Port application attribue: 8085"; echo "  Mot de passe : s3cret"; sleep 0.3'
+    )
+    events = []
+
+    async def scenario():
+        returncode, lines = await stream_script(['bash', '-c', script], events.append)
+        return returncode, lines, time.perf_counter()
+
+    tracker = ProgressTracker()
+    returncode, lines, finished = asyncio.run(scenario())
+    for event in events:
+        tracker.record(event)
+
+    assert returncode == 0
+    assert [event.kind for event in events] == [STEP, PORT_ASSIGNED]
+    assert finished - events[0].at > 0.5  # reçu pendant l'exécution, pas à la fin
+    assert len(lines) == 3
+    assert set(tracker.timings()) == {'step_1', PORT_ASSIGNED}
+
+
+def test_api_backend_emits_the_same_events():
+    events = []
+
+    async def scenario():
+        client = PortainerClient(url=fake.url, username='admin', password='secret', endpoint_id=2)
+        try:
+            return await create_client_stack_api(1, 'dupont', 'pg', 'k' * 32, 'init',
+                                                 progress_callback=events.append, client=client)
+        finally:
+            await client.close()
+
+    with FakePortainer() as fake:
+        success, message, port = asyncio.run(scenario())
+
+    assert success, message
+    kinds = [event.kind for event in events]
+    assert kinds == [STEP, STEP, PORT_ASSIGNED, STEP, STACK_CREATED]
+    assert events[2].data['port'] == port
+    assert ERROR not in kinds
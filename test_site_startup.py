@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests du démarrage du site : une base indisponible au démarrage est réessayée
+et la file des provisionnements s'ouvre une fois la base prête
+"""
+import asyncio
+
+from provisioning import ProvisioningQueue
+
+
+class _Reconciler:
+    def start(self):
+        pass
+
+    async def wait_reconciled(self):
+        pass
+
+
+def test_database_init_is_retried_until_ready(site, monkeypatch):
+    attempts = []
+
+    def ensure_schema(timer=None):
+        attempts.append(timer)
+        if len(attempts) == 1:
+            raise ConnectionError('connection refused')
+        return True
+
+    async def resume():
+        return 0
+
+    queue = ProvisioningQueue(runner=None)
+    monkeypatch.setattr(queue, 'resume', resume)
+    monkeypatch.setattr(site, 'ensure_schema', ensure_schema)
+    monkeypatch.setattr(site, 'provisioning_queue', queue)
+    monkeypatch.setattr(site, 'port_reconciler', _Reconciler())
+    monkeypatch.setattr(site, 'db_status', {'ready': False, 'schema_updated': None, 'error': None})
+    monkeypatch.setattr(site, 'DB_INIT_RETRY', 0.01)
+
+    async def scenario():
+        queue.start(paused=True)
+        try:
+            await asyncio.wait_for(site.init_database(), timeout=5)
+            return queue.stats()['open']
+        finally:
+            await queue.stop()
+
+    assert asyncio.run(scenario())
+    assert len(attempts) == 2
+    assert site.db_status == {'ready': True, 'schema_updated': True, 'error': None}
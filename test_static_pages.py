@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Tests du rendu statique des pages vitrine
+"""
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from site_content import FEATURES, PLANS
+import static_pages
+from static_pages import render_all, serve_static_pages
+
+
+def test_pages_contain_shared_content():
+    pages = render_all()
+
+    assert set(pages) == {'/', '/fonctionnalites', '/tarifs', '/contact'}
+    features = pages['/fonctionnalites'].body.decode()
+    assert all(feature['title'].replace('&', '&amp;') in features for feature in FEATURES)
+    pricing = pages['/tarifs'].body.decode()
+    assert all(plan['price'] in pricing and f'href="{plan["target"]}"' in pricing for plan in PLANS)
+
+
+def test_etag_and_cache_headers():
+    app = FastAPI()
+    serve_static_pages(app)
+    client = TestClient(app)
+
+    response = client.get('/tarifs')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/html')
+    assert 'max-age=' in response.headers['cache-control']
+
+    cached = client.get('/tarifs', headers={'If-None-Match': response.headers['etag']})
+    assert cached.status_code == 304
+    assert cached.content == b''
+
+
+def test_failed_page_is_logged_and_left_out(monkeypatch, caplog):
+    def broken():
+        raise KeyError('price')
+
+    monkeypatch.setitem(static_pages.RENDERERS, '/tarifs', broken)
+    with caplog.at_level(logging.ERROR, logger='static_pages'):
+        pages = serve_static_pages(FastAPI())
+
+    assert set(pages) == {'/', '/fonctionnalites', '/contact'}
+    assert '/tarifs' in caplog.text
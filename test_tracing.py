@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests des traces : imbrication des spans, propagation de l'identifiant de
+trace (threads, sous-processus, en-têtes HTTP) et frise chronologique
+"""
+import asyncio
+import sys
+
+import tracing
+from provisioning_events import stream_script
+from tracing import group_traces, inject_headers, load_spans, parse_traceparent, render_timeline, span, subprocess_env
+
+
+def test_spans_are_nested_and_exported(tmp_path, monkeypatch):
+    path = tmp_path / 'traces.jsonl'
+    monkeypatch.setattr(tracing, 'TRACE_FILE', str(path))
+
+    def update_job():
+        with span('db.update_job'):
+            pass
+
+    async def provision():
+        with span('provisionnement', job_id=1) as root:
+            await asyncio.to_thread(update_job)
+            with span('stack.creation'):
+                with span('portainer POST /api/stacks'):
+                    pass
+            try:
+                with span('email.mise_en_file'):
+                    raise RuntimeError('SMTP indisponible')
+            except RuntimeError:
+                pass
+        return root
+
+    root = asyncio.run(provision())
+    by_name = {item['name']: item for item in load_spans(path)}
+
+    assert set(by_name) == {'provisionnement', 'db.update_job', 'stack.creation',
+                            'portainer POST /api/stacks', 'email.mise_en_file'}
+    assert {item['traceId'] for item in by_name.values()} == {root.trace_id}
+    assert by_name['provisionnement']['parentSpanId'] == ''
+    assert by_name['db.update_job']['parentSpanId'] == root.span_id
+    assert by_name['stack.creation']['parentSpanId'] == root.span_id
+    assert by_name['portainer POST /api/stacks']['parentSpanId'] == by_name['stack.creation']['spanId']
+    assert by_name['email.mise_en_file']['status'] == 'error'
+    assert by_name['email.mise_en_file']['attributes']['error'] == 'SMTP indisponible'
+    assert tracing.current_span() is None
+
+
+def test_trace_id_is_propagated(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACE_FILE', str(tmp_path / 'traces.jsonl'))
+    assert inject_headers({'Accept': 'json'}) == {'Accept': 'json'}
+    assert subprocess_env() == {}
+
+    with span('stack.creation') as current:
+        assert parse_traceparent(inject_headers()['traceparent']) == (current.trace_id, current.span_id)
+        env = subprocess_env()
+        script = [sys.executable, '-c', 'import os; print("Erreur : " + os.environ["TRACEPARENT"])']
+        events = []
+        returncode, _ = asyncio.run(stream_script(script, events.append, timeout=10, env=env))
+
+    assert returncode == 0
+    assert events[0].message == current.traceparent
+    assert env['TRACE_FILE'] == str(tmp_path / 'traces.jsonl')
+
+    # Traitement différé rattaché explicitement à la trace
+    with span('smtp.envoi', traceparent=current.traceparent) as later:
+        pass
+    assert (later.trace_id, later.parent_id) == (current.trace_id, current.span_id)
+
+
+def test_timeline(tmp_path, monkeypatch):
+    path = tmp_path / 'traces.jsonl'
+    monkeypatch.setattr(tracing, 'TRACE_FILE', str(path))
+    with span('provisionnement'):
+        with span('port.reservation'):
+            pass
+        with span('stack.creation'):
+            pass
+
+    (items,) = group_traces(load_spans(path)).values()
+    lines = render_timeline(items, width=20).splitlines()
+
+    assert lines[0].endswith('3 spans')
+    assert [line.rsplit('| ', 1)[1] for line in lines[1:]] == [
+        'provisionnement', '  port.reservation', '  stack.creation']
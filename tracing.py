@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Traces des provisionnements
+
+Chaque provisionnement forme une trace de spans imbriqués (écritures en base,
+registre des ports, appels Portainer, script, email). Le span courant suit le
+contexte d'exécution (contextvars) : il est hérité par les tâches asyncio et
+par asyncio.to_thread. L'identifiant de trace est transmis au format W3C
+Trace Context :
+- au script create-client-stack.sh par la variable d'environnement TRACEPARENT
+  (le script écrit alors ses propres étapes dans le même fichier)
+- à Portainer par l'en-tête HTTP traceparent
+- au site lui-même par TRACEPARENT (les traces deviennent enfants de l'appelant)
+
+Les spans terminés sont ajoutés au fichier TRACE_FILE, une ligne JSON par span
+avec les noms de champs OTLP (traceId, spanId, parentSpanId, startTimeUnixNano...).
+Sans TRACE_FILE, les spans sont mesurés mais pas exportés.
+
+    with span('portainer.creation_stack', client_id=12) as current:
+        ...
+
+Lecture du fichier :
+    python tracing.py list                       traces, les plus lentes d'abord
+    python tracing.py show [trace_id]            frise chronologique (la plus lente par défaut)
+    python tracing.py chrome [trace_id] > t.json export pour Perfetto / chrome://tracing
+"""
+import argparse
+import contextvars
+import json
+import logging
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+TRACE_SERVICE = os.getenv('TRACE_SERVICE', 'site_commercial')
+# Durée (ms) au-delà de laquelle un provisionnement est signalé dans les logs avec sa trace
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '60000'))
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+_current = contextvars.ContextVar('current_span', default=None)
+_write_lock = threading.Lock()
+
+
+def parse_traceparent(value):
+    """'00-<trace_id>-<span_id>-01' -> (trace_id, span_id), None si absent ou invalide"""
+    match = _TRACEPARENT_RE.match((value or '').strip().lower())
+    return (match[1], match[2]) if match else None
+
+
+# Trace appelante éventuelle du processus (variable d'environnement)
+_PARENT = parse_traceparent(os.getenv('TRACEPARENT'))
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.status = 'ok'
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'service': TRACE_SERVICE,
+            'attributes': self.attributes,
+            'status': self.status,
+        }
+
+
+def current_span():
+    return _current.get()
+
+
+@contextmanager
+def span(name, traceparent=None, **attributes):
+    """
+    Mesure un bloc de code ; enfant du span courant, ou début d'une nouvelle trace
+
+    traceparent rattache explicitement le span à une trace, par exemple pour un
+    traitement différé (email envoyé après la fin du provisionnement). Une
+    exception qui traverse le bloc marque le span en erreur et est propagée.
+    """
+    parent = _current.get()
+    explicit = parse_traceparent(traceparent)
+    if explicit is not None:
+        trace_id, parent_id = explicit
+    elif parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    elif _PARENT is not None:
+        trace_id, parent_id = _PARENT
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+
+    current = Span(name, trace_id, parent_id, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = 'error'
+        current.attributes['error'] = str(e) or type(e).__name__
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current.reset(token)
+        export(current)
+
+
+def export(finished, path=None):
+    """Ajoute un span terminé au fichier de traces"""
+    path = path or TRACE_FILE
+    if not path:
+        return
+    line = json.dumps(finished.to_dict(), ensure_ascii=False, default=str) + '\n'
+    try:
+        with _write_lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(line)
+    except OSError as e:
+        logger.warning("⚠️ Écriture de la trace impossible (%s) : %s", path, e)
+
+
+def inject_headers(headers=None):
+    """En-têtes HTTP complétés du traceparent du span courant"""
+    headers = dict(headers or {})
+    current = _current.get()
+    if current is not None:
+        headers['traceparent'] = current.traceparent
+    return headers
+
+
+def subprocess_env():
+    """Variables d'environnement transmettant la trace courante à un sous-processus"""
+    current = _current.get()
+    if current is None:
+        return {}
+    env = {'TRACEPARENT': current.traceparent}
+    if TRACE_FILE:
+        env['TRACE_FILE'] = os.path.abspath(TRACE_FILE)
+    return env
+
+
+# --- Lecture et affichage ----------------------------------------------------
+
+def load_spans(path):
+    spans = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    continue  # ligne tronquée (processus arrêté pendant l'écriture)
+    return spans
+
+
+def group_traces(spans):
+    """{trace_id: [spans triés par début]}"""
+    traces = {}
+    for item in spans:
+        traces.setdefault(item['traceId'], []).append(item)
+    for items in traces.values():
+        items.sort(key=lambda item: item['startTimeUnixNano'])
+    return traces
+
+
+def trace_bounds(items):
+    return min(item['startTimeUnixNano'] for item in items), max(item['endTimeUnixNano'] for item in items)
+
+
+def trace_duration_ms(items):
+    start, end = trace_bounds(items)
+    return (end - start) / 1e6
+
+
+def _depths(items):
+    by_id = {item['spanId']: item for item in items}
+    depths = {}
+
+    def depth(item):
+        if item['spanId'] not in depths:
+            parent = by_id.get(item.get('parentSpanId'))
+            depths[item['spanId']] = 0 if parent is None else depth(parent) + 1
+        return depths[item['spanId']]
+
+    for item in items:
+        depth(item)
+    return depths
+
+
+def _tree_order(items):
+    """Spans dans l'ordre de l'arbre : chaque parent suivi de ses enfants"""
+    ids = {item['spanId'] for item in items}
+    children = {}
+    for item in items:
+        parent = item.get('parentSpanId') if item.get('parentSpanId') in ids else None
+        children.setdefault(parent, []).append(item)
+    ordered = []
+
+    def walk(parent):
+        for item in children.get(parent, []):
+            ordered.append(item)
+            walk(item['spanId'])
+
+    walk(None)
+    return ordered
+
+
+def render_timeline(items, width=50):
+    """Frise chronologique d'une trace : une ligne par span, barre positionnée dans le temps"""
+    start, end = trace_bounds(items)
+    total = max(end - start, 1)
+    depths = _depths(items)
+    lines = [f"trace {items[0]['traceId']}  {total / 1e6:.1f} ms  {len(items)} spans"]
+    for item in _tree_order(items):
+        offset = item['startTimeUnixNano'] - start
+        duration = item['endTimeUnixNano'] - item['startTimeUnixNano']
+        left = int(offset / total * width)
+        size = max(1, round(duration / total * width))
+        bar = ' ' * left + '█' * min(size, width - left)
+        marker = ' ❌' if item.get('status') == 'error' else ''
+        label = '  ' * depths[item['spanId']] + item['name']
+        lines.append(f"{offset / 1e6:9.1f} {duration / 1e6:9.1f} ms |{bar:<{width}}| {label}{marker}")
+    return '\n'.join(lines)
+
+
+def chrome_trace(traces):
+    """Format Trace Event (Perfetto, chrome://tracing) : une ligne par trace"""
+    events = []
+    for index, (trace_id, items) in enumerate(traces.items(), start=1):
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': index, 'args': {'name': trace_id}})
+        for item in items:
+            events.append({
+                'name': item['name'],
+                'cat': item.get('service', ''),
+                'ph': 'X',
+                'pid': 1,
+                'tid': index,
+                'ts': item['startTimeUnixNano'] / 1000,
+                'dur': (item['endTimeUnixNano'] - item['startTimeUnixNano']) / 1000,
+                'args': {**item.get('attributes', {}), 'status': item.get('status')},
+            })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def _select(traces, trace_id):
+    if trace_id:
+        matches = {key: items for key, items in traces.items() if key.startswith(trace_id)}
+        if not matches:
+            sys.exit(f"❌ Trace {trace_id} introuvable")
+        return matches
+    slowest = max(traces, key=lambda key: trace_duration_ms(traces[key]))
+    return {slowest: traces[slowest]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['list', 'show', 'chrome'])
+    parser.add_argument('trace_id', nargs='?', help="identifiant (ou début) de la trace")
+    parser.add_argument('--file', default=TRACE_FILE or 'traces.jsonl', help="fichier de traces (défaut : TRACE_FILE)")
+    parser.add_argument('-n', type=int, default=20, help="nombre de traces listées")
+    args = parser.parse_args()
+
+    traces = group_traces(load_spans(args.file))
+    if not traces:
+        sys.exit(f"Aucune trace dans {args.file}")
+
+    if args.command == 'list':
+        ordered = sorted(traces.items(), key=lambda pair: trace_duration_ms(pair[1]), reverse=True)
+        for trace_id, items in ordered[:args.n]:
+            root = items[0]
+            attributes = ' '.join(f"{key}={value}" for key, value in root.get('attributes', {}).items())
+            print(f"{trace_id}  {trace_duration_ms(items):10.1f} ms  {root['name']} {attributes}")
+    elif args.command == 'show':
+        for items in _select(traces, args.trace_id).values():
+            print(render_timeline(items))
+    else:
+        selected = _select(traces, args.trace_id) if args.trace_id else traces
+        json.dump(chrome_trace(selected), sys.stdout)
+
+
+if __name__ == '__main__':
+    main()